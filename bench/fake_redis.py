@@ -0,0 +1,35 @@
+"""
+fakeredisのTCPサーバーをRedisの代替として起動する（requirements-dev.txt）
+
+    python -m bench.fake_redis --port 6379
+
+本物のRedisがない環境でも bench.run --redis-port で共有状態のRedis実装を測定できるようにする。
+実際のRedisでの動作を確認する場合は bench.run --redis-url を使う。
+"""
+import argparse
+import threading
+import redis
+from redis.lock import Lock
+from fakeredis import TcpFakeServer
+
+
+def preload_lock_scripts(host: str, port: int) -> None:
+    """
+    fakeredisのTCPサーバーはEVALSHAにNOSCRIPTを返した後に接続を閉じてしまうため、
+    redis-pyのLockが使うスクリプトを先に登録しておく
+    """
+    with redis.Redis(host=host, port=port) as client:
+        for script in (Lock.LUA_RELEASE_SCRIPT, Lock.LUA_EXTEND_SCRIPT, Lock.LUA_REACQUIRE_SCRIPT):
+            client.script_load(script)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    with TcpFakeServer((args.host, args.port)) as server:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        preload_lock_scripts(args.host, args.port)
+        thread.join()
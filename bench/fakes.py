@@ -0,0 +1,386 @@
+"""
+Slack Web API・OpenAI Chat Completions・Google Sheets APIのローカル代替サーバー
+
+    python -m bench.fakes --port 9000 --openai-latency 0.8 --error-rate 0.01
+
+レイテンシ・エラー率・レート制限は上流ごとに指定できる。
+ベンチマーク用に /__bench__/posts で各スレッドへの最終投稿時刻を返す。
+Socket Modeの接続（apps.connections.open → /__socket__）も受け付け、
+/__bench__/socket/events に送ったペイロードをエンベロープにして接続中のクライアントへ配信する。
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from aiohttp import WSMsgType, web
+
+
+class Upstream:
+    def __init__(self, latency: float, jitter: float, error_rate: float, per_minute: Optional[float], seed: int):
+        """上流1つ分のレイテンシ・エラー・レート制限の設定"""
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.per_minute = per_minute
+        self.random = random.Random(seed)
+        self.window_started = time.monotonic()
+        self.window_count = 0
+
+    async def delay(self) -> None:
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+
+    def should_fail(self) -> bool:
+        return self.random.random() < self.error_rate
+
+    def retry_after(self) -> Optional[float]:
+        """1分単位の固定ウィンドウでレート制限を判定し、超過していれば待ち時間を返す"""
+        if not self.per_minute:
+            return None
+        now = time.monotonic()
+        if now - self.window_started >= 60:
+            self.window_started = now
+            self.window_count = 0
+        self.window_count += 1
+        if self.window_count > self.per_minute:
+            return max(1.0, 60 - (now - self.window_started))
+        return None
+
+
+class FakeServer:
+    def __init__(self, args: argparse.Namespace):
+        self.openai = Upstream(args.openai_latency, args.jitter, args.error_rate, args.openai_rpm, args.seed)
+        self.slack = Upstream(args.slack_latency, args.jitter, args.error_rate, args.slack_rpm, args.seed + 1)
+        self.sheets = Upstream(args.sheets_latency, args.jitter, args.error_rate, args.sheets_rpm, args.seed + 2)
+        self.token_delay = args.token_delay
+        self.completion_tokens = args.completion_tokens
+        # Slack
+        self.threads: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.message_threads: Dict[str, str] = {}
+        self.last_post_at: Dict[str, float] = {}
+        self.ts_counter = 0
+        # Socket Mode
+        self.sockets: List[web.WebSocketResponse] = []
+        self.socket_counter = 0
+        self.pending_acks: Dict[str, asyncio.Future] = {}
+        # Sheets（Activityシートのみ）
+        self.rows: List[List[str]] = []
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/token", self.token)
+        app.router.add_route("*", "/api/{method}", self.slack_api)
+        app.router.add_get("/v1/models", self.models)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_get("/v4/spreadsheets/{spreadsheet_id}/values/{range}", self.values_get)
+        app.router.add_put("/v4/spreadsheets/{spreadsheet_id}/values/{range}", self.values_update)
+        app.router.add_post("/v4/spreadsheets/{spreadsheet_id}/values/{range}:append", self.values_append)
+        app.router.add_post("/v4/spreadsheets/{spreadsheet_id}/values:batchUpdate", self.values_batch_update)
+        app.router.add_get("/__socket__", self.socket)
+        app.router.add_get("/__bench__/posts", self.bench_posts)
+        app.router.add_get("/__bench__/counts", self.bench_counts)
+        app.router.add_post("/__bench__/reset", self.bench_reset)
+        app.router.add_get("/__bench__/socket/connections", self.bench_socket_connections)
+        app.router.add_post("/__bench__/socket/events", self.bench_socket_event)
+        app.router.add_post("/__bench__/socket/disconnect", self.bench_socket_disconnect)
+        return app
+
+    # --- 共通 ---
+
+    async def _gate(self, name: str, upstream: Upstream) -> Optional[web.Response]:
+        """レイテンシを挟み、レート制限・エラーの場合はそのレスポンスを返す"""
+        self.counts[name] += 1
+        retry_after = upstream.retry_after()
+        if retry_after is not None:
+            self.counts[f"{name}:429"] += 1
+            return web.json_response(
+                {"ok": False, "error": "ratelimited"},
+                status=429,
+                headers={"Retry-After": str(int(retry_after))},
+            )
+        await upstream.delay()
+        if upstream.should_fail():
+            self.counts[f"{name}:500"] += 1
+            return web.json_response({"ok": False, "error": "internal_error"}, status=500)
+        return None
+
+    async def token(self, request: web.Request) -> web.Response:
+        return web.json_response({"access_token": "fake-token", "expires_in": 3600, "token_type": "Bearer"})
+
+    # --- Slack ---
+
+    async def slack_api(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        failure = await self._gate(f"slack:{method}", self.slack)
+        if failure:
+            return failure
+
+        params = dict(request.query)
+        if request.content_type == "application/json":
+            params.update(await request.json())
+        elif request.can_read_body:
+            params.update(await request.post())
+        if method == "apps.connections.open":
+            return web.json_response({"ok": True, "url": f"ws://{request.host}/__socket__"})
+        if method == "auth.test":
+            return web.json_response({"ok": True, "user_id": "UBOT", "team_id": "T0001"})
+        if method == "conversations.replies":
+            messages = self.threads.get(params.get("ts"), [])
+            oldest = params.get("oldest")
+            if oldest:
+                messages = [m for m in messages if float(m["ts"]) > float(oldest)]
+            return web.json_response({"ok": True, "messages": messages, "response_metadata": {"next_cursor": ""}})
+        if method == "chat.postMessage":
+            ts = self._next_ts()
+            thread_ts = params.get("thread_ts") or ts
+            self.threads[thread_ts].append({"ts": ts, "text": params.get("text", ""), "user": "UBOT"})
+            self.message_threads[ts] = thread_ts
+            self.last_post_at[thread_ts] = time.time()
+            return web.json_response({"ok": True, "ts": ts, "channel": params.get("channel")})
+        if method == "chat.update":
+            thread_ts = self.message_threads.get(params.get("ts"))
+            if thread_ts:
+                for message in self.threads[thread_ts]:
+                    if message["ts"] == params.get("ts"):
+                        message["text"] = params.get("text", "")
+                self.last_post_at[thread_ts] = time.time()
+            return web.json_response({"ok": True, "ts": params.get("ts")})
+        return web.json_response({"ok": False, "error": "unknown_method"})
+
+    async def socket(self, request: web.Request) -> web.WebSocketResponse:
+        """Socket ModeのWebSocket接続（クライアントからはエンベロープへの応答のみ届く）"""
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets.append(ws)
+        await ws.send_json({
+            "type": "hello",
+            "num_connections": len(self.sockets),
+            "debug_info": {"host": "bench", "approximate_connection_time": 3600},
+            "connection_info": {"app_id": "A0001"},
+        })
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                future = self.pending_acks.pop(json.loads(message.data).get("envelope_id"), None)
+                if future and not future.done():
+                    future.set_result(time.perf_counter())
+        finally:
+            self.sockets.remove(ws)
+        return ws
+
+    def _next_ts(self) -> str:
+        self.ts_counter += 1
+        return f"{int(time.time())}.{self.ts_counter:06d}"
+
+    # --- OpenAI ---
+
+    async def models(self, request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": "gpt-4o", "object": "model"}]})
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        failure = await self._gate("openai", self.openai)
+        if failure:
+            return failure
+
+        body = await request.json()
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 2
+        words = [f"token{i} " for i in range(self.completion_tokens)]
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": prompt_tokens + self.completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        created = int(time.time())
+        headers = {"x-ratelimit-remaining-requests": "10000", "x-ratelimit-remaining-tokens": "10000000"}
+
+        if not body.get("stream"):
+            await asyncio.sleep(self.token_delay * self.completion_tokens)
+            return web.json_response({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(words)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }, headers=headers)
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", **headers})
+        await response.prepare(request)
+        for word in words:
+            await asyncio.sleep(self.token_delay)
+            await response.write(self._sse({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body.get("model"),
+                "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+            }))
+        await response.write(self._sse({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": body.get("model"),
+            "choices": [],
+            "usage": usage,
+        }))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    @staticmethod
+    def _sse(data: Dict[str, Any]) -> bytes:
+        return f"data: {json.dumps(data)}\n\n".encode()
+
+    # --- Google Sheets ---
+
+    async def values_get(self, request: web.Request) -> web.Response:
+        failure = await self._gate("sheets:get", self.sheets)
+        if failure:
+            return failure
+        start, end, first_col, last_col = self._parse_range(request.match_info["range"])
+        end = min(end or len(self.rows), len(self.rows))
+        values = [row[first_col:last_col + 1] for row in self.rows[start - 1:end]]
+        while values and not values[-1]:
+            values.pop()
+        return web.json_response({"range": request.match_info["range"], "values": values})
+
+    async def values_update(self, request: web.Request) -> web.Response:
+        failure = await self._gate("sheets:update", self.sheets)
+        if failure:
+            return failure
+        body = await request.json()
+        self._write(request.match_info["range"], body.get("values", []))
+        return web.json_response({"updatedRange": request.match_info["range"]})
+
+    async def values_append(self, request: web.Request) -> web.Response:
+        """空でない最後の行の次から書き込み、書き込んだ範囲を返す（insertDataOption=INSERT_ROWS相当）"""
+        failure = await self._gate("sheets:append", self.sheets)
+        if failure:
+            return failure
+        body = await request.json()
+        values = body.get("values", [])
+        last_row = len(self.rows)
+        while last_row and not any(self.rows[last_row - 1]):
+            last_row -= 1
+        start = last_row + 1
+        self._write(f"A{start}", values)
+        updated_range = f"Activity!A{start}:E{start + len(values) - 1}"
+        return web.json_response({"updates": {"updatedRange": updated_range, "updatedRows": len(values)}})
+
+    async def values_batch_update(self, request: web.Request) -> web.Response:
+        failure = await self._gate("sheets:batchUpdate", self.sheets)
+        if failure:
+            return failure
+        body = await request.json()
+        for data in body.get("data", []):
+            self._write(data["range"], data.get("values", []))
+        return web.json_response({"totalUpdatedRows": len(body.get("data", []))})
+
+    def _write(self, a1_range: str, values: List[List[Any]]) -> None:
+        start, _, first_col, _ = self._parse_range(a1_range)
+        for offset, row in enumerate(values):
+            index = start - 1 + offset
+            while len(self.rows) <= index:
+                self.rows.append([])
+            current = self.rows[index]
+            while len(current) < first_col + len(row):
+                current.append("")
+            current[first_col:first_col + len(row)] = [str(v) for v in row]
+
+    @staticmethod
+    def _parse_range(a1_range: str):
+        """ "Activity!A5:E5" / "Activity!A:E" / "Activity!A3:A" を (開始行, 終了行, 開始列, 終了列) に変換"""
+        cells = a1_range.split("!", 1)[-1]
+        match = re.fullmatch(r"([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?", cells)
+        first_col, first_row, last_col, last_row = match.groups()
+        to_index = lambda col: ord(col[-1]) - ord("A")
+        return (
+            int(first_row) if first_row else 1,
+            int(last_row) if last_row else None,
+            to_index(first_col),
+            to_index(last_col or first_col),
+        )
+
+    # --- ベンチマーク用 ---
+
+    async def bench_posts(self, request: web.Request) -> web.Response:
+        return web.json_response(self.last_post_at)
+
+    async def bench_counts(self, request: web.Request) -> web.Response:
+        return web.json_response(self.counts)
+
+    async def bench_socket_connections(self, request: web.Request) -> web.Response:
+        return web.json_response({"connections": len(self.sockets)}, status=200 if self.sockets else 503)
+
+    async def bench_socket_event(self, request: web.Request) -> web.Response:
+        """ペイロードを接続のいずれかに配信し、エンベロープへの応答までの時間を返す"""
+        if not self.sockets:
+            return web.json_response({"ok": False, "error": "no_connections"}, status=503)
+        self.socket_counter += 1
+        envelope_id = f"envelope-{self.socket_counter:08d}"
+        ws = self.sockets[self.socket_counter % len(self.sockets)]
+        future = asyncio.get_running_loop().create_future()
+        self.pending_acks[envelope_id] = future
+        started = time.perf_counter()
+        await ws.send_json({
+            "envelope_id": envelope_id,
+            "type": "events_api",
+            "payload": await request.json(),
+            "accepts_response_payload": False,
+            "retry_attempt": 0,
+            "retry_reason": "",
+        })
+        try:
+            acked_at = await asyncio.wait_for(future, timeout=3.0)
+        except asyncio.TimeoutError:
+            self.pending_acks.pop(envelope_id, None)
+            return web.json_response({"ok": False, "error": "ack_timeout"}, status=504)
+        return web.json_response({"ok": True, "envelope_id": envelope_id, "ack_seconds": acked_at - started})
+
+    async def bench_socket_disconnect(self, request: web.Request) -> web.Response:
+        """Slackからの接続の張り替え要求を模す（クライアントは新しい接続を開き直す）"""
+        sockets = list(self.sockets)
+        for ws in sockets:
+            await ws.send_json({"type": "disconnect", "reason": "refresh_requested"})
+        return web.json_response({"ok": True, "disconnected": len(sockets)})
+
+    async def bench_reset(self, request: web.Request) -> web.Response:
+        self.last_post_at.clear()
+        self.counts.clear()
+        return web.json_response({"ok": True})
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--openai-latency", type=float, default=0.5, help="OpenAIの応答開始までの秒数")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="応答1トークンあたりの秒数")
+    parser.add_argument("--completion-tokens", type=int, default=100)
+    parser.add_argument("--slack-latency", type=float, default=0.05)
+    parser.add_argument("--sheets-latency", type=float, default=0.15)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-rpm", type=float, default=None)
+    parser.add_argument("--slack-rpm", type=float, default=None)
+    parser.add_argument("--sheets-rpm", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    add_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(FakeServer(args).app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+ローカルの代替サーバーに対してアプリケーションの負荷試験を行う
+
+    python -m bench.run --duration 30 --event-rate 5 --concurrency 20
+    python -m bench.run --baseline bench/results/before.json
+
+代替サーバー（bench.fakes）とアプリケーション（bench.serve）を子プロセスで起動し、
+/events には一定レートでイベントを送り、/gpt/ には一定の同時実行数でリクエストを送り続ける。
+--socket-mode を指定した場合はイベントを代替サーバー経由でSocket Modeの接続に配信する。
+結果はJSONで保存し、--baseline を指定した場合は差分を表示する。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from bench.fakes import add_arguments as add_fake_arguments
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "bench" / "results"
+BOT_USER_ID = "UBOT"
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """レイテンシ（秒）をミリ秒のパーセンタイルにまとめる"""
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+    }
+
+
+def write_credentials(directory: str, token_uri: str) -> str:
+    """代替サーバーのトークンエンドポイントを向いたサービスアカウントの認証情報を生成"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    path = os.path.join(directory, "credentials.json")
+    with open(path, "w") as f:
+        json.dump({
+            "type": "service_account",
+            "project_id": "bench",
+            "private_key_id": "bench",
+            "private_key": private_key,
+            "client_email": "bench@bench.iam.gserviceaccount.com",
+            "client_id": "0",
+            "token_uri": token_uri,
+        }, f)
+    return path
+
+
+async def wait_until_ready(client: httpx.AsyncClient, url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+
+class LoadGenerator:
+    def __init__(self, app_url: str, fake_url: str, args: argparse.Namespace):
+        self.app_url = app_url
+        self.fake_url = fake_url
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.prompts = [f"ベンチマーク用の質問 {i} について教えてください。" for i in range(args.prompt_pool)]
+        self.sequence = 0
+        self.sent_at: Dict[str, float] = {}
+        self.ack_latencies: List[float] = []
+        self.gpt_latencies: List[float] = []
+        self.statuses: Dict[str, int] = {}
+
+    def _next_event(self) -> Dict[str, Any]:
+        """スレッドの先頭へのapp_mentionイベントを生成（tsはイベントごとに一意）"""
+        self.sequence += 1
+        ts = f"{1700000000 + self.sequence}.000000"
+        user = f"U{self.random.randrange(self.args.users):05d}"
+        return {
+            "type": "event_callback",
+            "team_id": "T0001",
+            "event_id": f"Ev{self.sequence:08d}",
+            "authorizations": [{"team_id": "T0001", "user_id": BOT_USER_ID, "is_bot": True}],
+            "event": {
+                "type": "app_mention",
+                "user": user,
+                "text": f"<@{BOT_USER_ID}> {self.random.choice(self.prompts)}",
+                "ts": ts,
+                "channel": "C0001",
+                "channel_type": "channel",
+            },
+        }
+
+    async def _send_event(self, client: httpx.AsyncClient) -> None:
+        payload = self._next_event()
+        if self.args.socket_mode:
+            # 代替サーバーが計測したエンベロープの送信から応答までの時間
+            response = await client.post(f"{self.fake_url}/__bench__/socket/events", json=payload)
+            if response.status_code == 200:
+                self.ack_latencies.append(response.json()["ack_seconds"])
+        else:
+            started = time.perf_counter()
+            response = await client.post(f"{self.app_url}/events", json=payload)
+            self.ack_latencies.append(time.perf_counter() - started)
+        self.sent_at[payload["event"]["ts"]] = time.time()
+        self._count(f"events:{response.status_code}")
+
+    async def _send_gpt(self, client: httpx.AsyncClient) -> None:
+        started = time.perf_counter()
+        response = await client.get(f"{self.app_url}/gpt/", params={"prompt": self.random.choice(self.prompts)})
+        self.gpt_latencies.append(time.perf_counter() - started)
+        self._count(f"gpt:{response.status_code}")
+
+    def _count(self, key: str) -> None:
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    async def _gpt_worker(self, client: httpx.AsyncClient, deadline: float) -> None:
+        """応答を待ってから次を送るクローズドループで /gpt/ を呼び続ける"""
+        while time.monotonic() < deadline:
+            try:
+                await self._send_gpt(client)
+            except httpx.HTTPError as e:
+                self._count(f"error:{type(e).__name__}")
+
+    async def _event_producer(self, client: httpx.AsyncClient, deadline: float) -> None:
+        """Slackからの配信を模して、指定レートのポアソン到着でイベントを送る"""
+        tasks = []
+        while time.monotonic() < deadline:
+            tasks.append(asyncio.create_task(self._send_event_safely(client)))
+            await asyncio.sleep(self.random.expovariate(self.args.event_rate))
+        await asyncio.gather(*tasks)
+
+    async def _send_event_safely(self, client: httpx.AsyncClient) -> None:
+        try:
+            await self._send_event(client)
+        except httpx.HTTPError as e:
+            self._count(f"error:{type(e).__name__}")
+
+    async def run(self) -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=self.args.concurrency * 2)
+        async with httpx.AsyncClient(limits=limits, timeout=120.0) as client:
+            await client.post(f"{self.fake_url}/__bench__/reset")
+            await client.post(f"{self.app_url}/__bench__/reset")
+
+            started = time.monotonic()
+            deadline = started + self.args.duration
+            workers = [self._gpt_worker(client, deadline) for _ in range(self.args.concurrency)]
+            if self.args.event_rate > 0:
+                workers.append(self._event_producer(client, deadline))
+            await asyncio.gather(*workers)
+            elapsed = time.monotonic() - started
+
+            drained = await self._drain(client)
+            posts = (await client.get(f"{self.fake_url}/__bench__/posts")).json()
+            upstream_calls = (await client.get(f"{self.fake_url}/__bench__/counts")).json()
+            app_stats = (await client.get(f"{self.app_url}/__bench__/stats")).json()
+            queue_stats = (await client.get(f"{self.app_url}/events/stats")).json()
+
+        end_to_end = [posts[ts] - sent for ts, sent in self.sent_at.items() if ts in posts]
+        requests = len(self.ack_latencies) + len(self.gpt_latencies)
+        return {
+            "config": {key: value for key, value in vars(self.args).items() if key != "baseline"},
+            "elapsed_seconds": elapsed,
+            "drained": drained,
+            "throughput_rps": requests / elapsed if elapsed else 0.0,
+            "replies_per_second": len(end_to_end) / elapsed if elapsed else 0.0,
+            "event_ack": summarize(self.ack_latencies),
+            "event_end_to_end": summarize(end_to_end),
+            "events_without_reply": len(self.sent_at) - len(end_to_end),
+            "gpt": summarize(self.gpt_latencies),
+            "statuses": self.statuses,
+            "upstream_calls": upstream_calls,
+            "app": app_stats,
+            "event_queue": queue_stats,
+        }
+
+    async def _drain(self, client: httpx.AsyncClient) -> bool:
+        """キューが空になり処理中のイベントがなくなるまで待つ"""
+        deadline = time.monotonic() + self.args.drain_timeout
+        while time.monotonic() < deadline:
+            stats = (await client.get(f"{self.app_url}/events/stats")).json()
+            if stats.get("depth", 0) == 0 and stats.get("in_flight", 0) == 0:
+                # デバウンス中のメンションの応答を待つ
+                await asyncio.sleep(self.args.settle)
+                return True
+            await asyncio.sleep(0.5)
+        return False
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """主要な指標をベースラインと比較した行を返す"""
+    metrics = [
+        ("throughput_rps", None),
+        ("replies_per_second", None),
+        ("event_ack", "p95_ms"),
+        ("event_end_to_end", "p50_ms"),
+        ("event_end_to_end", "p95_ms"),
+        ("event_end_to_end", "p99_ms"),
+        ("gpt", "p95_ms"),
+        ("app", "loop_lag_p99_ms"),
+        ("app", "max_rss_mb"),
+    ]
+    lines = []
+    for section, key in metrics:
+        current = result[section][key] if key else result[section]
+        previous = (baseline.get(section) or {}).get(key) if key else baseline.get(section)
+        name = f"{section}.{key}" if key else section
+        if previous:
+            lines.append(f"{name:32} {previous:12.2f} -> {current:12.2f} ({(current - previous) / previous * 100:+.1f}%)")
+        else:
+            lines.append(f"{name:32} {'-':>12} -> {current:12.2f}")
+    return lines
+
+
+def report(result: Dict[str, Any]) -> List[str]:
+    lines = [
+        f"throughput: {result['throughput_rps']:.1f} req/s, replies: {result['replies_per_second']:.1f}/s "
+        f"(drained={result['drained']}, without reply={result['events_without_reply']})",
+    ]
+    for name in ("event_ack", "event_end_to_end", "gpt"):
+        stats = result[name]
+        lines.append(
+            f"{name:17} n={stats['count']:<6} p50={stats['p50_ms']:.1f}ms "
+            f"p95={stats['p95_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms"
+        )
+    app = result["app"]
+    lines.append(
+        f"loop lag p50={app['loop_lag_p50_ms']:.1f}ms p99={app['loop_lag_p99_ms']:.1f}ms "
+        f"max={app['loop_lag_max_ms']:.1f}ms, max RSS={app['max_rss_mb']:.1f}MB"
+    )
+    lines.append(f"statuses: {result['statuses']}")
+    lines.append(f"upstream calls: {result['upstream_calls']}")
+    return lines
+
+
+def stop(processes: List[subprocess.Popen], timeout: float) -> None:
+    """SIGTERMを送って終了を待ち、timeout秒以内に終わらなければ強制終了する"""
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def spawn(args: List[str], env: Dict[str, str], log_path: Path) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen([sys.executable, *args], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def main(args: argparse.Namespace, fake_args: List[str]) -> Dict[str, Any]:
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "SLACK_BOT_TOKEN": "xoxb-bench",
+            "OPENAI_API_KEY": "sk-bench",
+            "SPREADSHEET_ID": "bench",
+            "GOOGLE_CREDENTIALS_PATH": write_credentials(directory, f"{fake_url}/token"),
+            "OPENAI_BASE_URL": f"{fake_url}/v1",
+            "SLACK_API_URL": f"{fake_url}/api/",
+            "SHEETS_API_ENDPOINT": fake_url,
+            "SQLITE_PATH": os.path.join(directory, "usage.db"),
+            # アカウントごとのOpenAIの上限ではなくアプリケーション自体を測るため既定では緩める
+            "OPENAI_RPM": "100000",
+            "OPENAI_TPM": "100000000",
+            # イベントループの遅延の分布を取るため、計測間隔を短くする
+            "LOOP_LAG_INTERVAL": "0.05",
+            # 語彙ファイルを取得していない環境では文字数での見積もりで測る
+            **({} if (ROOT / "tokenizer" / "o200k_base.tiktoken").exists() else {"TOKENIZER_PATH": ""}),
+            "SLACK_APP_TOKEN": "xapp-bench",
+            "SLACK_SOCKET_MODE": "true" if args.socket_mode else "false",
+            **dict(item.split("=", 1) for item in args.env),
+        }
+        processes = [
+            spawn(["-m", "bench.fakes", "--port", str(args.fake_port), *fake_args], env, RESULTS_DIR / "fakes.log"),
+        ]
+        if args.redis_url:
+            env["SHARED_STATE_BACKEND"] = "redis"
+            env["REDIS_URL"] = args.redis_url
+        elif args.redis_port:
+            env["SHARED_STATE_BACKEND"] = "redis"
+            env["REDIS_URL"] = f"redis://127.0.0.1:{args.redis_port}/0"
+            processes.append(spawn(["-m", "bench.fake_redis", "--port", str(args.redis_port)], env, RESULTS_DIR / "redis.log"))
+        app_process = spawn(["-m", "bench.serve", "--port", str(args.app_port)], env, RESULTS_DIR / "app.log")
+        try:
+            async with httpx.AsyncClient() as client:
+                await wait_until_ready(client, f"{fake_url}/__bench__/posts")
+                await wait_until_ready(client, f"{app_url}/ping")
+                if args.socket_mode:
+                    await wait_until_ready(client, f"{fake_url}/__bench__/socket/connections")
+            return await LoadGenerator(app_url, fake_url, args).run()
+        finally:
+            # アプリケーションは終了時に使用量を代替サーバーへ書き出すため、先に止めて終了を待ってから代替サーバーを止める
+            stop([app_process], args.shutdown_timeout)
+            stop(processes, args.shutdown_timeout)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30.0, help="負荷をかける秒数")
+    parser.add_argument("--event-rate", type=float, default=2.0, help="1秒あたりに送るSlackイベントの数")
+    parser.add_argument("--concurrency", type=int, default=10, help="/gpt/ を呼び続けるクライアント数")
+    parser.add_argument("--users", type=int, default=200, help="メンションするユーザーの種類")
+    parser.add_argument("--prompt-pool", type=int, default=50, help="プロンプトの種類（少ないほどキャッシュが効く）")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--settle", type=float, default=3.0, help="キューが空になってから結果を集計するまでの秒数")
+    parser.add_argument("--shutdown-timeout", type=float, default=30.0)
+    parser.add_argument("--fake-port", type=int, default=9000)
+    parser.add_argument("--app-port", type=int, default=8080)
+    parser.add_argument("--socket-mode", action="store_true", help="イベントを /events ではなくSocket Modeで配信する")
+    parser.add_argument("--redis-url", help="指定すると共有状態をこのRedisに保存して測定する")
+    parser.add_argument("--redis-port", type=int, help="指定するとRedisの代替サーバー（fakeredis）を起動し、共有状態をRedis実装に切り替える")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="アプリケーションの環境変数を上書き")
+    parser.add_argument("--output", help="結果のJSONの保存先（既定は bench/results/<時刻>.json）")
+    parser.add_argument("--baseline", help="比較するベンチマーク結果のJSON")
+    fake_parser = argparse.ArgumentParser(add_help=False)
+    add_fake_arguments(fake_parser)
+    for action in fake_parser._actions:
+        parser._add_action(action)
+    args = parser.parse_args()
+
+    # 代替サーバーの引数はそのまま子プロセスに渡す
+    fake_args = []
+    for action in fake_parser._actions:
+        value = getattr(args, action.dest)
+        if value is not None:
+            fake_args += [action.option_strings[0], str(value)]
+
+    result = asyncio.run(main(args, fake_args))
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2))
+
+    print("\n".join(report(result)))
+    if args.baseline:
+        print(f"\ncompared with {args.baseline}:")
+        print("\n".join(compare(result, json.loads(Path(args.baseline).read_text()))))
+    print(f"\nresult saved to {output}")
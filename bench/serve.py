@@ -0,0 +1,44 @@
+"""
+ベンチマーク用にアプリケーションを起動する
+
+main.app に /__bench__/stats（イベントループの遅延の分布・最大RSS）を追加して uvicorn で実行する。
+"""
+import argparse
+import resource
+from typing import List
+import uvicorn
+from main import app
+
+lag_samples: List[float] = []
+
+
+@app.on_event("startup")
+async def collect_loop_lag():
+    """アプリケーションのLoopLagMonitorの計測結果を集める（計測間隔はLOOP_LAG_INTERVAL）"""
+    app.state.loop_lag_monitor.add_listener(lag_samples.append)
+
+
+@app.get("/__bench__/stats")
+async def bench_stats():
+    samples = sorted(lag_samples)
+    percentile = lambda p: samples[min(len(samples) - 1, int(len(samples) * p))] if samples else 0.0
+    return {
+        "loop_lag_p50_ms": percentile(0.50) * 1000,
+        "loop_lag_p99_ms": percentile(0.99) * 1000,
+        "loop_lag_max_ms": (samples[-1] if samples else 0.0) * 1000,
+        # Linuxではキロバイト単位
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+@app.post("/__bench__/reset")
+async def bench_reset():
+    lag_samples.clear()
+    return {"ok": True}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -14,12 +14,134 @@ class Config:
     GOOGLE_CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS_PATH")
     CREDENTIALS = None
 
+    # 上流APIの接続先（ベンチマーク用のローカルサーバーなどに差し替える場合のみ指定）
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+    SLACK_API_URL = os.getenv("SLACK_API_URL")
+    SHEETS_API_ENDPOINT = os.getenv("SHEETS_API_ENDPOINT")
+
+    # トークナイザーの語彙ファイル（make tokenizer で取得、空の場合は文字数で見積もる）
+    TOKENIZER_PATH = os.getenv("TOKENIZER_PATH", "tokenizer/o200k_base.tiktoken")
+
+    # GPTクライアントの接続設定
+    GPT_MAX_CONNECTIONS = int(os.getenv("GPT_MAX_CONNECTIONS", "20"))
+    GPT_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GPT_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    GPT_MAX_CONCURRENCY = int(os.getenv("GPT_MAX_CONCURRENCY", "10"))
+    GPT_CONNECT_TIMEOUT = float(os.getenv("GPT_CONNECT_TIMEOUT", "5.0"))
+    GPT_READ_TIMEOUT = float(os.getenv("GPT_READ_TIMEOUT", "60.0"))
+
+    # 上流APIのレート制限
+    OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+    OPENAI_TPM = float(os.getenv("OPENAI_TPM", "30000"))
+    RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "3"))
+
+    # GPT呼び出しの耐障害性設定
+    GPT_DEADLINE = float(os.getenv("GPT_DEADLINE", "90.0"))
+    GPT_MAX_RETRIES = int(os.getenv("GPT_MAX_RETRIES", "2"))
+    GPT_BACKOFF_BASE = float(os.getenv("GPT_BACKOFF_BASE", "0.5"))
+    GPT_BACKOFF_MAX = float(os.getenv("GPT_BACKOFF_MAX", "8.0"))
+    GPT_HEDGING_ENABLED = os.getenv("GPT_HEDGING_ENABLED", "false").lower() == "true"
+    GPT_HEDGE_MIN_SAMPLES = int(os.getenv("GPT_HEDGE_MIN_SAMPLES", "20"))
+    GPT_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("GPT_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    GPT_CIRCUIT_RESET_TIMEOUT = float(os.getenv("GPT_CIRCUIT_RESET_TIMEOUT", "30.0"))
+
+    # POST /gpt/batch の同時実行数と1リクエストあたりのプロンプト数の上限
+    GPT_BATCH_CONCURRENCY = int(os.getenv("GPT_BATCH_CONCURRENCY", "5"))
+    GPT_BATCH_MAX_PROMPTS = int(os.getenv("GPT_BATCH_MAX_PROMPTS", "100"))
+
+    # /gpt の応答キャッシュ設定
+    GPT_CACHE_ENABLED = os.getenv("GPT_CACHE_ENABLED", "true").lower() == "true"
+    GPT_CACHE_MAX_ENTRIES = int(os.getenv("GPT_CACHE_MAX_ENTRIES", "1000"))
+    GPT_CACHE_MAX_BYTES = int(os.getenv("GPT_CACHE_MAX_BYTES", str(10 * 1024 * 1024)))
+    GPT_CACHE_TTL = float(os.getenv("GPT_CACHE_TTL", "3600"))
+
+    # Slackイベント処理ワーカーの設定
+    EVENT_WORKERS = int(os.getenv("EVENT_WORKERS", "4"))
+    EVENT_QUEUE_MAX_SIZE = int(os.getenv("EVENT_QUEUE_MAX_SIZE", "1000"))
+    EVENT_SHUTDOWN_TIMEOUT = float(os.getenv("EVENT_SHUTDOWN_TIMEOUT", "30.0"))
+    EVENT_DEDUP_MAX_SIZE = int(os.getenv("EVENT_DEDUP_MAX_SIZE", "10000"))
+    EVENT_DEDUP_TTL = float(os.getenv("EVENT_DEDUP_TTL", "3600"))
+
+    # 使用量のスプレッドシート書き込み設定
+    USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "10.0"))
+    USAGE_FLUSH_MAX_PENDING = int(os.getenv("USAGE_FLUSH_MAX_PENDING", "50"))
+
+    # Google Sheets APIの接続設定
+    SHEETS_MAX_WORKERS = int(os.getenv("SHEETS_MAX_WORKERS", "4"))
+    SHEETS_TIMEOUT = float(os.getenv("SHEETS_TIMEOUT", "10.0"))
+
+    # 使用量の保存先 ("sheets" または "sqlite")
+    USAGE_BACKEND = os.getenv("USAGE_BACKEND", "sheets")
+    SQLITE_PATH = os.getenv("SQLITE_PATH", "usage.db")
+    USAGE_EXPORT_INTERVAL = float(os.getenv("USAGE_EXPORT_INTERVAL", "60.0"))
+    USAGE_LOCK_SHARDS = int(os.getenv("USAGE_LOCK_SHARDS", "64"))
+    USAGE_LOCK_TIMEOUT = float(os.getenv("USAGE_LOCK_TIMEOUT", "30.0"))
+
+    # 重複排除・使用量・キャッシュの共有先 ("memory" または "redis")
+    # 複数のワーカー・インスタンスで動かす場合は "redis" にする
+    SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "memory")
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "slack-gpt-bot:")
+    REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "20"))
+    REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "2.0"))
+
+    # 起動時のウォームアップをバックグラウンドで行うか（falseの場合は完了まで待つ）
+    STARTUP_WARMUP_BACKGROUND = os.getenv("STARTUP_WARMUP_BACKGROUND", "true").lower() == "true"
+
+    # Slackスレッド履歴キャッシュの設定
+    THREAD_CACHE_MAX_THREADS = int(os.getenv("THREAD_CACHE_MAX_THREADS", "1000"))
+    THREAD_CACHE_TTL = float(os.getenv("THREAD_CACHE_TTL", "3600"))
+    THREAD_CACHE_MAX_MESSAGES = int(os.getenv("THREAD_CACHE_MAX_MESSAGES", "200"))
+
+    # Slackへのストリーミング返信の設定
+    SLACK_STREAM_REPLIES = os.getenv("SLACK_STREAM_REPLIES", "false").lower() == "true"
+    SLACK_STREAM_UPDATE_INTERVAL = float(os.getenv("SLACK_STREAM_UPDATE_INTERVAL", "1.0"))
+    # 同じスレッドへのメンションをまとめる時間（秒、0で無効）
+    # 最初のメンションはこの時間だけワーカーを占有して待つため、応答がその分遅くなる
+    SLACK_DEBOUNCE_WINDOW = float(os.getenv("SLACK_DEBOUNCE_WINDOW", "0"))
+
+    # Socket Modeでのイベント受信（有効にすると公開エンドポイントなしで動作する）
+    SLACK_SOCKET_MODE = os.getenv("SLACK_SOCKET_MODE", "false").lower() == "true"
+    SLACK_APP_TOKEN = os.getenv("SLACK_APP_TOKEN")
+    # 同時に張る接続数（Slackの上限は10）
+    SLACK_SOCKET_MODE_CONNECTIONS = int(os.getenv("SLACK_SOCKET_MODE_CONNECTIONS", "2"))
+    SLACK_SOCKET_MODE_PING_INTERVAL = float(os.getenv("SLACK_SOCKET_MODE_PING_INTERVAL", "10.0"))
+
+    # イベントループの遅延の計測間隔と警告の閾値（秒）
+    LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+    LOOP_LAG_WARN_THRESHOLD = float(os.getenv("LOOP_LAG_WARN_THRESHOLD", "0.5"))
+
+    # トレース（無効の場合は計装の負荷はほぼない）
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "0.1"))
+    # "file" または "otlp"
+    TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "file")
+    TRACING_FILE_PATH = os.getenv("TRACING_FILE_PATH", "traces.jsonl")
+    TRACING_OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+    TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "slack-gpt-bot")
+    TRACING_FLUSH_INTERVAL = float(os.getenv("TRACING_FLUSH_INTERVAL", "5.0"))
+
+    # 閾値（秒）を超えた処理のスタックを記録するプロファイラー
+    PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+    PROFILER_THRESHOLD = float(os.getenv("PROFILER_THRESHOLD", "10.0"))
+    PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.05"))
+    PROFILER_OUTPUT_DIR = os.getenv("PROFILER_OUTPUT_DIR", "profiles")
+
     @staticmethod
     def validate():
         required_vars = ["SLACK_BOT_TOKEN", "OPENAI_API_KEY", "SPREADSHEET_ID", "GOOGLE_CREDENTIALS_PATH"]
         missing_vars = [var for var in required_vars if not getattr(Config, var)]
         if missing_vars:
             raise RuntimeError(f"Missing required environment variables: {', '.join(missing_vars)}")
+        if Config.USAGE_BACKEND not in ("sheets", "sqlite"):
+            raise RuntimeError(f"Invalid USAGE_BACKEND: {Config.USAGE_BACKEND}")
+        if Config.SHARED_STATE_BACKEND not in ("memory", "redis"):
+            raise RuntimeError(f"Invalid SHARED_STATE_BACKEND: {Config.SHARED_STATE_BACKEND}")
+        if Config.SLACK_SOCKET_MODE and not Config.SLACK_APP_TOKEN:
+            raise RuntimeError("SLACK_APP_TOKEN is required when SLACK_SOCKET_MODE is enabled")
+        if not 1 <= Config.SLACK_SOCKET_MODE_CONNECTIONS <= 10:
+            raise RuntimeError(f"Invalid SLACK_SOCKET_MODE_CONNECTIONS: {Config.SLACK_SOCKET_MODE_CONNECTIONS}")
+        if Config.TRACING_EXPORTER not in ("file", "otlp"):
+            raise RuntimeError(f"Invalid TRACING_EXPORTER: {Config.TRACING_EXPORTER}")
 
     @staticmethod
     def load_google_credentials():
@@ -1,4 +1,27 @@
+from functools import lru_cache
+from typing import Dict, List, Union
+import base64
+import hashlib
+import re
+import unicodedata
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 MODEL = "gpt-4o"
+# モデルのコンテキスト長
+MODEL_CONTEXT_TOKENS = 128000
+# スレッド履歴に割り当てるトークン数
+PROMPT_TOKEN_BUDGET = 8000
+# メッセージごとに加算される制御トークン数
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 単一の文字列、またはrole/contentを持つメッセージの配列
+Prompt = Union[str, List[Dict[str, str]]]
+# 予約時に見積もる応答のトークン数
+ESTIMATED_COMPLETION_TOKENS = 1000
 CHARACTER_SETTINGS = """
 [この会話の概要と世界観]
 ロールプレイゲーム。ゲームの世界観はアニメ「とある科学の超電磁砲」の世界に基づきます。
@@ -21,3 +44,82 @@ CHARACTER_SETTINGS = """
 私からの会話に「了解」「ありがとう」「また連絡する」といったキーワードが含まれている場合、それが会話終了の合図です。
 その際には、文末に「以上です、御坂10032号より報告を終了します。」と付加し、そこで返答を終了してください。
 """
+
+
+
+# gpt-4o のトークナイザー（o200k_base）の語彙ファイル
+TOKENIZER_URL = "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken"
+TOKENIZER_SHA256 = "446a9538cb6c348e3516120d7c08b09f57c36495e2acfffe59a5bf8b0cfb1a2d"
+TOKENIZER_PATTERN = "|".join([
+    r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+    r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+    r"""\p{N}{1,3}""",
+    r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+    r"""\s*[\r\n]+""",
+    r"""\s+(?!\S)""",
+    r"""\s+""",
+])
+TOKENIZER_SPECIAL_TOKENS = {"<|endoftext|>": 199999, "<|endofprompt|>": 200018}
+
+_encoding = None
+
+
+def load_tokenizer(path: str) -> None:
+    """
+    同梱した語彙ファイルからトークナイザーを読み込む（実行時にダウンロードはしない）
+    ファイルがない・内容が異なる場合は例外を送出する
+    """
+    global _encoding
+    if tiktoken is None:
+        raise RuntimeError("tiktoken is not installed.")
+    with open(path, "rb") as f:
+        contents = f.read()
+    if hashlib.sha256(contents).hexdigest() != TOKENIZER_SHA256:
+        raise RuntimeError(f"Tokenizer file {path} does not match the expected hash.")
+    mergeable_ranks = {
+        base64.b64decode(token): int(rank)
+        for token, rank in (line.split() for line in contents.splitlines() if line)
+    }
+    _encoding = tiktoken.Encoding(
+        name="o200k_base",
+        pat_str=TOKENIZER_PATTERN,
+        mergeable_ranks=mergeable_ranks,
+        special_tokens=TOKENIZER_SPECIAL_TOKENS,
+    )
+    # 読み込み前に文字数で見積もった結果を使わない
+    estimate_tokens.cache_clear()
+
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を計算（トークナイザーがない場合は文字数で上限を見積もる）
+    """
+    if _encoding is None:
+        return len(text)
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def build_chat_messages(prompt: Prompt) -> List[Dict[str, str]]:
+    """
+    キャラクター設定を先頭に固定したメッセージ配列を生成
+    """
+    if isinstance(prompt, str):
+        prompt = [{"role": "user", "content": prompt}]
+    return [{"role": "system", "content": CHARACTER_SETTINGS}, *prompt]
+
+
+def estimate_prompt_tokens(prompt: Prompt) -> int:
+    """
+    プロンプト全体のトークン数を計算
+    """
+    if isinstance(prompt, str):
+        return estimate_tokens(prompt) + MESSAGE_OVERHEAD_TOKENS
+    return sum(estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in prompt)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    全角/半角の揺れと空白の違いを吸収
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", prompt)).strip()
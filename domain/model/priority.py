@@ -0,0 +1,16 @@
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+# 外部APIへのリクエストの優先度（小さいほど優先）
+Priority = Tuple[int, int]
+
+DEFAULT_PRIORITY: Priority = (1, 0)
+
+request_priority: ContextVar[Priority] = ContextVar("request_priority", default=DEFAULT_PRIORITY)
+
+
+def priority_for(channel_type: Optional[str], estimated_tokens: int = 0) -> Priority:
+    """
+    DMを優先し、同じ種類の中では短いプロンプトを優先する
+    """
+    return (0 if channel_type == "im" else 1, estimated_tokens)
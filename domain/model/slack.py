@@ -1,8 +1,8 @@
 from pydantic import BaseModel
 from typing import List, Dict
+from domain.model.gpt import MESSAGE_OVERHEAD_TOKENS, PROMPT_TOKEN_BUDGET, estimate_tokens
 
-# 読み込むメッセージの最大件数
-DEFAULT_MAX_MESSAGES = 20
+THREAD_INSTRUCTION = "以下はSlackスレッドの履歴です。ユーザーの発言は「送信者ID: 本文」の形式です。下記を踏まえて答えてください"
 
 class SlackMessage(BaseModel):
     text: str  # メッセージの内容
@@ -38,22 +38,30 @@ class SlackMessages(BaseModel):
             })
         return flow
 
-    def limit_messages(self, max_messages: int) -> "SlackMessages":
+    def create_messages(self, bot_user_id: str, max_tokens: int = PROMPT_TOKEN_BUDGET) -> List[Dict[str, str]]:
         """
-        メッセージを最大件数に制限
+        スレッドをマルチターンのメッセージ配列に変換（ボットの発言はassistant、それ以外はuser）
+        新しいメッセージから順にトークン予算に収まるだけ詰め、古い順に並べて返す
+        最新のメッセージすら収まらない場合はValueErrorを送出
         """
-        limited_messages = self.messages[-max_messages:]
-        return SlackMessages(messages=limited_messages)
+        used_tokens = estimate_tokens(THREAD_INSTRUCTION) + MESSAGE_OVERHEAD_TOKENS
+        turns = []
+        for flow in reversed(self.extract_conversation_flow(bot_user_id)):
+            if flow["speaker"] == bot_user_id:
+                turn = {"role": "assistant", "content": flow["message"]}
+            else:
+                turn = {"role": "user", "content": f'{flow["speaker"]}: {flow["message"]}'}
+            tokens = estimate_tokens(turn["content"]) + MESSAGE_OVERHEAD_TOKENS
+            if used_tokens + tokens > max_tokens:
+                break
+            used_tokens += tokens
+            turns.append(turn)
 
-    def create_prompt(self, bot_user_id: str, max_messages: int = DEFAULT_MAX_MESSAGES) -> str:
-        """
-        プロンプトを生成
-        """
-        limited_messages = self.limit_messages(max_messages)
-        builder = ["以下はSlackスレッドの履歴を含んだGPTプロンプトです。下記を踏まえて答えてください\n"]
-        for flow in limited_messages.extract_conversation_flow(bot_user_id):
-            builder.append(f'{flow["speaker"]}, message: {flow["message"]}\n')
-        return "".join(builder)
+        if self.messages and not turns:
+            raise ValueError("Latest message exceeds the prompt token budget.")
+
+        turns.reverse()
+        return [{"role": "system", "content": THREAD_INSTRUCTION}, *turns]
 
 
 def convert_to_slack_messages(slack_messages: List[Dict[str, str]]) -> SlackMessages:
@@ -15,12 +15,12 @@ class SpreadsheetData(BaseModel):
     daily_tokens_usage: int = Field(0, alias="DailyTokensUsage")
     total_tokens_usage: int = Field(0, alias="TotalTokensUsage")
 
-    def can_use_daily_tokens(self) -> None:
+    def can_use_daily_tokens(self, reserved_tokens: int = 0) -> None:
         """
-        毎日のトークン使用量が制限を超えているかを確認
+        毎日のトークン使用量（予約分を含む）が制限を超えているかを確認
         """
-        logging.info(f"トークン使用量: {self.daily_tokens_usage}")
-        if self.daily_tokens_usage > DAILY_TOKEN_LIMIT:
+        logging.info(f"トークン使用量: {self.daily_tokens_usage}, 予約: {reserved_tokens}")
+        if self.daily_tokens_usage + reserved_tokens > DAILY_TOKEN_LIMIT:
             raise ValueError("Daily token limit exceeded.")
 
     def add_token_usage(self, tokens: int) -> None:
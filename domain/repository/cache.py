@@ -0,0 +1,16 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+
+class ResponseCacheRepository(ABC):
+    @abstractmethod
+    async def get(self, prompt: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def set(self, prompt: str, response: str) -> None:
+        pass
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        pass
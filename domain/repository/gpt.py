@@ -1,6 +1,12 @@
 from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator
+from domain.model.gpt import Prompt
 
 class GptRepository(ABC):
     @abstractmethod
-    async def create_completion(self, prompt: str) -> any:
+    async def create_completion(self, prompt: Prompt) -> any:
+        pass
+
+    @abstractmethod
+    def create_completion_stream(self, prompt: Prompt) -> AsyncIterator[Any]:
         pass
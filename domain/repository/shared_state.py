@@ -0,0 +1,47 @@
+from abc import ABC, abstractmethod
+from typing import Any, AsyncContextManager, Dict, Optional
+
+
+class SharedStateRepository(ABC):
+    """
+    プロセス・インスタンス間で共有する状態（重複排除・使用量・キャッシュ）の保存先
+    値は文字列で保持する
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl_seconds: Optional[float] = None) -> None:
+        pass
+
+    @abstractmethod
+    async def add(self, key: str, value: str, ttl_seconds: Optional[float] = None) -> bool:
+        """キーが存在しない場合のみ登録し、登録できたかを返す"""
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int, ttl_seconds: Optional[float] = None) -> int:
+        """整数値に加算して結果を返す（存在しない場合は0から加算）"""
+        pass
+
+    @abstractmethod
+    def lock(self, name: str, timeout: float) -> AsyncContextManager[None]:
+        """
+        名前ごとの排他ロック
+        取得できるまで最大timeout秒待ち、取得できなければTimeoutError（保持したまま落ちた場合もtimeout秒で解放される）
+        """
+        pass
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def close(self) -> None:
+        pass
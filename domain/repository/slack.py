@@ -1,14 +1,32 @@
 from abc import ABC, abstractmethod
 from domain.model.slack import SlackMessage
-from typing import List
+from typing import Any, Dict, List, Optional
 
 class SlackRepository(ABC):
   @abstractmethod
-  async def load_conversation_replies(self, channelID: str, timestamp: str, test: str) -> List[SlackMessage]:
+  async def load_conversation_replies(
+      self,
+      channel_id: str,
+      timestamp: str,
+      latest_messages: Optional[List[Dict[str, Any]]] = None,
+  ) -> List[SlackMessage]:
     pass
   @abstractmethod
-  async def create_new_message(self, channel_id: str, timestamp: str, message: str) -> None:
+  async def create_new_message(self, channel_id: str, timestamp: str, message: str) -> Optional[str]:
     pass
   @abstractmethod
-  async def get_bot_user_id(self) -> str:
+  async def update_message(
+      self,
+      channel_id: str,
+      message_ts: str,
+      message: str,
+      thread_ts: Optional[str] = None,
+      best_effort: bool = False,
+  ) -> bool:
+    pass
+  @abstractmethod
+  async def get_bot_user_id(self, team_id: Optional[str] = None) -> str:
+    pass
+  @abstractmethod
+  def remember_bot_user_id(self, team_id: Optional[str], bot_user_id: str) -> None:
     pass
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import List, Optional
 from domain.model.spreadsheet import SpreadsheetData
 
 
@@ -11,3 +11,13 @@ class SpreadsheetRepository(ABC):
     @abstractmethod
     async def update_spreadsheet(self, update: SpreadsheetData) -> None:
         pass
+
+    @abstractmethod
+    async def update_spreadsheet_batch(self, updates: List[SpreadsheetData]) -> None:
+        pass
+
+    async def add_token_usage(self, user_id: str, tokens: int) -> Optional[SpreadsheetData]:
+        """
+        使用量を保存先で原子的に加算し、加算後の値を返す（対応していない場合はNone）
+        """
+        return None
@@ -0,0 +1,28 @@
+from typing import Optional
+from domain.repository.shared_state import SharedStateRepository
+import logging
+
+logger = logging.getLogger(__name__)
+
+class EventDeduplicator:
+    def __init__(self, shared_state: SharedStateRepository, ttl_seconds: float = 3600.0):
+        """
+        処理済みのSlackイベントIDを共有状態に記録する重複排除
+        複数のプロセス・インスタンスで共有すれば、どこで受信しても一度だけ処理される
+        """
+        self.shared_state = shared_state
+        self.ttl_seconds = ttl_seconds
+
+    async def mark(self, event_key: Optional[str]) -> bool:
+        """未処理のイベントなら処理済みとして登録しTrueを返す。重複ならFalse"""
+        if not event_key:
+            return True
+        if not await self.shared_state.add(f"dedup:{event_key}", "1", self.ttl_seconds):
+            logger.info(f"Duplicate event detected: {event_key}")
+            return False
+        return True
+
+    async def forget(self, event_key: Optional[str]) -> None:
+        """処理できなかったイベントを未処理に戻す（リトライで再処理させる）"""
+        if event_key:
+            await self.shared_state.delete(f"dedup:{event_key}")
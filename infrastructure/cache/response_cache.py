@@ -0,0 +1,43 @@
+import hashlib
+from typing import Any, Dict, Optional
+from domain.repository.cache import ResponseCacheRepository
+from domain.repository.shared_state import SharedStateRepository
+from domain.model.gpt import MODEL, CHARACTER_SETTINGS, normalize_prompt
+from infrastructure.metrics.metrics import GPT_RESPONSE_CACHE_REQUESTS
+
+
+class ResponseCache(ResponseCacheRepository):
+    def __init__(self, shared_state: SharedStateRepository, ttl_seconds: float = 3600.0):
+        """
+        正規化したプロンプト・モデル・システムプロンプトをキーにGPTの応答をキャッシュ
+        """
+        self.shared_state = shared_state
+        self.ttl_seconds = ttl_seconds
+        self.system_prompt_hash = hashlib.sha256(CHARACTER_SETTINGS.encode("utf-8")).hexdigest()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, prompt: str) -> Optional[str]:
+        response = await self.shared_state.get(self._make_key(prompt))
+        if response is None:
+            self.misses += 1
+            GPT_RESPONSE_CACHE_REQUESTS.labels(result="miss").inc()
+        else:
+            self.hits += 1
+            GPT_RESPONSE_CACHE_REQUESTS.labels(result="hit").inc()
+        return response
+
+    async def set(self, prompt: str, response: str) -> None:
+        await self.shared_state.set(self._make_key(prompt), response, self.ttl_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.shared_state.stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _make_key(self, prompt: str) -> str:
+        normalized = normalize_prompt(prompt)
+        raw = f"{MODEL}\0{self.system_prompt_hash}\0{normalized}"
+        return "response:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
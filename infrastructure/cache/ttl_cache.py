@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+import threading
+
+
+class TTLCache:
+    def __init__(
+            self,
+            max_size: int,
+            ttl_seconds: float,
+            max_bytes: Optional[int] = None,
+            sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        """
+        件数上限とTTLを持つLRUキャッシュを初期化
+        max_bytesとsizeofを指定した場合は合計サイズでも上限を設ける
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.total_bytes = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """キーに対応する値を取得（期限切れの場合はdefault）"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """値を登録"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._put(key, value, time.monotonic() + ttl)
+            self._evict()
+
+    def add(self, key: Hashable, value: Any = True, ttl_seconds: Optional[float] = None) -> bool:
+        """キーが存在しない場合のみ登録し、登録できたかを返す"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            item = self._data.get(key)
+            now = time.monotonic()
+            if item is not None and item[0] > now:
+                return False
+            self._put(key, value, now + ttl)
+            self._evict()
+            return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """キーを削除し、値を返す"""
+        with self._lock:
+            item = self._remove(key)
+            return default if item is None else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.total_bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _put(self, key: Hashable, value: Any, expires_at: float) -> None:
+        self._remove(key)
+        self._data[key] = (expires_at, value)
+        if self.sizeof:
+            self.total_bytes += self.sizeof(value)
+
+    def _remove(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        item = self._data.pop(key, None)
+        if item is not None and self.sizeof:
+            self.total_bytes -= self.sizeof(item[1])
+        return item
+
+    def _evict(self) -> None:
+        """期限切れと上限超過のエントリを古い順に削除"""
+        now = time.monotonic()
+        while self._data:
+            oldest_key, (expires_at, _) = next(iter(self._data.items()))
+            over_bytes = self.max_bytes is not None and self.total_bytes > self.max_bytes
+            if expires_at > now and len(self._data) <= self.max_size and not over_bytes:
+                break
+            self._remove(oldest_key)
+
+
+_MISSING = object()
@@ -1,27 +1,161 @@
-from typing import Optional, Dict, Any
-from openai import OpenAI
+import asyncio
+import time
+from typing import Optional, Dict, Any, AsyncIterator
+import httpx
+from openai import AsyncOpenAI, RateLimitError
+from opentelemetry.trace import SpanKind
 from domain.repository.gpt import GptRepository
-from domain.model.gpt import MODEL, CHARACTER_SETTINGS
+from domain.model.gpt import MODEL, ESTIMATED_COMPLETION_TOKENS, Prompt, build_chat_messages, estimate_prompt_tokens
+from infrastructure.ratelimit.scheduler import RateLimitScheduler, parse_retry_after
+from infrastructure.gpt.resilience import CircuitBreaker, LatencyTracker, call_hedged, call_with_retries
+from infrastructure.metrics.metrics import IN_FLIGHT, UPSTREAM_REQUEST_SECONDS, UPSTREAM_RETRIES, record_gpt_usage
+from infrastructure.tracing.tracing import set_attributes, span
 import logging
 
 logger = logging.getLogger(__name__)
 
 class GptClient(GptRepository):
-    def __init__(self, api_key: str):
+    def __init__(
+            self,
+            api_key: str,
+            max_connections: int = 20,
+            max_keepalive_connections: int = 10,
+            max_concurrency: int = 10,
+            connect_timeout: float = 5.0,
+            read_timeout: float = 60.0,
+            scheduler: Optional[RateLimitScheduler] = None,
+            rate_limit_retries: int = 3,
+            deadline: float = 90.0,
+            max_retries: int = 2,
+            backoff_base: float = 0.5,
+            backoff_max: float = 8.0,
+            hedging_enabled: bool = False,
+            hedge_min_samples: int = 20,
+            circuit_failure_threshold: int = 5,
+            circuit_reset_timeout: float = 30.0,
+            base_url: Optional[str] = None,
+    ):
         self.api_key = api_key
-        self.client = OpenAI(api_key=self.api_key)
+        # 共有のHTTPコネクションプール
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        # 429はスケジューラーで待ち合わせるため、SDKの自動リトライは使わない
+        self.client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=base_url,
+            http_client=self.http_client,
+            max_retries=0,
+        )
+        # 同時実行数の上限
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.scheduler = scheduler
+        self.rate_limit_retries = rate_limit_retries
+        # 耐障害性の設定
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedging_enabled = hedging_enabled
+        self.hedge_min_samples = hedge_min_samples
+        self.circuit_breaker = CircuitBreaker(circuit_failure_threshold, circuit_reset_timeout)
+        self.latency = LatencyTracker()
 
-    async def create_completion(self, prompt: str) -> Optional[Dict[str, Any]]:
+    async def create_completion(self, prompt: Prompt) -> Optional[Dict[str, Any]]:
         try:
-            response = self.client.chat.completions.create(
-                model=MODEL,
-                messages=[
-                    {"role": "system", "content": CHARACTER_SETTINGS},
-                    {"role": "user", "content": prompt}
-                ],
-            )
+            with span("GptClient.create_completion"):
+                async with self.semaphore:
+                    with IN_FLIGHT.labels(work="gpt_request").track_inprogress():
+                        response = await asyncio.wait_for(self._create_resilient(prompt), timeout=self.deadline)
+            record_gpt_usage(getattr(response, "usage", None))
             completion = response
             return completion
         except Exception as e:
             logger.error(f"Failed self.client.chat.completions.create: {e}")
             return None
+
+    async def create_completion_stream(self, prompt: Prompt) -> AsyncIterator[Any]:
+        """
+        応答をチャンク単位で返す（最後のチャンクにusageが含まれる）
+        """
+        async with self.semaphore:
+            with IN_FLIGHT.labels(work="gpt_request").track_inprogress():
+                # ストリームは応答開始までを再試行の対象とする
+                stream = await asyncio.wait_for(
+                    call_with_retries(
+                        lambda: self._create(prompt, stream=True, stream_options={"include_usage": True}),
+                        self.circuit_breaker,
+                        self.max_retries,
+                        self.backoff_base,
+                        self.backoff_max,
+                    ),
+                    timeout=self.deadline,
+                )
+                try:
+                    async for chunk in stream:
+                        if chunk.usage:
+                            record_gpt_usage(chunk.usage)
+                        yield chunk
+                finally:
+                    await stream.close()
+
+    async def _create_resilient(self, prompt: Prompt) -> Any:
+        """
+        サーキットブレーカー・バックオフ付き再試行・ヘッジリクエストを組み合わせて呼び出す
+        """
+        async def attempt() -> Any:
+            if self.hedging_enabled:
+                return await call_hedged(lambda: self._create(prompt), self.latency, self.hedge_min_samples)
+            return await self._create(prompt)
+
+        return await call_with_retries(
+            attempt,
+            self.circuit_breaker,
+            self.max_retries,
+            self.backoff_base,
+            self.backoff_max,
+        )
+
+    async def _create(self, prompt: Prompt, **kwargs: Any) -> Any:
+        """
+        レート制限の枠を確保してからリクエストし、429の場合はRetry-Afterだけ待って再試行
+        """
+        estimated_tokens = estimate_prompt_tokens(prompt) + ESTIMATED_COMPLETION_TOKENS
+        for attempt in range(self.rate_limit_retries + 1):
+            if self.scheduler:
+                await self.scheduler.acquire_openai(estimated_tokens)
+            started = time.perf_counter()
+            try:
+                with span("GptClient.chat.completions", kind=SpanKind.CLIENT, attempt=attempt, stream=bool(kwargs.get("stream"))):
+                    raw = await self.client.chat.completions.with_raw_response.create(
+                        model=MODEL,
+                        messages=build_chat_messages(prompt),
+                        **kwargs,
+                    )
+                    set_attributes(request_id=raw.headers.get("x-request-id", ""))
+            except RateLimitError as e:
+                if not self.scheduler or attempt == self.rate_limit_retries:
+                    raise
+                self.scheduler.lane("openai").block_for(parse_retry_after(e.response.headers))
+                UPSTREAM_RETRIES.labels(service="openai", reason="rate_limited").inc()
+                continue
+            finally:
+                # ストリームの場合は応答ヘッダーを受け取るまでの時間
+                UPSTREAM_REQUEST_SECONDS.labels(service="openai", method="chat.completions").observe(
+                    time.perf_counter() - started
+                )
+            if self.scheduler:
+                self.scheduler.update_openai_limits(raw.headers)
+            return raw.parse()
+
+    async def warm_up(self) -> None:
+        """OpenAIへの接続を確立しておく"""
+        await self.client.models.list()
+
+    async def close(self) -> None:
+        """コネクションプールを閉じる"""
+        await self.client.close()
@@ -0,0 +1,157 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+import httpx
+from openai import APIConnectionError, InternalServerError
+from infrastructure.metrics.metrics import UPSTREAM_RETRIES
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        連続失敗が閾値を超えたら一定時間リクエストを即座に失敗させる
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.half_open_probe = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        """呼び出し可否を判定（openの間、またはhalf_openで試行中はCircuitOpenError）"""
+        state = self.state
+        if state == "open" or (state == "half_open" and self.half_open_probe):
+            raise CircuitOpenError("GPT circuit breaker is open.")
+        if state == "half_open":
+            self.half_open_probe = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.half_open_probe = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.half_open_probe = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"GPT circuit breaker opened after {self.failures} failures.")
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        """直近のレイテンシを保持し、パーセンタイルを計算"""
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def is_retryable(error: Exception) -> bool:
+    """接続エラー・タイムアウト・5xxは再試行可能"""
+    return isinstance(error, (APIConnectionError, InternalServerError, httpx.TransportError, asyncio.TimeoutError))
+
+
+def backoff_delay(attempt: int, base: float, max_delay: float) -> float:
+    """ジッター付き指数バックオフ（Full Jitter）"""
+    return random.uniform(0, min(max_delay, base * (2 ** attempt)))
+
+
+async def call_with_retries(
+        func: Callable[[], Awaitable[Any]],
+        breaker: CircuitBreaker,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+) -> Any:
+    """
+    サーキットブレーカーを確認しながら、再試行可能なエラーをバックオフ付きで再試行
+    """
+    for attempt in range(max_retries + 1):
+        breaker.before_call()
+        try:
+            result = await func()
+            breaker.record_success()
+            return result
+        except asyncio.CancelledError:
+            breaker.half_open_probe = False
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                # 上流は応答しているため障害としては数えない
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt, backoff_base, backoff_max)
+            logger.warning(f"Retrying GPT request in {delay:.2f}s (attempt {attempt + 1}/{max_retries}): {e}")
+            UPSTREAM_RETRIES.labels(service="openai", reason="error").inc()
+            await asyncio.sleep(delay)
+
+
+async def call_hedged(
+        func: Callable[[], Awaitable[Any]],
+        latency: LatencyTracker,
+        min_samples: int,
+        quantile: float = 0.95,
+) -> Any:
+    """
+    最初のリクエストがp95を超えても終わらなければ2本目を送り、先に成功した方を採用
+    """
+    hedge_delay = latency.percentile(quantile) if len(latency.samples) >= min_samples else None
+
+    async def timed() -> Any:
+        started = time.monotonic()
+        result = await func()
+        latency.record(time.monotonic() - started)
+        return result
+
+    primary = asyncio.create_task(timed())
+    if hedge_delay is None:
+        return await primary
+
+    done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+    if done:
+        return primary.result()
+
+    logger.info(f"Hedging GPT request after {hedge_delay:.2f}s.")
+    UPSTREAM_RETRIES.labels(service="openai", reason="hedge").inc()
+    pending = {primary, asyncio.create_task(timed())}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # 負けた方のリクエストはキャンセル
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,45 @@
+import asyncio
+import time
+from typing import Callable, List, Optional
+from infrastructure.metrics.metrics import EVENT_LOOP_LAG_MAX_SECONDS, EVENT_LOOP_LAG_SECONDS
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.5, warn_threshold: float = 0.5):
+        """
+        一定間隔でスリープし、予定より遅れて起きた時間をイベントループの遅延として記録
+        """
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.max_lag = 0.0
+        self.task: Optional[asyncio.Task] = None
+        self.listeners: List[Callable[[float], None]] = []
+
+    def add_listener(self, listener: Callable[[float], None]) -> None:
+        """計測した遅延（秒）を毎回受け取る関数を登録（ベンチマークでの分布の集計など）"""
+        self.listeners.append(listener)
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG_SECONDS.set(lag)
+            EVENT_LOOP_LAG_MAX_SECONDS.set(self.max_lag)
+            for listener in self.listeners:
+                listener(lag)
+            if lag >= self.warn_threshold:
+                logger.warning(f"Event loop was blocked for {lag * 1000:.0f}ms.")
+
+    async def close(self) -> None:
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
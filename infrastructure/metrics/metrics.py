@@ -0,0 +1,106 @@
+"""
+アプリケーションのメトリクス定義（prometheus_client）
+
+uvicorn --workers N で動かす場合は PROMETHEUS_MULTIPROC_DIR に空のディレクトリを指定して起動する。
+各ワーカーの値はそのディレクトリのファイルに書かれ、/metrics ではどのワーカーが応答しても全ワーカーを集計した値を返す。
+"""
+import os
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# 外部API呼び出しを想定した既定のバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Slack応答パイプライン
+SLACK_STAGE_SECONDS = Histogram(
+    "slack_reply_stage_seconds",
+    "Time spent in each stage of replying to a Slack mention.",
+    ["stage"],
+    buckets=DEFAULT_BUCKETS,
+)
+SLACK_IGNORED_EVENTS = Counter(
+    "slack_ignored_events_total",
+    "Slack events acknowledged without being processed.",
+    ["reason"],
+)
+SLACK_SOCKET_MODE_ENVELOPES = Counter(
+    "slack_socket_mode_envelopes_total",
+    "Envelopes received over Socket Mode connections.",
+    ["type"],
+)
+EVENT_QUEUE_WAIT_SECONDS = Histogram(
+    "event_queue_wait_seconds",
+    "Time events spent waiting in the queue before a worker picked them up.",
+    buckets=DEFAULT_BUCKETS,
+)
+
+# 外部API
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "upstream_request_seconds",
+    "Latency of individual requests to Slack, OpenAI and Google Sheets.",
+    ["service", "method"],
+    buckets=DEFAULT_BUCKETS,
+)
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total",
+    "Retried or hedged requests to upstream APIs.",
+    ["service", "reason"],
+)
+
+# GPT
+GPT_TOKENS = Counter(
+    "gpt_tokens_total",
+    "Tokens reported by the OpenAI API.",
+    ["kind"],
+)
+GPT_RESPONSE_CACHE_REQUESTS = Counter(
+    "gpt_response_cache_requests_total",
+    "Response cache lookups.",
+    ["result"],
+)
+
+# 実行状態
+# 複数ワーカーの場合、処理中の件数は稼働中のワーカーの合計、遅延は最も遅れているワーカーの値を返す
+IN_FLIGHT = Gauge(
+    "in_flight",
+    "Work currently in progress.",
+    ["work"],
+    multiprocess_mode="livesum",
+)
+EVENT_LOOP_LAG_SECONDS = Gauge(
+    "event_loop_lag_seconds",
+    "How late the event loop woke up for the most recent lag probe.",
+    multiprocess_mode="livemax",
+)
+EVENT_LOOP_LAG_MAX_SECONDS = Gauge(
+    "event_loop_lag_max_seconds",
+    "Largest event loop lag observed since startup.",
+    multiprocess_mode="livemax",
+)
+
+
+def record_gpt_usage(usage) -> None:
+    """OpenAIのusageをトークン数のカウンターに反映"""
+    if not usage:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    GPT_TOKENS.labels(kind="prompt").inc(usage.prompt_tokens or 0)
+    GPT_TOKENS.labels(kind="completion").inc(usage.completion_tokens or 0)
+    GPT_TOKENS.labels(kind="cached").inc(getattr(details, "cached_tokens", 0) or 0)
+
+
+def render() -> bytes:
+    """
+    Prometheusのテキスト形式で出力
+    マルチプロセスの場合はこのプロセスのメトリクスではなく、全ワーカーのファイルを集計する
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead(pid: int) -> None:
+    """終了するワーカーの稼働中のみ数えるゲージ（live*）を集計から外す"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
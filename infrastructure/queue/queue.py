@@ -0,0 +1,99 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from infrastructure.metrics.metrics import EVENT_QUEUE_WAIT_SECONDS, IN_FLIGHT
+from infrastructure.tracing.tracing import current_context, span
+from infrastructure.tracing.profiler import profile
+import logging
+
+logger = logging.getLogger(__name__)
+
+class EventQueue:
+    def __init__(
+            self,
+            handler: Callable[..., Awaitable[None]],
+            num_workers: int = 4,
+            max_size: int = 1000,
+    ):
+        """
+        プロセス内のジョブキューとワーカープールを初期化
+        """
+        self.handler = handler
+        self.num_workers = num_workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.workers: List[asyncio.Task] = []
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.last_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    async def start(self) -> None:
+        """ワーカーを起動"""
+        for worker_id in range(self.num_workers):
+            self.workers.append(asyncio.create_task(self._worker(worker_id)))
+        logger.info(f"Started {self.num_workers} event workers.")
+
+    def enqueue(self, **kwargs: Any) -> bool:
+        """ジョブをキューに追加。キューが満杯の場合はFalseを返す"""
+        try:
+            # 受信時のトレースをワーカー側の処理に引き継ぐ
+            self.queue.put_nowait((time.monotonic(), current_context(), kwargs))
+            IN_FLIGHT.labels(work="slack_event_queued").inc()
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"Event queue is full. Depth: {self.queue.qsize()}")
+            return False
+
+    async def _worker(self, worker_id: int) -> None:
+        """キューからジョブを取り出して処理"""
+        while True:
+            enqueued_at, trace_context, kwargs = await self.queue.get()
+            IN_FLIGHT.labels(work="slack_event_queued").dec()
+            wait_seconds = time.monotonic() - enqueued_at
+            self.last_wait_seconds = wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+            EVENT_QUEUE_WAIT_SECONDS.observe(wait_seconds)
+            self.in_flight += 1
+            IN_FLIGHT.labels(work="slack_event").inc()
+            logger.info(
+                f"Worker {worker_id} picked up job. Wait: {wait_seconds:.3f}s, Depth: {self.queue.qsize()}"
+            )
+            try:
+                with span("EventQueue.job", parent=trace_context, wait_seconds=wait_seconds):
+                    async with profile("event_queue_job"):
+                        await self.handler(**kwargs)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.exception(f"Worker {worker_id} failed to process job: {e}")
+            finally:
+                self.in_flight -= 1
+                IN_FLIGHT.labels(work="slack_event").dec()
+                self.queue.task_done()
+
+    async def shutdown(self, timeout: Optional[float] = None) -> None:
+        """残っているジョブを処理してからワーカーを停止"""
+        logger.info(f"Draining event queue. Depth: {self.queue.qsize()}, In flight: {self.in_flight}")
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Event queue drain timed out. Dropped: {self.queue.qsize()}")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        logger.info("Event workers stopped.")
+
+    def stats(self) -> Dict[str, Any]:
+        """キューの状態を取得"""
+        return {
+            "depth": self.queue.qsize(),
+            "max_size": self.queue.maxsize,
+            "workers": len(self.workers),
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "failed": self.failed,
+            "last_wait_seconds": round(self.last_wait_seconds, 3),
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+        }
@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import itertools
+import re
+import time
+from typing import Dict, List, Mapping, Optional, Tuple
+from domain.model.priority import Priority, request_priority
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Slack Web APIのメソッドごとのワークスペース全体のレート制限（1分あたりの回数）
+SLACK_METHOD_LIMITS = {
+    "auth.test": 100,            # Tier 4
+    "conversations.replies": 50,  # Tier 3
+    "chat.update": 50,           # Tier 3
+    "chat.postMessage": 300,     # Special（ワークスペース全体では毎分数百件まで）
+}
+DEFAULT_SLACK_METHOD_LIMIT = 20  # Tier 2
+
+# チャンネルへの書き込みは1チャンネルあたり毎秒1件程度に制限されるため、
+# これらのメソッドはワークスペース全体の枠に加えてチャンネルごとの枠も消費する（1分あたりの回数）
+SLACK_CHANNEL_LIMITS = {
+    "chat.postMessage": 60,
+    "chat.update": 60,
+}
+SLACK_CHANNEL_BURST_SECONDS = 3.0
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst_seconds: float = 10.0):
+        """
+        1分あたりの上限から補充レートと容量を決めるトークンバケットを初期化
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay_for(self, amount: float) -> float:
+        """amountを消費できるまでの待ち時間（秒）"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        wait = max(0.0, self.blocked_until - time.monotonic())
+        if self.tokens < amount:
+            wait = max(wait, (amount - self.tokens) / self.rate)
+        return wait
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def block_for(self, seconds: float) -> None:
+        """Retry-Afterなどで指定された時間、消費を止める"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def is_idle(self) -> bool:
+        """満タンまで補充済みで、止められてもいない（捨てても状態が失われない）"""
+        self._refill()
+        return self.tokens >= self.capacity and self.blocked_until <= time.monotonic()
+
+    def limit_remaining(self, remaining: float) -> None:
+        """上流から通知された残量を超えないようにする"""
+        self._refill()
+        self.tokens = min(self.tokens, remaining)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class RateLimitLane:
+    def __init__(self, name: str, buckets: Dict[str, TokenBucket]):
+        """
+        1つの上流（またはメソッド）に対する優先度付き待ち行列
+        """
+        self.name = name
+        self.buckets = buckets
+        self.waiters: List[Tuple[Priority, int, Dict[str, float], asyncio.Future]] = []
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.dispatcher: Optional[asyncio.Task] = None
+
+    async def acquire(self, costs: Mapping[str, float], priority: Priority) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), dict(costs), future))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self._dispatch())
+        self.wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    def try_acquire(self, costs: Mapping[str, float], headroom: float = 0.0) -> bool:
+        """
+        待たずに枠を確保できる場合のみ消費してTrueを返す
+        待ち行列がある場合は割り込まず、消費後も各バケットにheadroom分が残る場合に限る
+        """
+        if self.waiters:
+            return False
+        if any(self.buckets[name].delay_for(amount + headroom) > 0 for name, amount in costs.items()):
+            return False
+        for name, amount in costs.items():
+            self.buckets[name].consume(amount)
+        return True
+
+    def block_for(self, seconds: float, bucket_names: Optional[List[str]] = None) -> None:
+        for name in bucket_names or self.buckets:
+            self.buckets[name].block_for(seconds)
+        logger.warning(f"Rate limited on {self.name}. Pausing for {seconds:.1f}s.")
+
+    def depth(self) -> int:
+        return len(self.waiters)
+
+    async def _dispatch(self) -> None:
+        """優先度の高い順に、バケットに空きができたものから通す"""
+        while self.waiters:
+            self.wakeup.clear()
+            _, _, costs, future = self.waiters[0]
+            if future.done():
+                heapq.heappop(self.waiters)
+                continue
+
+            delay = max(self.buckets[name].delay_for(amount) for name, amount in costs.items())
+            if delay <= 0:
+                for name, amount in costs.items():
+                    self.buckets[name].consume(amount)
+                heapq.heappop(self.waiters)
+                future.set_result(None)
+                continue
+
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+class RateLimitScheduler:
+    def __init__(self, openai_rpm: float = 500, openai_tpm: float = 30000):
+        """
+        OpenAIとSlackのレート制限を共有で管理するスケジューラーを初期化
+        """
+        self.lanes: Dict[str, RateLimitLane] = {
+            "openai": RateLimitLane("openai", {
+                "requests": TokenBucket(openai_rpm),
+                "tokens": TokenBucket(openai_tpm),
+            }),
+        }
+
+    def lane(self, name: str) -> RateLimitLane:
+        lane = self.lanes.get(name)
+        if lane is None:
+            method = name.split(":", 1)[-1]
+            limit = SLACK_METHOD_LIMITS.get(method, DEFAULT_SLACK_METHOD_LIMIT)
+            lane = RateLimitLane(name, {"requests": TokenBucket(limit)})
+            self.lanes[name] = lane
+        return lane
+
+    def slack_lane(self, method: str, channel: Optional[str] = None) -> RateLimitLane:
+        """
+        Slackのメソッドの待ち行列
+        チャンネルごとに制限されるメソッドはチャンネル単位のレーンにし、
+        チャンネルごとの枠（channel）とワークスペース全体で共有する枠（requests）の両方を消費する
+        """
+        if channel is None or method not in SLACK_CHANNEL_LIMITS:
+            return self.lane(f"slack:{method}")
+        name = f"slack:{method}:{channel}"
+        lane = self.lanes.get(name)
+        if lane is None:
+            self._prune_idle_channel_lanes()
+            lane = RateLimitLane(name, {
+                "channel": TokenBucket(SLACK_CHANNEL_LIMITS[method], burst_seconds=SLACK_CHANNEL_BURST_SECONDS),
+                "requests": self.lane(f"slack:{method}").buckets["requests"],
+            })
+            self.lanes[name] = lane
+        return lane
+
+    def _prune_idle_channel_lanes(self) -> None:
+        """待ちがなく、チャンネルの枠が満タンに戻ったレーンを捨てる（チャンネル数だけレーンが増え続けないように）"""
+        for name, lane in list(self.lanes.items()):
+            bucket = lane.buckets.get("channel")
+            if bucket is not None and not lane.depth() and bucket.is_idle():
+                del self.lanes[name]
+
+    async def acquire_openai(self, estimated_tokens: int) -> None:
+        await self.lane("openai").acquire({"requests": 1, "tokens": estimated_tokens}, request_priority.get())
+
+    async def acquire_slack(self, method: str, channel: Optional[str] = None) -> None:
+        lane = self.slack_lane(method, channel)
+        await lane.acquire({name: 1 for name in lane.buckets}, request_priority.get())
+
+    def try_acquire_slack(self, method: str, channel: Optional[str] = None, headroom: float = 1.0) -> bool:
+        """省略してもよい呼び出し用（空きがなければ待たずにFalseを返す）"""
+        lane = self.slack_lane(method, channel)
+        return lane.try_acquire({name: 1 for name in lane.buckets}, headroom)
+
+    def block_slack(self, method: str, channel: Optional[str], seconds: float) -> None:
+        """
+        429のRetry-Afterの間、同じ枠への呼び出しを止める
+        チャンネル単位のレーンではそのチャンネルの枠だけを止め、他のチャンネルへの投稿は続ける
+        """
+        lane = self.slack_lane(method, channel)
+        lane.block_for(seconds, ["channel"] if "channel" in lane.buckets else None)
+
+    def update_openai_limits(self, headers: Mapping[str, str]) -> None:
+        """x-ratelimit-remaining-* ヘッダーから残量を反映"""
+        lane = self.lane("openai")
+        for bucket_name, header in (("requests", "x-ratelimit-remaining-requests"), ("tokens", "x-ratelimit-remaining-tokens")):
+            remaining = headers.get(header)
+            if remaining is not None:
+                try:
+                    lane.buckets[bucket_name].limit_remaining(float(remaining))
+                except ValueError:
+                    pass
+
+    def stats(self) -> Dict[str, int]:
+        return {name: lane.depth() for name, lane in self.lanes.items()}
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]], default: float = 1.0) -> float:
+    """Retry-After（秒）または x-ratelimit-reset-* （例: "1m30s", "250ms"）を秒に変換"""
+    if not headers:
+        return default
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    reset = headers.get("x-ratelimit-reset-requests") or headers.get("x-ratelimit-reset-tokens")
+    if reset:
+        seconds = 0.0
+        for number, unit in re.findall(r"([\d.]+)(ms|s|m|h)", reset):
+            seconds += float(number) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+        if seconds:
+            return seconds
+    return default
@@ -0,0 +1,59 @@
+import asyncio
+import zlib
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+from domain.repository.shared_state import SharedStateRepository
+from infrastructure.cache.ttl_cache import TTLCache
+
+
+class InMemorySharedState(SharedStateRepository):
+    def __init__(
+            self,
+            max_size: int = 10000,
+            ttl_seconds: float = 3600.0,
+            max_bytes: Optional[int] = None,
+            sizeof: Optional[Callable[[Any], int]] = None,
+            lock_shards: int = 64,
+    ):
+        """
+        プロセス内で完結する共有状態（単一プロセスで動かす場合の既定）
+        ロックはキーのハッシュで分割したasyncio.Lockを使う
+        （プロセスが落ちればロックも消えるため、保持時間の上限は設けず取得待ちのみtimeoutを適用する）
+        """
+        self.cache = TTLCache(max_size=max_size, ttl_seconds=ttl_seconds, max_bytes=max_bytes, sizeof=sizeof)
+        self.locks = [asyncio.Lock() for _ in range(lock_shards)]
+
+    async def get(self, key: str) -> Optional[str]:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: str, ttl_seconds: Optional[float] = None) -> None:
+        self.cache.set(key, value, ttl_seconds)
+
+    async def add(self, key: str, value: str, ttl_seconds: Optional[float] = None) -> bool:
+        return self.cache.add(key, value, ttl_seconds)
+
+    async def delete(self, key: str) -> None:
+        self.cache.pop(key)
+
+    async def incr(self, key: str, amount: int, ttl_seconds: Optional[float] = None) -> int:
+        value = int(self.cache.get(key, 0)) + amount
+        self.cache.set(key, str(value), ttl_seconds)
+        return value
+
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: float) -> AsyncIterator[None]:
+        lock = self.locks[zlib.crc32(name.encode()) % len(self.locks)]
+        try:
+            await asyncio.wait_for(lock.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Timed out waiting for lock: {name}")
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "entries": len(self.cache), "bytes": self.cache.total_bytes}
+
+    async def close(self) -> None:
+        self.cache.clear()
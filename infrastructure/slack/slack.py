@@ -1,50 +1,237 @@
-from typing import List
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from slack_sdk.web.async_client import AsyncWebClient
 from slack_sdk.errors import SlackApiError
+from opentelemetry.trace import SpanKind
 from domain.repository.slack import SlackRepository
 from domain.model.slack import SlackMessage
+from domain.repository.shared_state import SharedStateRepository
+from infrastructure.shared_state.memory import InMemorySharedState
+from infrastructure.ratelimit.scheduler import RateLimitScheduler, parse_retry_after
+from infrastructure.metrics.metrics import UPSTREAM_REQUEST_SECONDS, UPSTREAM_RETRIES
+from infrastructure.tracing.tracing import span
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ボットIDキャッシュを破棄すべき認証エラー
+AUTH_ERRORS = {"invalid_auth", "not_authed", "token_revoked", "token_expired", "account_inactive"}
 
 
 class SlackClient(SlackRepository):
-    def __init__(self, slack_token: str):
-        self.slack_client = AsyncWebClient(token=slack_token)
+    def __init__(
+            self,
+            slack_token: str,
+            thread_cache_max_threads: int = 1000,
+            thread_cache_ttl: float = 3600.0,
+            thread_cache_max_messages: int = 200,
+            scheduler: Optional[RateLimitScheduler] = None,
+            rate_limit_retries: int = 3,
+            base_url: Optional[str] = None,
+            thread_cache: Optional[SharedStateRepository] = None,
+    ):
+        if base_url:
+            self.slack_client = AsyncWebClient(token=slack_token, base_url=base_url)
+        else:
+            self.slack_client = AsyncWebClient(token=slack_token)
+        # チームIDごとのボットユーザーIDキャッシュ
+        self.bot_user_ids: Dict[Optional[str], str] = {}
+        # (channel, thread_ts) ごとのスレッド履歴キャッシュ（共有状態を渡せばプロセス間で共有）
+        self.thread_cache = thread_cache or InMemorySharedState(
+            max_size=thread_cache_max_threads,
+            ttl_seconds=thread_cache_ttl,
+        )
+        self.thread_cache_ttl = thread_cache_ttl
+        self.thread_cache_max_messages = thread_cache_max_messages
+        self.scheduler = scheduler
+        self.rate_limit_retries = rate_limit_retries
 
-    async def load_conversation_replies(self, channel_id: str, timestamp: str) -> List[SlackMessage]:
-        """指定したメッセージのスレッド内の返信を取得"""
-        messages = []
-        cursor = None
+    async def load_conversation_replies(
+            self,
+            channel_id: str,
+            timestamp: str,
+            latest_messages: Optional[List[Dict[str, Any]]] = None,
+    ) -> List[SlackMessage]:
+        """
+        指定したメッセージのスレッド内の返信を取得
+        キャッシュがある場合は最後にキャッシュしたメッセージより新しいものだけを取得する
+        """
+        key = f"thread:{channel_id}:{timestamp}"
+        cached = await self._get_cached_thread(key)
+        oldest = cached[-1]["ts"] if cached else None
 
         try:
-            while True:
-                response = await self.slack_client.conversations_replies(
-                    channel=channel_id,
-                    ts=timestamp,
-                    cursor=cursor
-                )
-                messages.extend(response.get("messages", []))
-                cursor = response.get("response_metadata", {}).get("next_cursor", None)
-
-                if not cursor:
-                    break
-            return messages
+            fetched = await self._fetch_replies(channel_id, timestamp, oldest)
         except SlackApiError as e:
+            self._invalidate_on_auth_error(e)
             raise RuntimeError(f"Failed self.slack_client.conversations_replies: {e.response['error']}")
 
-    async def get_bot_user_id(self) -> str:
-        """SlackボットのユーザーIDを取得"""
+        # イベントで受け取ったメッセージは取得結果に反映されていなくても追加する
+        for latest_message in latest_messages or []:
+            if latest_message.get("ts"):
+                fetched.append(latest_message)
+
+        messages = self._merge_messages(cached or [], fetched)
+        await self._set_cached_thread(key, messages)
+        return messages
+
+    async def _get_cached_thread(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """キャッシュ済みのスレッド履歴を取得（共有状態が使えない場合はキャッシュなしとして扱う）"""
+        try:
+            cached = await self.thread_cache.get(key)
+        except Exception as e:
+            logger.warning(f"Failed to read thread cache: {e}")
+            return None
+        return json.loads(cached) if cached else None
+
+    async def _set_cached_thread(self, key: str, messages: List[Dict[str, Any]]) -> None:
         try:
-            response = await self.slack_client.auth_test()
-            return response.get("user_id", "")
+            await self.thread_cache.set(key, json.dumps(messages, ensure_ascii=False), self.thread_cache_ttl)
+        except Exception as e:
+            logger.warning(f"Failed to write thread cache: {e}")
+
+    async def _fetch_replies(self, channel_id: str, timestamp: str, oldest: Optional[str]) -> List[Dict[str, Any]]:
+        """スレッドの返信をページングしながら取得（oldest指定時はそれより新しいもののみ）"""
+        messages = []
+        cursor = None
+
+        while True:
+            params = {"channel": channel_id, "ts": timestamp, "cursor": cursor}
+            if oldest:
+                params.update({"oldest": oldest, "inclusive": False})
+            response = await self._call("conversations.replies", self.slack_client.conversations_replies, **params)
+            messages.extend(response.get("messages", []))
+            cursor = response.get("response_metadata", {}).get("next_cursor", None)
+
+            if not cursor:
+                break
+        return messages
+
+    async def _call(self, method: str, func: Callable[..., Awaitable[Any]], best_effort: bool = False, **kwargs: Any) -> Any:
+        """
+        メソッド（chat.postMessageなどはチャンネル）ごとのレート制限枠を確保してから呼び出し、429の場合はRetry-Afterだけ待って再試行
+        best_effortの場合は枠が空いていなければ呼び出さずにNoneを返し、429でも再試行しない
+        """
+        channel = kwargs.get("channel")
+        for attempt in range(self.rate_limit_retries + 1):
+            if self.scheduler:
+                if not best_effort:
+                    await self.scheduler.acquire_slack(method, channel)
+                elif not self.scheduler.try_acquire_slack(method, channel):
+                    return None
+            try:
+                with UPSTREAM_REQUEST_SECONDS.labels(service="slack", method=method).time(), \
+                        span(f"SlackClient.{method}", kind=SpanKind.CLIENT, attempt=attempt):
+                    return await func(**kwargs)
+            except SlackApiError as e:
+                if not self.scheduler or e.response.status_code != 429:
+                    raise
+                self.scheduler.block_slack(method, channel, parse_retry_after(e.response.headers))
+                if best_effort or attempt == self.rate_limit_retries:
+                    raise
+                UPSTREAM_RETRIES.labels(service="slack", reason="rate_limited").inc()
+
+    def _merge_messages(self, cached: List[Dict[str, Any]], fetched: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """tsで重複を除いて時系列順に結合し、末尾のみを保持"""
+        by_ts = {message["ts"]: message for message in cached}
+        for message in fetched:
+            if message.get("ts"):
+                by_ts[message["ts"]] = {
+                    "ts": message["ts"],
+                    "text": message.get("text", ""),
+                    "user": message.get("user") or message.get("bot_id", ""),
+                }
+        merged = sorted(by_ts.values(), key=lambda message: float(message["ts"]))
+        return merged[-self.thread_cache_max_messages:]
+
+    async def get_bot_user_id(self, team_id: Optional[str] = None) -> str:
+        """SlackボットのユーザーIDを取得（キャッシュがあればそれを使う）"""
+        cached = self.bot_user_ids.get(team_id)
+        if cached:
+            return cached
+        try:
+            response = await self._call("auth.test", self.slack_client.auth_test)
+            bot_user_id = response.get("user_id", "")
+            if bot_user_id:
+                self.remember_bot_user_id(response.get("team_id"), bot_user_id)
+                self.bot_user_ids[team_id] = bot_user_id
+            return bot_user_id
         except SlackApiError as e:
+            self._invalidate_on_auth_error(e)
             raise RuntimeError(f"Failed self.slack_client.auth_test: {e.response['error']}")
 
-    async def create_new_message(self, channel_id: str, timestamp: str, message: str) -> None:
-        """ボットによる新しいメッセージを作成"""
+    async def warm_up(self) -> None:
+        """接続を確立し、ボットユーザーIDをキャッシュしておく"""
+        await self.get_bot_user_id()
+
+    def remember_bot_user_id(self, team_id: Optional[str], bot_user_id: str) -> None:
+        """イベントのauthorizationsなどから得たボットユーザーIDをキャッシュ"""
+        if bot_user_id:
+            self.bot_user_ids[team_id] = bot_user_id
+
+    def _invalidate_on_auth_error(self, error: SlackApiError) -> None:
+        """認証エラーの場合はボットIDキャッシュを破棄"""
+        if error.response.get("error") in AUTH_ERRORS:
+            logger.warning("Slack auth error detected. Clearing bot user ID cache.")
+            self.bot_user_ids.clear()
+
+    async def create_new_message(self, channel_id: str, timestamp: str, message: str) -> Optional[str]:
+        """ボットによる新しいメッセージを作成し、そのtsを返す"""
         try:
-            await self.slack_client.chat_postMessage(
+            response = await self._call(
+                "chat.postMessage",
+                self.slack_client.chat_postMessage,
                 channel=channel_id,
                 text=message,
                 thread_ts=timestamp
             )
+            return response.get("ts")
         except SlackApiError as e:
+            self._invalidate_on_auth_error(e)
             raise RuntimeError(f"Failed self.slack_client.chat_postMessage: {e.response['error']}")
+
+    async def update_message(
+            self,
+            channel_id: str,
+            message_ts: str,
+            message: str,
+            thread_ts: Optional[str] = None,
+            best_effort: bool = False,
+    ) -> bool:
+        """
+        ボットが投稿したメッセージを更新し、更新したかを返す
+        best_effortの場合はレート制限の枠が空いていなければ更新しない（途中経過の表示用）
+        thread_tsを指定した場合は、キャッシュ済みのスレッド履歴の同じメッセージも書き換える
+        """
+        try:
+            response = await self._call(
+                "chat.update",
+                self.slack_client.chat_update,
+                best_effort=best_effort,
+                channel=channel_id,
+                ts=message_ts,
+                text=message,
+            )
+        except SlackApiError as e:
+            self._invalidate_on_auth_error(e)
+            raise RuntimeError(f"Failed self.slack_client.chat_update: {e.response['error']}")
+        if response is None:
+            return False
+        if thread_ts:
+            await self._replace_cached_message(channel_id, thread_ts, message_ts, message)
+        return True
+
+    async def _replace_cached_message(self, channel_id: str, thread_ts: str, message_ts: str, text: str) -> None:
+        """
+        編集前（プレースホルダーや途中経過）の本文がキャッシュに残らないよう、確定した本文に置き換える
+        キャッシュはts以降の差分しか取得しないため、ここで置き換えないと編集後の本文を取り込めない
+        """
+        key = f"thread:{channel_id}:{thread_ts}"
+        cached = await self._get_cached_thread(key)
+        if not cached:
+            return
+        for message in cached:
+            if message["ts"] == message_ts:
+                message["text"] = text
+                await self._set_cached_thread(key, cached)
+                return
@@ -0,0 +1,88 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from slack_sdk.socket_mode.aiohttp import SocketModeClient
+from slack_sdk.socket_mode.request import SocketModeRequest
+from slack_sdk.socket_mode.response import SocketModeResponse
+from slack_sdk.web.async_client import AsyncWebClient
+from infrastructure.metrics.metrics import SLACK_SOCKET_MODE_ENVELOPES
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (ペイロード, リトライ回数, リトライ理由) を受け取り、受け付けたかを返すイベントの処理
+EventCallback = Callable[[Dict[str, Any], int, Optional[str]], Awaitable[bool]]
+
+
+class SocketModeReceiver:
+    def __init__(
+            self,
+            app_token: str,
+            on_event: EventCallback,
+            connections: int = 2,
+            base_url: Optional[str] = None,
+            ping_interval: float = 10.0,
+            max_connect_interval: float = 60.0,
+    ):
+        """
+        Socket ModeのWebSocket接続でイベントを受信する
+        イベントを受け付けて（重複排除・キューへの登録）からエンベロープに応答し、
+        受け付けられなかった場合は応答せずにSlackの再送を待つ
+        接続を複数張ると、Slackはそのいずれか1本にイベントを配信する（切断中も他の接続で受信できる）
+        """
+        self.on_event = on_event
+        self.max_connect_interval = max_connect_interval
+        self.clients: List[SocketModeClient] = []
+        for _ in range(connections):
+            if base_url:
+                web_client = AsyncWebClient(token=app_token, base_url=base_url)
+            else:
+                web_client = AsyncWebClient(token=app_token)
+            client = SocketModeClient(
+                app_token=app_token,
+                web_client=web_client,
+                auto_reconnect_enabled=True,
+                ping_interval=ping_interval,
+            )
+            client.socket_mode_request_listeners.append(self._on_request)
+            self.clients.append(client)
+        self.tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """接続は起動を待たずにバックグラウンドで確立する"""
+        self.tasks = [asyncio.create_task(self._connect(index, client)) for index, client in enumerate(self.clients)]
+
+    async def _connect(self, index: int, client: SocketModeClient) -> None:
+        """
+        最初の接続が確立するまで間隔を空けながら再試行する
+        接続後の切断・再接続はSocketModeClientが行う
+        """
+        interval = 1.0
+        while True:
+            try:
+                await client.connect()
+                logger.info(f"Socket Mode connection {index} established.")
+                return
+            except Exception as e:
+                logger.warning(f"Failed to open Socket Mode connection {index}: {e}. Retrying in {interval:.0f}s.")
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, self.max_connect_interval)
+
+    async def _on_request(self, client: SocketModeClient, request: SocketModeRequest) -> None:
+        SLACK_SOCKET_MODE_ENVELOPES.labels(type=request.type).inc()
+        if request.type == "events_api":
+            # キューへの登録までは数ミリ秒で終わるため、結果を見てから応答する
+            if not await self.on_event(request.payload, request.retry_attempt or 0, request.retry_reason):
+                logger.warning(f"Leaving Socket Mode envelope {request.envelope_id} unacknowledged for redelivery.")
+                return
+        try:
+            await client.send_socket_mode_response(SocketModeResponse(envelope_id=request.envelope_id))
+        except Exception as e:
+            # 応答できなかった場合はSlackが再送するが、重複排除で一度だけ処理される
+            logger.warning(f"Failed to acknowledge Socket Mode envelope {request.envelope_id}: {e}")
+
+    async def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for client in self.clients:
+            await client.close()
@@ -0,0 +1,89 @@
+import asyncio
+from typing import Dict, List, Optional
+from domain.repository.spreadsheet import SpreadsheetRepository
+from domain.model.spreadsheet import SpreadsheetData
+import logging
+
+logger = logging.getLogger(__name__)
+
+class UsageLedger(SpreadsheetRepository):
+    def __init__(
+            self,
+            repository: SpreadsheetRepository,
+            flush_interval: float = 10.0,
+            max_pending: int = 50,
+    ):
+        """
+        使用量の更新をメモリに溜め、一定間隔または件数でまとめて書き込むライトビハインドレジャー
+        書き込みは定期フラッシュのタスクだけが行い、件数が閾値を超えた場合はそのタスクを起こす
+        """
+        self.repository = repository
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending: Dict[str, SpreadsheetData] = {}
+        self.flushing: Dict[str, SpreadsheetData] = {}
+        self.flush_lock = asyncio.Lock()
+        self.flush_requested = asyncio.Event()
+        self.flush_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """定期フラッシュを開始"""
+        self.flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def close(self) -> None:
+        """定期フラッシュを停止し、残りを書き込む"""
+        if self.flush_task:
+            self.flush_task.cancel()
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+            self.flush_task = None
+        await self.flush()
+
+    async def get_spreadsheet_data_by_slack_id(self, user_id: str) -> Optional[SpreadsheetData]:
+        """
+        未書き込みの使用量があればそれを、なければスプレッドシートのデータを返す
+        """
+        data = self.pending.get(user_id) or self.flushing.get(user_id)
+        if data:
+            return data.copy()
+        return await self.repository.get_spreadsheet_data_by_slack_id(user_id)
+
+    async def update_spreadsheet(self, update: SpreadsheetData) -> None:
+        """
+        使用量をメモリに記録し、件数が閾値を超えたら定期フラッシュを待たずに書き込ませる
+        """
+        self.pending[update.user_id] = update.copy()
+        if len(self.pending) >= self.max_pending:
+            self.flush_requested.set()
+
+    async def update_spreadsheet_batch(self, updates: List[SpreadsheetData]) -> None:
+        for update in updates:
+            await self.update_spreadsheet(update)
+
+    async def flush(self) -> None:
+        """溜まった使用量をまとめてスプレッドシートに書き込む"""
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            self.flushing, self.pending = self.pending, {}
+            try:
+                await self.repository.update_spreadsheet_batch(list(self.flushing.values()))
+                logger.info(f"Flushed {len(self.flushing)} usage records to spreadsheet.")
+            except Exception as e:
+                logger.error(f"Failed to flush usage records: {e}")
+                # フラッシュ中に更新されていないものを戻す
+                for user_id, data in self.flushing.items():
+                    self.pending.setdefault(user_id, data)
+            finally:
+                self.flushing = {}
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception(f"Usage ledger flush failed: {e}")
@@ -1,49 +1,80 @@
+import asyncio
 import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import ValidationError
-from typing import Optional, List, Dict, Any
+from typing import Any, Callable, Dict, List, Optional
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from opentelemetry.trace import SpanKind
 from domain.repository.spreadsheet import SpreadsheetRepository
 from domain.model.spreadsheet import SpreadsheetData
+from infrastructure.metrics.metrics import UPSTREAM_REQUEST_SECONDS
+from infrastructure.tracing.tracing import span
 
 logger = logging.getLogger(__name__)
 
-DATA_RANGE = "Activity!A:E"
+SHEET_NAME = "Activity"
+DATA_RANGE = f"{SHEET_NAME}!A:E"
 
 class SpreadsheetClient(SpreadsheetRepository):
-    def __init__(self, spreadsheet_id: str, credentials):
+    def __init__(
+            self,
+            spreadsheet_id: str,
+            credentials,
+            max_workers: int = 4,
+            request_timeout: float = 10.0,
+            api_endpoint: Optional[str] = None,
+    ):
         """
         Google Sheets APIクライアントを初期化
         """
         if not credentials:
             raise ValueError("Google credentials must be provided.")
         self.spreadsheet_id = spreadsheet_id
-        self.service = build("sheets", "v4", credentials=credentials)
+        self.credentials = credentials
+        self.request_timeout = request_timeout
+        self.api_endpoint = api_endpoint
+        # Sheets APIのサービスは初回利用時に同梱の静的ディスカバリー文書から生成する
+        self._service = None
+        self.service_lock = threading.Lock()
+        # イベントループをブロックしないよう、スレッド数を制限したExecutorでAPIを呼び出す
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheets")
+        # httplib2.Httpはスレッドセーフではないため、スレッドごとに永続接続を保持
+        self.thread_local = threading.local()
+        # ユーザーID → 行番号のインデックス
+        self.row_index: Dict[str, int] = {}
+        self.last_row = 0
+        self.index_loaded = False
+        self.index_lock = asyncio.Lock()
 
     async def get_spreadsheet_data_by_slack_id(self, user_id: str) -> Optional[SpreadsheetData]:
         """
         SlackユーザーIDに基づいてスプレッドシートデータを取得
         """
         try:
-            values = await self._read_spreadsheet(DATA_RANGE)
-
-            for row in values:
-                if len(row) < 5 or not all(row[:5]):
-                    logger.warning(f"Invalid row detected: {row}")
-                    continue
-
-                if row[0] == user_id:
-                    try:
-                        return SpreadsheetData.construct(
-                            user_id=row[0],
-                            total_usage=int(row[1]),
-                            last_used_at=row[2] if row[2] else None,
-                            tokens_usage=int(row[3]),
-                            daily_tokens_usage=int(row[4]),
-                            total_tokens_usage=int(row[3]),
-                        )
-                    except ValidationError as e:
-                        logger.error(f"Error parsing row: {row}, Error: {e}")
+            row = await self._read_user_row(user_id)
+            if row is None:
+                return None
+
+            if len(row) < 5 or not all(row[:5]):
+                logger.warning(f"Invalid row detected: {row}")
+                return None
+
+            try:
+                return SpreadsheetData.construct(
+                    user_id=row[0],
+                    total_usage=int(row[1]),
+                    last_used_at=row[2] if row[2] else None,
+                    tokens_usage=int(row[3]),
+                    daily_tokens_usage=int(row[4]),
+                    total_tokens_usage=int(row[3]),
+                )
+            except ValidationError as e:
+                logger.error(f"Error parsing row: {row}, Error: {e}")
         except HttpError as e:
             logger.error(f"Error reading spreadsheet: {e}")
         except Exception as e:
@@ -54,15 +85,36 @@ class SpreadsheetClient(SpreadsheetRepository):
         """
         スプレッドシートのデータを更新
         """
+        await self.update_spreadsheet_batch([update])
+
+    async def update_spreadsheet_batch(self, updates: List[SpreadsheetData]) -> None:
+        """
+        複数ユーザーの行をまとめて更新
+        新規ユーザーはvalues.appendで末尾に追加し、Sheets側が割り当てた行番号をインデックスに記録する
+        （行番号をプロセス内で決めないため、複数のワーカー・インスタンスが同じ行に書き込むことはない）
+        """
         try:
-            values = await self._read_spreadsheet(DATA_RANGE)
-            user_data = self._map_spreadsheet_data(values)
             now = self._get_current_time()
+            # インデックスにないユーザーがいても、追加分の読み取りはバッチ全体で1回にする
+            if not self.index_loaded:
+                await self._refresh_row_index(full=True)
+            if any(update.user_id not in self.row_index for update in updates):
+                await self._refresh_row_index()
+            data = []
+            new_users = []
+            new_rows = []
+            for update in updates:
+                values = self._convert_activity_data(update, now)
+                row_number = self.row_index.get(update.user_id)
+                if row_number is None:
+                    new_users.append(update.user_id)
+                    new_rows.append(values)
+                else:
+                    data.append({"range": self._row_range(row_number), "values": [values]})
 
-            user_data[update.user_id] = self._convert_activity_data(update, now)
-            updated_values = self._map_to_sorted_slice(user_data)
-
-            await self._write_spreadsheet(DATA_RANGE, updated_values)
+            await self._batch_write_spreadsheet(data)
+            if new_rows:
+                await self._append_rows(new_users, new_rows)
         except HttpError as e:
             logger.error(f"Error updating spreadsheet: {e}")
             raise
@@ -70,16 +122,132 @@ class SpreadsheetClient(SpreadsheetRepository):
             logger.error(f"Failed to update spreadsheet: {e}")
             raise
 
+    async def _read_user_row(self, user_id: str) -> Optional[List[Any]]:
+        """
+        インデックスを使ってユーザーの行だけを読み取る
+        """
+        for _ in range(2):
+            row_number = await self._find_row(user_id)
+            if row_number is None:
+                return None
+            values = await self._read_spreadsheet(self._row_range(row_number))
+            row = values[0] if values else []
+            if row and row[0] == user_id:
+                return row
+            # 行がずれている場合はインデックスを作り直す
+            logger.warning(f"Row index is stale for user {user_id}. Rebuilding.")
+            await self._refresh_row_index(full=True)
+        return None
+
+    async def _find_row(self, user_id: str) -> Optional[int]:
+        """
+        ユーザーIDの行番号を取得。見つからない場合は追加分のみインデックスを更新
+        """
+        if not self.index_loaded:
+            await self._refresh_row_index(full=True)
+        row_number = self.row_index.get(user_id)
+        if row_number is None:
+            await self._refresh_row_index()
+            row_number = self.row_index.get(user_id)
+        return row_number
+
+    async def _refresh_row_index(self, full: bool = False) -> None:
+        """
+        A列を読み取りインデックスを構築（full=Falseの場合は最終行以降のみ）
+        """
+        async with self.index_lock:
+            if full:
+                self.row_index = {}
+                self.last_row = 0
+            start_row = self.last_row + 1
+            values = await self._read_spreadsheet(f"{SHEET_NAME}!A{start_row}:A")
+            for offset, row in enumerate(values):
+                if row and row[0]:
+                    self.row_index.setdefault(row[0], start_row + offset)
+            self.last_row = max(self.last_row, start_row + len(values) - 1)
+            self.index_loaded = True
+
+    def _record_appended_rows(self, user_ids: List[str], updated_range: str) -> None:
+        """
+        values.appendの応答の範囲（例: "Activity!A12:E14"）から追加された行番号をインデックスに記録
+        """
+        match = re.search(r"![A-Z]+(\d+)", updated_range)
+        if not match:
+            # 次に参照した時点でA列から読み直す
+            logger.warning(f"Unexpected appended range: {updated_range!r}")
+            return
+        first_row = int(match.group(1))
+        for offset, user_id in enumerate(user_ids):
+            self.row_index.setdefault(user_id, first_row + offset)
+        # 間に他のプロセスが追加した行がある場合は、次の読み直しで拾えるよう読み取り済みの位置を進めない
+        if first_row == self.last_row + 1:
+            self.last_row += len(user_ids)
+
+    @staticmethod
+    def _row_range(row_number: int) -> str:
+        return f"{SHEET_NAME}!A{row_number}:E{row_number}"
+
+    @property
+    def service(self):
+        """Sheets APIのサービスを取得（未生成であれば生成）"""
+        if self._service is None:
+            with self.service_lock:
+                if self._service is None:
+                    self._service = build(
+                        "sheets",
+                        "v4",
+                        credentials=self.credentials,
+                        static_discovery=True,
+                        cache_discovery=False,
+                        client_options={"api_endpoint": self.api_endpoint} if self.api_endpoint else None,
+                    )
+        return self._service
+
+    async def warm_up(self) -> None:
+        """サービスの生成と行インデックスの構築を先に済ませ、接続を確立しておく"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, lambda: self.service)
+        await self._refresh_row_index(full=True)
+
+    async def close(self) -> None:
+        """Executorを停止"""
+        self.executor.shutdown(wait=True)
+
+    def _get_http(self) -> AuthorizedHttp:
+        """
+        現在のスレッド用の認証済みHTTP接続を取得
+        """
+        http = getattr(self.thread_local, "http", None)
+        if http is None:
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=self.request_timeout))
+            self.thread_local.http = http
+        return http
+
+    async def _execute(self, method: str, build_request: Callable[[Any], Any]) -> Dict[str, Any]:
+        """
+        APIリクエストの生成と実行をExecutor上でタイムアウト付きで行う
+        build_requestはspreadsheets().values()を受け取ってリクエストを返す
+        （サービスが未生成の場合の生成やその待ち合わせもExecutor上で行い、イベントループを止めない）
+        """
+        loop = asyncio.get_running_loop()
+
+        def execute() -> Dict[str, Any]:
+            request = build_request(self.service.spreadsheets().values())
+            return request.execute(http=self._get_http())
+
+        with UPSTREAM_REQUEST_SECONDS.labels(service="sheets", method=method).time(), \
+                span(f"SpreadsheetClient.{method}", kind=SpanKind.CLIENT):
+            return await asyncio.wait_for(loop.run_in_executor(self.executor, execute), timeout=self.request_timeout)
+
     async def _read_spreadsheet(self, read_range: str) -> List[List[Any]]:
         """
         スプレッドシートからデータを読み取る
         """
         try:
-            sheet = self.service.spreadsheets()
-            result = sheet.values().get(
+            result = await self._execute("sheets.spreadsheets.values.get", lambda values: values.get(
                 spreadsheetId=self.spreadsheet_id,
                 range=read_range,
-            ).execute()
+            ))
             return result.get("values", [])
         except Exception as e:
             logger.error(f"Failed to read spreadsheet: {e}")
@@ -90,29 +258,49 @@ class SpreadsheetClient(SpreadsheetRepository):
         スプレッドシートにデータを書き込む
         """
         try:
-            sheet = self.service.spreadsheets()
             body = {"values": values}
-            sheet.values().update(
+            await self._execute("sheets.spreadsheets.values.update", lambda sheet_values: sheet_values.update(
                 spreadsheetId=self.spreadsheet_id,
                 range=write_range,
                 valueInputOption="RAW",
                 body=body,
-            ).execute()
+            ))
         except Exception as e:
             logger.error(f"Failed to write spreadsheet: {e}")
             raise
 
-    def _map_spreadsheet_data(self, values: List[List[Any]]) -> Dict[str, List[Any]]:
+    async def _batch_write_spreadsheet(self, data: List[Dict[str, Any]]) -> None:
         """
-        スプレッドシートデータを辞書形式にマッピング
+        複数の範囲に1回のリクエストで書き込む
         """
-        user_data = {}
-        for row in values:
-            if len(row) < 5:
-                continue
-            user_id = row[0]
-            user_data[user_id] = row
-        return user_data
+        if not data:
+            return
+        try:
+            body = {"valueInputOption": "RAW", "data": data}
+            await self._execute("sheets.spreadsheets.values.batchUpdate", lambda values: values.batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body=body,
+            ))
+        except Exception as e:
+            logger.error(f"Failed to batch write spreadsheet: {e}")
+            raise
+
+    async def _append_rows(self, user_ids: List[str], rows: List[List[Any]]) -> None:
+        """
+        新規ユーザーの行を末尾に追加（行の挿入はSheets側で行われるため、同時に追加しても重ならない）
+        """
+        try:
+            result = await self._execute("sheets.spreadsheets.values.append", lambda values: values.append(
+                spreadsheetId=self.spreadsheet_id,
+                range=DATA_RANGE,
+                valueInputOption="RAW",
+                insertDataOption="INSERT_ROWS",
+                body={"values": rows},
+            ))
+        except Exception as e:
+            logger.error(f"Failed to append to spreadsheet: {e}")
+            raise
+        self._record_appended_rows(user_ids, result.get("updates", {}).get("updatedRange", ""))
 
     def _convert_activity_data(self, update: SpreadsheetData, now: str) -> List[Any]:
         """
@@ -126,13 +314,6 @@ class SpreadsheetClient(SpreadsheetRepository):
             str(update.daily_tokens_usage),
         ]
 
-    def _map_to_sorted_slice(self, user_data: Dict[str, List[Any]]) -> List[List[Any]]:
-        """
-        ユーザーデータをソート済みのリスト形式に変換
-        """
-        sorted_data = sorted(user_data.values(), key=lambda x: x[0])
-        return sorted_data
-
     def _get_current_time(self) -> str:
         from datetime import datetime, timezone
         return datetime.now(timezone.utc).isoformat()
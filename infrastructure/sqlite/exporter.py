@@ -0,0 +1,53 @@
+import asyncio
+from typing import Optional
+from domain.repository.spreadsheet import SpreadsheetRepository
+from infrastructure.sqlite.sqlite import SqliteUsageClient
+import logging
+
+logger = logging.getLogger(__name__)
+
+class UsageExporter:
+    def __init__(
+            self,
+            source: SqliteUsageClient,
+            target: SpreadsheetRepository,
+            interval: float = 60.0,
+    ):
+        """
+        SQLiteの使用量を定期的にスプレッドシートへ反映するエクスポーターを初期化
+        """
+        self.source = source
+        self.target = target
+        self.interval = interval
+        self.export_lock = asyncio.Lock()
+        self.export_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """定期エクスポートを開始"""
+        self.export_task = asyncio.create_task(self._export_periodically())
+
+    async def close(self) -> None:
+        """定期エクスポートを停止し、残りを反映"""
+        if self.export_task:
+            self.export_task.cancel()
+            await asyncio.gather(self.export_task, return_exceptions=True)
+            self.export_task = None
+        await self.export()
+
+    async def export(self) -> None:
+        """未反映の行をまとめてスプレッドシートに書き込む"""
+        async with self.export_lock:
+            rows = await self.source.fetch_unexported()
+            if not rows:
+                return
+            try:
+                await self.target.update_spreadsheet_batch([data for data, _ in rows])
+                await self.source.mark_exported({data.user_id: revision for data, revision in rows})
+                logger.info(f"Exported {len(rows)} usage records to spreadsheet.")
+            except Exception as e:
+                logger.error(f"Failed to export usage records: {e}")
+
+    async def _export_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.export()
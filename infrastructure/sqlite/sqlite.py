@@ -0,0 +1,175 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from domain.repository.spreadsheet import SpreadsheetRepository
+from domain.model.spreadsheet import SpreadsheetData
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    user_id TEXT PRIMARY KEY,
+    total_usage INTEGER NOT NULL DEFAULT 0,
+    last_used_at TEXT,
+    tokens_usage INTEGER NOT NULL DEFAULT 0,
+    daily_tokens_usage INTEGER NOT NULL DEFAULT 0,
+    total_tokens_usage INTEGER NOT NULL DEFAULT 0,
+    revision INTEGER NOT NULL DEFAULT 0,
+    exported_revision INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID
+"""
+
+UPSERT = """
+INSERT INTO usage (user_id, total_usage, last_used_at, tokens_usage, daily_tokens_usage, total_tokens_usage, revision)
+VALUES (?, ?, ?, ?, ?, ?, 1)
+ON CONFLICT(user_id) DO UPDATE SET
+    total_usage = excluded.total_usage,
+    last_used_at = excluded.last_used_at,
+    tokens_usage = excluded.tokens_usage,
+    daily_tokens_usage = excluded.daily_tokens_usage,
+    total_tokens_usage = excluded.total_tokens_usage,
+    revision = usage.revision + 1
+"""
+
+COLUMNS = "user_id, total_usage, last_used_at, tokens_usage, daily_tokens_usage, total_tokens_usage"
+
+
+class SqliteUsageClient(SpreadsheetRepository):
+    def __init__(self, path: str, fallback: Optional[SpreadsheetRepository] = None, busy_timeout: float = 5.0):
+        """
+        SQLite(WALモード)を使った使用量リポジトリを初期化
+        fallbackが指定された場合、未登録ユーザーはfallbackから読み込んで取り込む
+        SQLiteの呼び出しは専用の1スレッドで順に実行する（他のプロセスの書き込みロックをbusy_timeout秒待つ間もイベントループを止めない）
+        """
+        self.path = path
+        self.fallback = fallback
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self.conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(SCHEMA)
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def get_spreadsheet_data_by_slack_id(self, user_id: str) -> Optional[SpreadsheetData]:
+        """
+        ユーザーIDに基づいて使用量を取得
+        """
+        data = await self._run(self._select, user_id)
+        if data:
+            return data
+
+        if self.fallback:
+            data = await self.fallback.get_spreadsheet_data_by_slack_id(user_id)
+            if data:
+                await self._run(self._import, data)
+                return data
+        return None
+
+    async def update_spreadsheet(self, update: SpreadsheetData) -> None:
+        """
+        使用量を更新
+        """
+        await self.update_spreadsheet_batch([update])
+
+    async def update_spreadsheet_batch(self, updates: List[SpreadsheetData]) -> None:
+        """
+        複数ユーザーの使用量を1トランザクションで更新
+        """
+        await self._run(self._upsert_many, [self._to_params(update) for update in updates])
+
+    async def add_token_usage(self, user_id: str, tokens: int) -> Optional[SpreadsheetData]:
+        """
+        日次リセットを含めて使用量を1トランザクションで加算
+        書き込みロック（BEGIN IMMEDIATE）の間に読み込むため、他のプロセスの加算と競合しない
+        """
+        # 未登録ユーザーはfallbackから取り込んでから加算する
+        await self.get_spreadsheet_data_by_slack_id(user_id)
+        return await self._run(self._add_token_usage, user_id, tokens)
+
+    async def fetch_unexported(self) -> List[Tuple[SpreadsheetData, int]]:
+        """
+        スプレッドシートに未反映の行とそのリビジョンを取得
+        """
+        rows = await self._run(
+            lambda: self.conn.execute(
+                f"SELECT {COLUMNS}, revision FROM usage WHERE revision > exported_revision"
+            ).fetchall()
+        )
+        return [(self._to_model(row[:6]), row[6]) for row in rows]
+
+    async def mark_exported(self, revisions: Dict[str, int]) -> None:
+        """
+        スプレッドシートに反映済みのリビジョンを記録
+        """
+        await self._run(
+            self.conn.executemany,
+            "UPDATE usage SET exported_revision = ? WHERE user_id = ?",
+            [(revision, user_id) for user_id, revision in revisions.items()],
+        )
+
+    async def close(self) -> None:
+        await self._run(self.conn.close)
+        self.executor.shutdown(wait=False)
+
+    def _select(self, user_id: str) -> Optional[SpreadsheetData]:
+        row = self.conn.execute(f"SELECT {COLUMNS} FROM usage WHERE user_id = ?", (user_id,)).fetchone()
+        return self._to_model(row) if row else None
+
+    def _upsert_many(self, params: List[Tuple[Any, ...]]) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(UPSERT, params)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _add_token_usage(self, user_id: str, tokens: int) -> SpreadsheetData:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            data = self._select(user_id) or SpreadsheetData.create_new(user_id)
+            data.reset_daily_usage_if_needed()
+            data.add_token_usage(tokens)
+            self.conn.execute(UPSERT, self._to_params(data))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return data
+
+    def _import(self, data: SpreadsheetData) -> None:
+        """
+        fallbackから読み込んだデータを反映済みとして取り込む
+        """
+        self.conn.execute(
+            "INSERT OR IGNORE INTO usage "
+            f"({COLUMNS}, revision, exported_revision) VALUES (?, ?, ?, ?, ?, ?, 0, 0)",
+            self._to_params(data),
+        )
+
+    @staticmethod
+    def _to_params(data: SpreadsheetData) -> Tuple[Any, ...]:
+        return (
+            data.user_id,
+            data.total_usage,
+            data.last_used_at,
+            data.tokens_usage,
+            data.daily_tokens_usage,
+            data.total_tokens_usage,
+        )
+
+    @staticmethod
+    def _to_model(row: Tuple[Any, ...]) -> SpreadsheetData:
+        return SpreadsheetData.construct(
+            user_id=row[0],
+            total_usage=row[1],
+            last_used_at=row[2],
+            tokens_usage=row[3],
+            daily_tokens_usage=row[4],
+            total_tokens_usage=row[5],
+        )
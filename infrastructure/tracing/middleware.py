@@ -0,0 +1,23 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable
+from infrastructure.tracing.profiler import profile
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class ProfilerMiddleware:
+    def __init__(self, app: Callable[[Scope, Receive, Send], Awaitable[None]], exclude_paths: Iterable[str] = ()):
+        """
+        HTTPリクエストごとにプロファイルのスコープを作るASGIミドルウェア
+        ストリーミング応答も本文の送信が終わるまでを1つのリクエストとして扱う
+        """
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+        async with profile(f"{scope['method']} {scope['path']}"):
+            await self.app(scope, receive, send)
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import re
+import time
+from collections import Counter
+from typing import Any, List, Optional
+from infrastructure.tracing.tracing import current_trace_id
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def await_stack(task: asyncio.Task) -> List[str]:
+    """
+    タスクが待機しているコルーチンの連なりを外側から順に返す
+    （Task.get_stack() は中断中のコルーチンの最も外側のフレームしか返さないため、cr_await をたどる）
+    """
+    frames = []
+    awaitable: Any = task.get_coro()
+    while awaitable is not None:
+        if isinstance(awaitable, asyncio.Task):
+            awaitable = awaitable.get_coro()
+            continue
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None) or getattr(awaitable, "ag_frame", None)
+        if frame is None:
+            break
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        awaitable = (
+            getattr(awaitable, "cr_await", None)
+            or getattr(awaitable, "gi_yieldfrom", None)
+            or getattr(awaitable, "ag_await", None)
+        )
+    return frames
+
+
+class _Profile:
+    def __init__(self, profiler: "SlowRequestProfiler", name: str):
+        self.profiler = profiler
+        self.name = name
+        self.samples: Counter = Counter()
+        self.started = 0.0
+        self.sampler: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> None:
+        self.started = time.perf_counter()
+        self.sampler = asyncio.create_task(self._sample(asyncio.current_task()))
+
+    async def _sample(self, target: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(self.profiler.interval)
+            stack = await_stack(target)
+            if stack:
+                self.samples[";".join(stack)] += 1
+
+    async def __aexit__(self, *exc_info: Any) -> bool:
+        self.sampler.cancel()
+        await asyncio.gather(self.sampler, return_exceptions=True)
+        elapsed = time.perf_counter() - self.started
+        if elapsed >= self.profiler.threshold and self.samples:
+            path = await asyncio.to_thread(self.profiler.write, self.name, elapsed, self.samples)
+            logger.warning(f"Slow request '{self.name}' took {elapsed:.2f}s. Profile written to {path}")
+        return False
+
+
+class SlowRequestProfiler:
+    def __init__(self, threshold: float = 10.0, interval: float = 0.05, output_dir: str = "profiles"):
+        """
+        処理中のタスクが待機している箇所を一定間隔で記録し、閾値を超えた処理のみプロファイルを保存
+        出力はflamegraph.pl / speedscopeで読めるcollapsed stack形式
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.output_dir = output_dir
+
+    def profile(self, name: str) -> _Profile:
+        return _Profile(self, name)
+
+    def write(self, name: str, elapsed: float, samples: Counter) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        trace_id = current_trace_id() or "untraced"
+        # "GET /gpt/stream" などのリクエスト名をファイル名に使える形にする
+        safe_name = re.sub(r"[^\w.-]+", "_", name).strip("_")
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_name}-{trace_id}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# {name} took {elapsed:.3f}s, sampled every {self.interval}s\n")
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+class _NoopProfile:
+    async def __aenter__(self) -> None:
+        return None
+
+    async def __aexit__(self, *exc_info: Any) -> bool:
+        return False
+
+
+_NOOP = _NoopProfile()
+_profiler: Optional[SlowRequestProfiler] = None
+
+
+def set_profiler(profiler: Optional[SlowRequestProfiler]) -> None:
+    global _profiler
+    _profiler = profiler
+
+
+def profile(name: str) -> Any:
+    """
+    async with文で使うプロファイルのスコープ（無効な場合は何もしない）
+    """
+    profiler = _profiler
+    if profiler is None:
+        return _NOOP
+    return profiler.profile(name)
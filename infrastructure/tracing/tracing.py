@@ -0,0 +1,74 @@
+"""
+OpenTelemetryのトレース設定と、アプリケーション内でスパンを作るためのヘルパー
+
+create_tracer_provider で作ったプロバイダーを登録するまではOpenTelemetry APIの何もしない実装が使われるため、
+トレースが無効な間の計装の負荷はほぼない。
+HTTPの受信（FastAPI）と送信（httpx）のスパン・W3C traceparent の受け渡しは各instrumentationが行う。
+"""
+from typing import Any, Optional, TextIO
+from opentelemetry import context, trace
+from opentelemetry.context import Context
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind
+
+_tracer = trace.get_tracer("slack-gpt-bot")
+
+
+class FileSpanExporter(ConsoleSpanExporter):
+    def __init__(self, path: str):
+        """スパンを1行1件のJSONとしてファイルに追記（エクスポートはBatchSpanProcessorのスレッドで行われる）"""
+        self.file: TextIO = open(path, "a", encoding="utf-8")
+        super().__init__(out=self.file, formatter=self._format)
+
+    @staticmethod
+    def _format(span: ReadableSpan) -> str:
+        return span.to_json(indent=None) + "\n"
+
+    def shutdown(self) -> None:
+        self.file.close()
+
+
+def create_tracer_provider(
+        exporter: SpanExporter,
+        service_name: str,
+        sample_rate: float = 1.0,
+        flush_interval: float = 5.0,
+) -> TracerProvider:
+    """
+    スパンをバッファに溜め、一定間隔でまとめてエクスポートするプロバイダー
+    サンプリングはトレースの起点（traceparentのないリクエストなど）で判定し、子スパンと下流のサービスはその結果に従う
+    """
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(sample_rate)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter, schedule_delay_millis=flush_interval * 1000))
+    return provider
+
+
+def span(name: str, kind: SpanKind = SpanKind.INTERNAL, parent: Optional[Context] = None, **attributes: Any) -> Any:
+    """
+    スパンのスコープを返す（with文で使う）
+    parentを指定しない場合は現在のスパンの子になる
+    """
+    return _tracer.start_as_current_span(name, context=parent, kind=kind, attributes=attributes)
+
+
+def current_context() -> Context:
+    """現在のトレースのコンテキスト（キューに積む処理などへ引き継ぐ）"""
+    return context.get_current()
+
+
+def current_trace_id() -> Optional[str]:
+    span_context = trace.get_current_span().get_span_context()
+    if not span_context.is_valid or not span_context.trace_flags.sampled:
+        return None
+    return trace.format_trace_id(span_context.trace_id)
+
+
+def set_attributes(**attributes: Any) -> None:
+    """現在のスパンに属性を追加（記録中のスパンがなければ何もしない）"""
+    trace.get_current_span().set_attributes(attributes)
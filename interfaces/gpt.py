@@ -1,16 +1,24 @@
-from fastapi import HTTPException
+import asyncio
+import json
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional, Tuple
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
 from usecase.gpt import GptUsecase
+from infrastructure.metrics.metrics import IN_FLIGHT
 import logging
 
 logger = logging.getLogger(__name__)
 
 class GptHandler:
-    def __init__(self, gpt_usecase: GptUsecase):
+    def __init__(self, gpt_usecase: GptUsecase, batch_concurrency: int = 5, batch_max_prompts: int = 100):
         self.gpt_usecase = gpt_usecase
+        self.batch_concurrency = batch_concurrency
+        self.batch_max_prompts = batch_max_prompts
 
-    async def create_completion(self, prompt: str):
+    async def create_completion(self, prompt: str, cache_control: Optional[str] = None):
         try:
-            result = await self.gpt_usecase.generate_text(prompt)
+            result = await self.gpt_usecase.generate_text(prompt, cache_control)
             if result is None:
                 raise HTTPException(status_code=500, detail="Failed self.gpt_usecase.generate_text")
             return result
@@ -19,3 +27,89 @@ class GptHandler:
         except Exception as e:
             logger.error(f"Failed self.gpt_usecase.generate_text: {e}")
             raise HTTPException(status_code=500, detail="Unexpected error occurred.")
+
+    def cache_stats(self) -> dict:
+        """応答キャッシュの統計を取得"""
+        response_cache = self.gpt_usecase.response_cache
+        return response_cache.stats() if response_cache else {"enabled": False}
+
+    async def create_completion_stream(self, prompt: str, request: Request, format: str = "sse") -> StreamingResponse:
+        """
+        生成されたテキストをSSEまたはNDJSONで逐次返す
+        """
+        if format not in ("sse", "ndjson"):
+            raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+        media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+        return StreamingResponse(
+            self._stream_events(prompt, request, format),
+            media_type=media_type,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def _stream_events(self, prompt: str, request: Request, format: str) -> AsyncIterator[str]:
+        try:
+            async with aclosing(self.gpt_usecase.generate_text_stream(prompt)) as stream:
+                async for text in stream:
+                    # クライアントが切断したら上流のリクエストも止める
+                    if await request.is_disconnected():
+                        logger.info("Client disconnected. Stopping GPT stream.")
+                        return
+                    yield self._format_event(format, "message", {"text": text})
+            yield self._format_event(format, "done", {})
+        except Exception as e:
+            logger.error(f"Failed self.gpt_usecase.generate_text_stream: {e}")
+            yield self._format_event(format, "error", {"detail": "Unexpected error occurred."})
+
+    async def create_completion_batch(
+            self,
+            prompts: List[str],
+            request: Request,
+            cache_control: Optional[str] = None,
+    ) -> StreamingResponse:
+        """
+        複数のプロンプトを同時実行数を制限しながら処理し、完了した順にNDJSONで返す
+        各行には入力のインデックスを付け、失敗したプロンプトはその行だけをエラーにする
+        """
+        if not prompts:
+            raise HTTPException(status_code=400, detail="prompts must not be empty.")
+        if len(prompts) > self.batch_max_prompts:
+            raise HTTPException(status_code=413, detail=f"Too many prompts (max {self.batch_max_prompts}).")
+        return StreamingResponse(
+            self._stream_batch(prompts, request, cache_control),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def _stream_batch(self, prompts: List[str], request: Request, cache_control: Optional[str]) -> AsyncIterator[str]:
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def generate(index: int, prompt: str) -> Tuple[int, Optional[str]]:
+            async with semaphore:
+                with IN_FLIGHT.labels(work="gpt_batch_item").track_inprogress():
+                    return index, await self.gpt_usecase.generate_text(prompt, cache_control)
+
+        tasks = [asyncio.create_task(generate(index, prompt)) for index, prompt in enumerate(prompts)]
+        succeeded = 0
+        try:
+            for future in asyncio.as_completed(tasks):
+                index, text = await future
+                # クライアントが切断したら残りのプロンプトは実行しない
+                if await request.is_disconnected():
+                    logger.info("Client disconnected. Cancelling remaining batch prompts.")
+                    return
+                if text is None:
+                    yield self._format_event("ndjson", "error", {"index": index, "detail": "Failed to generate text."})
+                else:
+                    succeeded += 1
+                    yield self._format_event("ndjson", "result", {"index": index, "text": text})
+            yield self._format_event("ndjson", "done", {"succeeded": succeeded, "failed": len(prompts) - succeeded})
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    def _format_event(format: str, event: str, data: dict) -> str:
+        if format == "sse":
+            return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        return json.dumps({"event": event, **data}, ensure_ascii=False) + "\n"
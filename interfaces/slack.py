@@ -1,37 +1,94 @@
+from typing import Optional
 from fastapi import Request
 from fastapi.responses import JSONResponse
 from slack_sdk.errors import SlackApiError
+from opentelemetry.trace import SpanKind
 from usecase.slack import SlackUsecase
+from infrastructure.queue.queue import EventQueue
+from infrastructure.cache.dedup import EventDeduplicator
+from infrastructure.metrics.metrics import SLACK_IGNORED_EVENTS
+from infrastructure.tracing.tracing import set_attributes, span
 import logging
 
 logger = logging.getLogger(__name__)
 
 class SlackHandler:
-    def __init__(self, slack_usecase: SlackUsecase):
+    def __init__(
+            self,
+            slack_usecase: SlackUsecase,
+            event_queue: EventQueue,
+            deduplicator: EventDeduplicator,
+    ):
         self.slack_usecase = slack_usecase
+        self.event_queue = event_queue
+        self.deduplicator = deduplicator
 
     async def handle_event(self, request: Request):
-        try:
-            # リトライリクエストの処理
-            retry_num = request.headers.get("X-Slack-Retry-Num")
-            if retry_num:
-                logger.info(f"Retry detected. Count: {retry_num}")
-                return JSONResponse(content={"status": "ignored"}, status_code=200)
+        """Events API（HTTP）で受信したイベントを処理"""
+        with span("SlackHandler.handle_event", transport="http"):
+            try:
+                # リトライリクエストはログのみ（未処理なら再処理する）
+                retry_num = request.headers.get("X-Slack-Retry-Num")
+                if retry_num:
+                    reason = request.headers.get("X-Slack-Retry-Reason")
+                    logger.info(f"Retry detected. Count: {retry_num}, Reason: {reason}")
+
+                # リクエストボディの読み取り
+                event_data = await request.json()
+            except Exception as e:
+                logger.exception(f"Unexpected error: {e}")
+                return JSONResponse(
+                    content={"status": "error", "detail": "Unexpected server error"},
+                    status_code=500,
+                )
+            return await self.handle_payload(event_data, retry_num)
 
-            # リクエストボディの読み取り
-            event_data = await request.json()
+    async def handle_socket_mode_event(self, event_data: dict, retry_attempt: int, retry_reason: Optional[str]) -> bool:
+        """
+        Socket Modeで受信したイベントを処理し、受け付けたかを返す
+        受け付けなかった場合（キューが満杯など）はエンベロープに応答せず、Slackに再送させる
+        """
+        with span("SlackHandler.handle_socket_mode_event", kind=SpanKind.SERVER, transport="socket_mode"):
+            if retry_attempt:
+                logger.info(f"Retry detected. Count: {retry_attempt}, Reason: {retry_reason}")
+            response = await self.handle_payload(event_data, str(retry_attempt) if retry_attempt else None)
+            if response.status_code != 200:
+                logger.warning(
+                    f"Socket Mode event {event_data.get('event_id')} was not processed: {response.body.decode()}"
+                )
+            return response.status_code == 200
+
+    async def handle_payload(self, event_data: dict, retry_num: Optional[str] = None) -> JSONResponse:
+        """受信経路によらず、イベントのペイロードを検証してキューに登録"""
+        try:
             event = event_data.get("event", {})
 
             # イベントデータの抽出
             extracted_data = self.extract_event_data(event, event_data)
+            set_attributes(
+                event_id=extracted_data["event_id"] or "",
+                event_type=extracted_data["event_type"] or "",
+                channel=extracted_data["channel"] or "",
+                retry_num=retry_num or "0",
+            )
 
             # 無効なメッセージを無視
             if not extracted_data["user"] or extracted_data["bot_id"]:
                 logger.info("Message from bot or invalid user. Ignoring.")
+                SLACK_IGNORED_EVENTS.labels(reason="bot_or_invalid_user").inc()
                 return JSONResponse(content={"status": "no content"}, status_code=200)
 
+            # 重複イベントを無視
+            event_key = extracted_data["event_id"]
+            if not await self.deduplicator.mark(event_key):
+                SLACK_IGNORED_EVENTS.labels(reason="duplicate").inc()
+                return JSONResponse(content={"status": "ignored"}, status_code=200)
+
             # イベントの処理
-            return await self.process_event(extracted_data)
+            response = await self.process_event(extracted_data)
+            if response.status_code != 200:
+                await self.deduplicator.forget(event_key)
+            return response
 
         except SlackApiError as e:
             error_detail = e.response.get('error', 'Unknown error')
@@ -50,13 +107,16 @@ class SlackHandler:
     def extract_event_data(self, event: dict, event_data: dict) -> dict:
         """イベントから必要なデータを抽出"""
         return {
+            "event_id": event_data.get("event_id") or event.get("client_msg_id"),
             "event_type": event.get("type"),
             "user": event.get("user"),
             "bot_id": event.get("bot_id"),
             "channel": event.get("channel"),
             "timestamp": self.get_thread_timestamp(event.get("ts"), event.get("thread_ts")),
+            "message_ts": event.get("ts"),
             "channel_type": event.get("channel_type"),
             "text": event.get("text", ""),
+            "team_id": event_data.get("team_id"),
             "authorizations": event_data.get("authorizations", [{}]),
         }
 
@@ -68,28 +128,45 @@ class SlackHandler:
         user = extracted_data["user"]
         text = extracted_data["text"]
         channel_type = extracted_data["channel_type"]
+        bot_user_id = extracted_data["authorizations"][0].get("user_id")
 
         # DMの場合、メンションがなくても処理する
         if channel_type == "im":
             logger.info(f"Processing direct message in channel {channel}.")
-            await self.slack_usecase.process_messages(channel, timestamp, user)
-            return JSONResponse(content={"status": "ok"}, status_code=200)
+            return self.enqueue_messages(extracted_data)
 
         # メンションが含まれていない場合、返信しない
-        if f"<@{extracted_data['authorizations'][0].get('user_id')}>" not in text:
+        if f"<@{bot_user_id}>" not in text:
             logger.info(f"No mention detected in message. Ignoring message in channel {channel}.")
+            SLACK_IGNORED_EVENTS.labels(reason="no_mention").inc()
             return JSONResponse(content={"status": "no content"}, status_code=200)
 
         # app_mention の処理
         if event_type == "app_mention":
             logger.info(f"Processing app_mention in channel {channel}.")
-            await self.slack_usecase.process_messages(channel, timestamp, user)
-            return JSONResponse(content={"status": "ok"}, status_code=200)
+            return self.enqueue_messages(extracted_data)
 
         # その他のメッセージタイプは無視
         logger.info(f"Unsupported message event type: {event_type}, channel type: {channel_type}.")
+        SLACK_IGNORED_EVENTS.labels(reason="unsupported_type").inc()
         return JSONResponse(content={"status": "no content"}, status_code=200)
 
+    def enqueue_messages(self, extracted_data: dict) -> JSONResponse:
+        """メッセージ処理をキューに登録し、即座に応答する"""
+        if not self.event_queue.enqueue(
+            channel_id=extracted_data["channel"],
+            timestamp=extracted_data["timestamp"],
+            user_id=extracted_data["user"],
+            team_id=extracted_data["team_id"],
+            bot_user_id=extracted_data["authorizations"][0].get("user_id"),
+            message_ts=extracted_data["message_ts"],
+            text=extracted_data["text"],
+            channel_type=extracted_data["channel_type"],
+        ):
+            SLACK_IGNORED_EVENTS.labels(reason="queue_full").inc()
+            return JSONResponse(content={"status": "busy"}, status_code=503)
+        return JSONResponse(content={"status": "ok"}, status_code=200)
+
     @staticmethod
     def get_thread_timestamp(timestamp: str, thread_timestamp: str) -> str:
         """スレッドタイムスタンプの取得"""
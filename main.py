@@ -1,10 +1,34 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
 from fastapi import FastAPI
 import uvicorn
+from opentelemetry import trace
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
 import logging
 from config.load_env import Config
 from infrastructure.gpt.gpt import GptClient
 from infrastructure.slack.slack import SlackClient
+from infrastructure.slack.socket_mode import SocketModeReceiver
 from infrastructure.spreadsheet.spreadsheet import SpreadsheetClient
+from infrastructure.spreadsheet.ledger import UsageLedger
+from infrastructure.sqlite.sqlite import SqliteUsageClient
+from infrastructure.sqlite.exporter import UsageExporter
+from infrastructure.queue.queue import EventQueue
+from infrastructure.ratelimit.scheduler import RateLimitScheduler
+from infrastructure.cache.dedup import EventDeduplicator
+from infrastructure.cache.response_cache import ResponseCache
+from infrastructure.shared_state.memory import InMemorySharedState
+from infrastructure.shared_state.redis import RedisSharedState
+from infrastructure.metrics.metrics import mark_process_dead
+from infrastructure.metrics.loop_lag import LoopLagMonitor
+from infrastructure.tracing.tracing import FileSpanExporter, create_tracer_provider
+from infrastructure.tracing.profiler import SlowRequestProfiler, set_profiler
+from infrastructure.tracing.middleware import ProfilerMiddleware
+from domain.model.gpt import load_tokenizer
 from usecase.gpt import GptUsecase
 from usecase.slack import SlackUsecase
 from interfaces.gpt import GptHandler
@@ -12,6 +36,7 @@ from interfaces.slack import SlackHandler
 from router.gpt import create_gpt_router
 from router.slack import create_slack_router
 from router.ping import router as ping_router
+from router.metrics import router as metrics_router
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,6 +46,42 @@ app = FastAPI(
     description="This is a Slack GPT bot built with FastAPI using DDD principles.",
     version="1.0.0"
 )
+app.include_router(ping_router)
+app.include_router(metrics_router)
+# プロファイラーが無効な間は何もしない（死活監視とメトリクスの取得は対象外）
+app.add_middleware(ProfilerMiddleware, exclude_paths=("/ping", "/metrics"))
+if Config.TRACING_ENABLED:
+    # 受信したリクエスト（traceparentがあれば呼び出し元のトレースを引き継ぐ）とhttpxでの送信（OpenAI）にスパンを作る
+    # ミドルウェアは起動前に追加する必要があるため、トレーサーの登録（on_startup）より先に計装しておく
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="/ping,/metrics", exclude_spans=["receive", "send"])
+    HTTPXClientInstrumentor().instrument()
+
+
+@contextmanager
+def startup_phase(name: str):
+    """起動処理の各フェーズの所要時間を記録"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.info(f"Startup phase '{name}' took {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+async def warm_up():
+    """接続の確立やキャッシュの準備を並行して行う"""
+    async def run(name, coro):
+        started = time.perf_counter()
+        try:
+            await coro
+            logger.info(f"Warm-up '{name}' took {(time.perf_counter() - started) * 1000:.1f}ms")
+        except Exception as e:
+            logger.warning(f"Warm-up '{name}' failed: {e}")
+
+    await asyncio.gather(
+        run("gpt", app.state.gpt_client.warm_up()),
+        run("slack", app.state.slack_client.warm_up()),
+        run("spreadsheet", app.state.spreadsheet_client.warm_up()),
+    )
 
 @app.on_event("startup")
 async def on_startup():
@@ -28,34 +89,191 @@ async def on_startup():
     logger.info("Starting Slack GPT Bot API...")
     try:
         # 環境変数の検証とGoogle認証情報のロード
-        Config.validate()
-        Config.load_google_credentials()
+        with startup_phase("config"):
+            Config.validate()
+            Config.load_google_credentials()
         logger.info("Environment variables and Google credentials successfully validated.")
 
+        # トークナイザー（見積もりが文字数にすり替わらないよう、読み込めなければ起動を止める）
+        with startup_phase("tokenizer"):
+            if Config.TOKENIZER_PATH:
+                await asyncio.to_thread(load_tokenizer, Config.TOKENIZER_PATH)
+            else:
+                logger.warning("TOKENIZER_PATH is empty. Token counts are estimated from character counts.")
+
+        # Shared State
+        with startup_phase("shared_state"):
+            if Config.SHARED_STATE_BACKEND == "redis":
+                app.state.redis_state = RedisSharedState(
+                    Config.REDIS_URL,
+                    key_prefix=Config.REDIS_KEY_PREFIX,
+                    max_connections=Config.REDIS_MAX_CONNECTIONS,
+                    timeout=Config.REDIS_TIMEOUT,
+                )
+                dedup_state = thread_state = usage_state = cache_state = app.state.redis_state
+            else:
+                # 用途ごとに件数上限を分ける
+                dedup_state = InMemorySharedState(max_size=Config.EVENT_DEDUP_MAX_SIZE)
+                thread_state = InMemorySharedState(max_size=Config.THREAD_CACHE_MAX_THREADS)
+                usage_state = InMemorySharedState(lock_shards=Config.USAGE_LOCK_SHARDS)
+                cache_state = InMemorySharedState(
+                    max_size=Config.GPT_CACHE_MAX_ENTRIES,
+                    max_bytes=Config.GPT_CACHE_MAX_BYTES,
+                    sizeof=lambda value: len(value.encode("utf-8")),
+                )
+
         # Infrastructure
-        app.state.gpt_client = GptClient(api_key=Config.OPENAI_API_KEY)
-        app.state.slack_client = SlackClient(slack_token=Config.SLACK_BOT_TOKEN)
-        app.state.spreadsheet_client = SpreadsheetClient(
-            spreadsheet_id=Config.SPREADSHEET_ID,
-            credentials=Config.CREDENTIALS
-        )
+        with startup_phase("infrastructure"):
+            app.state.rate_limit_scheduler = RateLimitScheduler(
+                openai_rpm=Config.OPENAI_RPM,
+                openai_tpm=Config.OPENAI_TPM,
+            )
+            app.state.gpt_client = GptClient(
+                api_key=Config.OPENAI_API_KEY,
+                max_connections=Config.GPT_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.GPT_MAX_KEEPALIVE_CONNECTIONS,
+                max_concurrency=Config.GPT_MAX_CONCURRENCY,
+                connect_timeout=Config.GPT_CONNECT_TIMEOUT,
+                read_timeout=Config.GPT_READ_TIMEOUT,
+                scheduler=app.state.rate_limit_scheduler,
+                rate_limit_retries=Config.RATE_LIMIT_RETRIES,
+                deadline=Config.GPT_DEADLINE,
+                max_retries=Config.GPT_MAX_RETRIES,
+                backoff_base=Config.GPT_BACKOFF_BASE,
+                backoff_max=Config.GPT_BACKOFF_MAX,
+                hedging_enabled=Config.GPT_HEDGING_ENABLED,
+                hedge_min_samples=Config.GPT_HEDGE_MIN_SAMPLES,
+                circuit_failure_threshold=Config.GPT_CIRCUIT_FAILURE_THRESHOLD,
+                circuit_reset_timeout=Config.GPT_CIRCUIT_RESET_TIMEOUT,
+                base_url=Config.OPENAI_BASE_URL,
+            )
+            app.state.slack_client = SlackClient(
+                slack_token=Config.SLACK_BOT_TOKEN,
+                thread_cache_max_threads=Config.THREAD_CACHE_MAX_THREADS,
+                thread_cache_ttl=Config.THREAD_CACHE_TTL,
+                thread_cache_max_messages=Config.THREAD_CACHE_MAX_MESSAGES,
+                scheduler=app.state.rate_limit_scheduler,
+                rate_limit_retries=Config.RATE_LIMIT_RETRIES,
+                base_url=Config.SLACK_API_URL,
+                thread_cache=thread_state,
+            )
+            app.state.spreadsheet_client = SpreadsheetClient(
+                spreadsheet_id=Config.SPREADSHEET_ID,
+                credentials=Config.CREDENTIALS,
+                max_workers=Config.SHEETS_MAX_WORKERS,
+                request_timeout=Config.SHEETS_TIMEOUT,
+                api_endpoint=Config.SHEETS_API_ENDPOINT,
+            )
+            if Config.USAGE_BACKEND == "sqlite":
+                app.state.sqlite_client = SqliteUsageClient(
+                    path=Config.SQLITE_PATH,
+                    fallback=app.state.spreadsheet_client,
+                )
+                app.state.usage_exporter = UsageExporter(
+                    app.state.sqlite_client,
+                    app.state.spreadsheet_client,
+                    interval=Config.USAGE_EXPORT_INTERVAL,
+                )
+                await app.state.usage_exporter.start()
+                app.state.usage_repository = app.state.sqlite_client
+            else:
+                app.state.usage_ledger = UsageLedger(
+                    app.state.spreadsheet_client,
+                    flush_interval=Config.USAGE_FLUSH_INTERVAL,
+                    max_pending=Config.USAGE_FLUSH_MAX_PENDING,
+                )
+                await app.state.usage_ledger.start()
+                app.state.usage_repository = app.state.usage_ledger
 
         # Usecase
-        app.state.gpt_usecase = GptUsecase(app.state.gpt_client)
-        app.state.slack_usecase = SlackUsecase(
-            app.state.slack_client,
-            app.state.gpt_client,
-            app.state.spreadsheet_client
-        )
+        with startup_phase("usecase"):
+            response_cache = None
+            if Config.GPT_CACHE_ENABLED:
+                response_cache = ResponseCache(cache_state, ttl_seconds=Config.GPT_CACHE_TTL)
+            app.state.gpt_usecase = GptUsecase(app.state.gpt_client, response_cache)
+            app.state.slack_usecase = SlackUsecase(
+                app.state.slack_client,
+                app.state.gpt_client,
+                app.state.usage_repository,
+                shared_state=usage_state,
+                usage_lock_timeout=Config.USAGE_LOCK_TIMEOUT,
+                stream_replies=Config.SLACK_STREAM_REPLIES,
+                stream_update_interval=Config.SLACK_STREAM_UPDATE_INTERVAL,
+                debounce_window=Config.SLACK_DEBOUNCE_WINDOW,
+            )
+
+        # Event Queue
+        with startup_phase("event_queue"):
+            app.state.event_queue = EventQueue(
+                handler=app.state.slack_usecase.process_messages,
+                num_workers=Config.EVENT_WORKERS,
+                max_size=Config.EVENT_QUEUE_MAX_SIZE,
+            )
+            await app.state.event_queue.start()
+
+        # Metrics
+        with startup_phase("metrics"):
+            app.state.loop_lag_monitor = LoopLagMonitor(
+                interval=Config.LOOP_LAG_INTERVAL,
+                warn_threshold=Config.LOOP_LAG_WARN_THRESHOLD,
+            )
+            await app.state.loop_lag_monitor.start()
+
+        # Tracing
+        if Config.TRACING_ENABLED:
+            with startup_phase("tracing"):
+                if Config.TRACING_EXPORTER == "otlp":
+                    exporter = OTLPSpanExporter(endpoint=Config.TRACING_OTLP_ENDPOINT)
+                else:
+                    exporter = FileSpanExporter(Config.TRACING_FILE_PATH)
+                app.state.tracer_provider = create_tracer_provider(
+                    exporter,
+                    service_name=Config.TRACING_SERVICE_NAME,
+                    sample_rate=Config.TRACING_SAMPLE_RATE,
+                    flush_interval=Config.TRACING_FLUSH_INTERVAL,
+                )
+                trace.set_tracer_provider(app.state.tracer_provider)
+        if Config.PROFILER_ENABLED:
+            set_profiler(SlowRequestProfiler(
+                threshold=Config.PROFILER_THRESHOLD,
+                interval=Config.PROFILER_INTERVAL,
+                output_dir=Config.PROFILER_OUTPUT_DIR,
+            ))
 
         # Interfaces
-        gpt_handler = GptHandler(app.state.gpt_usecase)
-        slack_handler = SlackHandler(app.state.slack_usecase)
+        gpt_handler = GptHandler(
+            app.state.gpt_usecase,
+            batch_concurrency=Config.GPT_BATCH_CONCURRENCY,
+            batch_max_prompts=Config.GPT_BATCH_MAX_PROMPTS,
+        )
+        slack_handler = SlackHandler(
+            app.state.slack_usecase,
+            app.state.event_queue,
+            EventDeduplicator(dedup_state, ttl_seconds=Config.EVENT_DEDUP_TTL),
+        )
 
         # Routers
         app.include_router(create_gpt_router(gpt_handler))
         app.include_router(create_slack_router(slack_handler))
-        app.include_router(ping_router)
+
+        # Socket Mode
+        if Config.SLACK_SOCKET_MODE:
+            with startup_phase("socket_mode"):
+                app.state.socket_mode_receiver = SocketModeReceiver(
+                    Config.SLACK_APP_TOKEN,
+                    on_event=slack_handler.handle_socket_mode_event,
+                    connections=Config.SLACK_SOCKET_MODE_CONNECTIONS,
+                    base_url=Config.SLACK_API_URL,
+                    ping_interval=Config.SLACK_SOCKET_MODE_PING_INTERVAL,
+                )
+                await app.state.socket_mode_receiver.start()
+
+        # 接続の事前確立
+        if Config.STARTUP_WARMUP_BACKGROUND:
+            app.state.warmup_task = asyncio.create_task(warm_up())
+        else:
+            with startup_phase("warm_up"):
+                await warm_up()
 
         logger.info("Slack GPT Bot API successfully started.")
     except Exception as e:
@@ -66,6 +284,42 @@ async def on_startup():
 @app.on_event("shutdown")
 async def on_shutdown():
     logger.info("Shutting down Slack GPT Bot API...")
+    warmup_task = getattr(app.state, "warmup_task", None)
+    if warmup_task:
+        warmup_task.cancel()
+    # 新しいイベントの受信を止めてからキューを処理しきる
+    socket_mode_receiver = getattr(app.state, "socket_mode_receiver", None)
+    if socket_mode_receiver:
+        await socket_mode_receiver.close()
+    loop_lag_monitor = getattr(app.state, "loop_lag_monitor", None)
+    if loop_lag_monitor:
+        await loop_lag_monitor.close()
+    event_queue = getattr(app.state, "event_queue", None)
+    if event_queue:
+        await event_queue.shutdown(timeout=Config.EVENT_SHUTDOWN_TIMEOUT)
+    usage_ledger = getattr(app.state, "usage_ledger", None)
+    if usage_ledger:
+        await usage_ledger.close()
+    usage_exporter = getattr(app.state, "usage_exporter", None)
+    if usage_exporter:
+        await usage_exporter.close()
+    sqlite_client = getattr(app.state, "sqlite_client", None)
+    if sqlite_client:
+        await sqlite_client.close()
+    spreadsheet_client = getattr(app.state, "spreadsheet_client", None)
+    if spreadsheet_client:
+        await spreadsheet_client.close()
+    gpt_client = getattr(app.state, "gpt_client", None)
+    if gpt_client:
+        await gpt_client.close()
+    redis_state = getattr(app.state, "redis_state", None)
+    if redis_state:
+        await redis_state.close()
+    tracer_provider = getattr(app.state, "tracer_provider", None)
+    if tracer_provider:
+        # 残っているスパンを送信する（エクスポーターは同期APIのためスレッドで待つ）
+        await asyncio.to_thread(tracer_provider.shutdown)
+    mark_process_dead(os.getpid())
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8080, log_level="info")
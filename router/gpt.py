@@ -1,4 +1,6 @@
-from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Header, HTTPException, Request
+from pydantic import BaseModel
 from interfaces.gpt import GptHandler
 
 router = APIRouter(
@@ -7,11 +9,27 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+class GptBatchRequest(BaseModel):
+    prompts: List[str]
+
+
 def create_gpt_router(gpt_handler: GptHandler) -> APIRouter:
     @router.get("/")
-    async def get_gpt(prompt: str):
+    async def get_gpt(prompt: str, cache_control: Optional[str] = Header(None)):
         try:
-            return await gpt_handler.create_completion(prompt)
+            return await gpt_handler.create_completion(prompt, cache_control)
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+
+    @router.post("/batch")
+    async def post_gpt_batch(body: GptBatchRequest, request: Request, cache_control: Optional[str] = Header(None)):
+        return await gpt_handler.create_completion_batch(body.prompts, request, cache_control)
+
+    @router.get("/cache")
+    async def get_gpt_cache_stats():
+        return gpt_handler.cache_stats()
+
+    @router.get("/stream")
+    async def get_gpt_stream(prompt: str, request: Request, format: str = "sse"):
+        return await gpt_handler.create_completion_stream(prompt, request, format)
     return router
@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from infrastructure.metrics.metrics import CONTENT_TYPE_LATEST, render
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def metrics():
+    return Response(render(), media_type=CONTENT_TYPE_LATEST)
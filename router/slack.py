@@ -13,4 +13,8 @@ def create_slack_router(slack_handler: SlackHandler) -> APIRouter:
             return await slack_handler.handle_event(request)
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+
+    @router.get("/events/stats")
+    async def get_event_stats():
+        return slack_handler.event_queue.stats()
     return router
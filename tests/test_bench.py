@@ -0,0 +1,45 @@
+import argparse
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from bench.fakes import FakeServer, add_arguments
+
+
+def fake_args(*argv: str) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    return parser.parse_args(["--openai-latency", "0", "--slack-latency", "0", "--sheets-latency", "0", "--jitter", "0", *argv])
+
+
+@pytest.fixture
+async def fakes(request):
+    server = FakeServer(fake_args(*getattr(request, "param", ())))
+    async with TestClient(TestServer(server.app())) as client:
+        yield client
+
+
+async def test_posts_are_recorded_in_the_thread(fakes):
+    response = await fakes.post("/api/chat.postMessage", json={"channel": "C1", "thread_ts": "1.0", "text": "hi"})
+    assert (await response.json())["ok"]
+    replies = await (await fakes.get("/api/conversations.replies", params={"channel": "C1", "ts": "1.0"})).json()
+    assert [message["text"] for message in replies["messages"]] == ["hi"]
+    assert "1.0" in await (await fakes.get("/__bench__/posts")).json()
+
+
+@pytest.mark.parametrize("fakes", [("--slack-rpm", "2")], indirect=True)
+async def test_slack_rate_limit_returns_retry_after(fakes):
+    statuses = [(await fakes.post("/api/auth.test")).status for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    response = await fakes.post("/api/auth.test")
+    assert int(response.headers["Retry-After"]) >= 1
+    counts = await (await fakes.get("/__bench__/counts")).json()
+    assert counts["slack:auth.test"] == 4
+    assert counts["slack:auth.test:429"] == 2
+
+
+async def test_sheets_append_writes_after_the_last_row(fakes):
+    await fakes.put("/v4/spreadsheets/bench/values/Activity!A1", json={"values": [["UserID"], ["U1"]]})
+    response = await fakes.post("/v4/spreadsheets/bench/values/Activity!A:E:append", json={"values": [["U2"], ["U3"]]})
+    assert (await response.json())["updates"]["updatedRange"] == "Activity!A3:E4"
+    values = (await (await fakes.get("/v4/spreadsheets/bench/values/Activity!A1:A4")).json())["values"]
+    assert values == [["UserID"], ["U1"], ["U2"], ["U3"]]
+
@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from usecase.coalesce import Debouncer, SingleFlight
+
+
+async def test_single_flight_shares_one_call_per_key():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return f"result {key}"
+
+    results = await asyncio.gather(
+        *(single_flight.do("a", lambda: work("a")) for _ in range(5)),
+        single_flight.do("b", lambda: work("b")),
+    )
+    assert results == ["result a"] * 5 + ["result b"]
+    assert calls == ["a", "b"]
+    assert single_flight.in_flight == {}
+
+    # 完了後は新しく実行する
+    await single_flight.do("a", lambda: work("a"))
+    assert calls == ["a", "b", "a"]
+
+
+async def test_single_flight_shares_errors():
+    single_flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream error")
+
+    results = await asyncio.gather(
+        single_flight.do("a", fail),
+        single_flight.do("a", fail),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert single_flight.in_flight == {}
+
+
+async def test_cancelled_leader_does_not_cancel_the_shared_call():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    leader = asyncio.create_task(single_flight.do("a", work))
+    await asyncio.sleep(0.01)
+    follower = asyncio.create_task(single_flight.do("a", work))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    assert await follower == "done"
+    assert calls == [1]
+    assert single_flight.in_flight == {}
+
+
+async def test_debouncer_merges_items_within_the_window():
+    debouncer = Debouncer(window=0.05)
+
+    async def later(item, delay):
+        await asyncio.sleep(delay)
+        return await debouncer.debounce("thread", item)
+
+    results = await asyncio.gather(
+        later(1, 0),
+        later(2, 0.01),
+        later(3, 0.02),
+        debouncer.debounce("other", "x"),
+    )
+    assert results == [[1, 2, 3], None, None, ["x"]]
+    assert debouncer.pending == {}
+    # windowを過ぎた後の要求は新しくまとめ直す
+    assert await debouncer.debounce("thread", 4) == [4]
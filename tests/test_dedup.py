@@ -0,0 +1,63 @@
+import json
+from typing import List
+from infrastructure.cache.dedup import EventDeduplicator
+from infrastructure.shared_state.memory import InMemorySharedState
+from interfaces.slack import SlackHandler
+
+
+class StubQueue:
+    def __init__(self, accept: bool = True):
+        self.accept = accept
+        self.enqueued: List[dict] = []
+
+    def enqueue(self, **job) -> bool:
+        if self.accept:
+            self.enqueued.append(job)
+        return self.accept
+
+
+def payload(event_id: str = "Ev1") -> dict:
+    return {
+        "event_id": event_id,
+        "team_id": "T1",
+        "authorizations": [{"user_id": "UBOT"}],
+        "event": {
+            "type": "app_mention",
+            "user": "U1",
+            "channel": "C1",
+            "ts": "1.0",
+            "text": "<@UBOT> hello",
+        },
+    }
+
+
+async def test_mark_and_forget():
+    deduplicator = EventDeduplicator(InMemorySharedState(), ttl_seconds=60)
+    assert await deduplicator.mark("Ev1")
+    assert not await deduplicator.mark("Ev1")
+    await deduplicator.forget("Ev1")
+    assert await deduplicator.mark("Ev1")
+    # IDのないイベントは重複判定しない
+    assert await deduplicator.mark(None)
+    assert await deduplicator.mark(None)
+
+
+async def test_retried_event_is_processed_once():
+    queue = StubQueue()
+    handler = SlackHandler(None, queue, EventDeduplicator(InMemorySharedState()))
+    first = await handler.handle_payload(payload())
+    retry = await handler.handle_payload(payload(), retry_num="1")
+    assert first.status_code == retry.status_code == 200
+    assert json.loads(retry.body) == {"status": "ignored"}
+    assert len(queue.enqueued) == 1
+
+
+async def test_rejected_event_is_forgotten_so_the_retry_is_processed():
+    queue = StubQueue(accept=False)
+    handler = SlackHandler(None, queue, EventDeduplicator(InMemorySharedState()))
+    busy = await handler.handle_payload(payload())
+    assert busy.status_code == 503
+    queue.accept = True
+    retry = await handler.handle_payload(payload(), retry_num="1")
+    assert retry.status_code == 200
+    assert len(queue.enqueued) == 1
@@ -0,0 +1,70 @@
+import asyncio
+import json
+from typing import List, Optional
+import httpx
+import pytest
+from fastapi import FastAPI
+from interfaces.gpt import GptHandler
+from router.gpt import create_gpt_router
+
+
+class StubUsecase:
+    def __init__(self):
+        self.response_cache = None
+        self.active = 0
+        self.max_active = 0
+        self.cache_controls: List[Optional[str]] = []
+
+    async def generate_text(self, prompt: str, cache_control: Optional[str] = None) -> Optional[str]:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        self.cache_controls.append(cache_control)
+        try:
+            await asyncio.sleep(float(prompt.split(":")[1]) if ":" in prompt else 0.01)
+            return None if prompt.startswith("fail") else prompt.upper()
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture(scope="module")
+def handler() -> GptHandler:
+    return GptHandler(StubUsecase(), batch_concurrency=2, batch_max_prompts=5)
+
+
+@pytest.fixture(scope="module")
+def app(handler: GptHandler) -> FastAPI:
+    app = FastAPI()
+    app.include_router(create_gpt_router(handler))
+    return app
+
+
+@pytest.fixture
+async def client(app: FastAPI):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+async def test_batch_streams_results_in_completion_order(client, handler):
+    handler.gpt_usecase.max_active = 0
+    response = await client.post(
+        "/gpt/batch",
+        json={"prompts": ["slow:0.1", "fast:0.01", "fail:0.02", "next:0.01"]},
+        headers={"Cache-Control": "no-cache"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [
+        {"event": "result", "index": 1, "text": "FAST:0.01"},
+        {"event": "error", "index": 2, "detail": "Failed to generate text."},
+        {"event": "result", "index": 3, "text": "NEXT:0.01"},
+        {"event": "result", "index": 0, "text": "SLOW:0.1"},
+        {"event": "done", "succeeded": 3, "failed": 1},
+    ]
+    assert handler.gpt_usecase.max_active == 2
+    assert set(handler.gpt_usecase.cache_controls) == {"no-cache"}
+
+
+async def test_batch_rejects_empty_and_oversized_requests(client):
+    assert (await client.post("/gpt/batch", json={"prompts": []})).status_code == 400
+    assert (await client.post("/gpt/batch", json={"prompts": ["a"] * 6})).status_code == 413
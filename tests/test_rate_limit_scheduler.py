@@ -0,0 +1,135 @@
+import asyncio
+import time
+from domain.model.priority import request_priority
+from infrastructure.ratelimit.scheduler import (
+    SLACK_CHANNEL_BURST_SECONDS,
+    RateLimitLane,
+    RateLimitScheduler,
+    TokenBucket,
+    parse_retry_after,
+)
+
+
+def test_token_bucket_refills_at_the_per_minute_rate():
+    bucket = TokenBucket(per_minute=600, burst_seconds=1.0)  # 10/s, 容量10
+    assert bucket.capacity == 10
+    bucket.consume(10)
+    assert bucket.delay_for(1) > 0.05
+    bucket.updated_at -= 0.5
+    assert bucket.delay_for(5) == 0
+
+
+def test_token_bucket_block_for_and_limit_remaining():
+    bucket = TokenBucket(per_minute=600, burst_seconds=1.0)
+    bucket.block_for(0.5)
+    assert 0.4 < bucket.delay_for(1) <= 0.5
+    assert not bucket.is_idle()
+
+    bucket = TokenBucket(per_minute=600, burst_seconds=1.0)
+    bucket.limit_remaining(0)
+    assert bucket.delay_for(1) > 0
+
+
+async def test_lane_serves_waiters_in_priority_order():
+    bucket = TokenBucket(per_minute=600, burst_seconds=0.1)  # 容量1
+    lane = RateLimitLane("test", {"requests": bucket})
+    bucket.consume(1)
+    served = []
+
+    async def request(priority):
+        await lane.acquire({"requests": 1}, priority)
+        served.append(priority)
+
+    tasks = [asyncio.create_task(request(priority)) for priority in [(1, 5), (1, 0), (0, 9)]]
+    await asyncio.gather(*tasks)
+    assert served == [(0, 9), (1, 0), (1, 5)]
+
+
+async def test_try_acquire_does_not_jump_the_queue():
+    bucket = TokenBucket(per_minute=60, burst_seconds=1.0)
+    lane = RateLimitLane("test", {"requests": bucket})
+    bucket.consume(1)
+    waiter = asyncio.create_task(lane.acquire({"requests": 1}, (1, 0)))
+    await asyncio.sleep(0)
+    bucket.tokens = bucket.capacity
+    assert not lane.try_acquire({"requests": 1})
+    waiter.cancel()
+
+
+async def test_lane_block_for_delays_acquire():
+    lane = RateLimitLane("test", {"requests": TokenBucket(per_minute=6000)})
+    lane.block_for(0.2)
+    started = time.monotonic()
+    await lane.acquire({"requests": 1}, (1, 0))
+    assert time.monotonic() - started >= 0.15
+
+
+async def test_post_message_lanes_are_per_channel_and_share_the_workspace_bucket():
+    scheduler = RateLimitScheduler()
+    a = scheduler.slack_lane("chat.postMessage", "C1")
+    b = scheduler.slack_lane("chat.postMessage", "C2")
+    assert a is not b
+    assert a.buckets["requests"] is b.buckets["requests"]
+    assert scheduler.slack_lane("chat.update", "C1").buckets["requests"] is not a.buckets["requests"]
+    # チャンネルごとに制限されないメソッドはチャンネルを指定しても共有のレーン
+    assert scheduler.slack_lane("conversations.replies", "C1") is scheduler.slack_lane("conversations.replies")
+
+    # 1チャンネルでバーストを使い切っても、他のチャンネルには待たずに投稿できる
+    burst = int(SLACK_CHANNEL_BURST_SECONDS)
+    for _ in range(burst):
+        assert scheduler.try_acquire_slack("chat.postMessage", "C1", headroom=0)
+    assert not scheduler.try_acquire_slack("chat.postMessage", "C1", headroom=0)
+    assert scheduler.try_acquire_slack("chat.postMessage", "C2", headroom=0)
+
+
+async def test_rate_limited_channel_does_not_pause_other_channels():
+    scheduler = RateLimitScheduler()
+    scheduler.block_slack("chat.postMessage", "C1", 30)
+    assert not scheduler.try_acquire_slack("chat.postMessage", "C1", headroom=0)
+    started = time.monotonic()
+    await asyncio.wait_for(scheduler.acquire_slack("chat.postMessage", "C2"), timeout=1)
+    assert time.monotonic() - started < 0.1
+
+
+async def test_workspace_bucket_limits_all_channels():
+    scheduler = RateLimitScheduler()
+    workspace = scheduler.slack_lane("chat.postMessage", "C1").buckets["requests"]
+    workspace.consume(workspace.capacity)
+    assert not scheduler.try_acquire_slack("chat.postMessage", "C2", headroom=0)
+
+
+async def test_idle_channel_lanes_are_pruned():
+    scheduler = RateLimitScheduler()
+    for i in range(100):
+        scheduler.slack_lane("chat.postMessage", f"C{i}")
+    busy = scheduler.slack_lane("chat.postMessage", "busy")
+    busy.buckets["channel"].consume(1)
+    scheduler.slack_lane("chat.postMessage", "new")
+    channel_lanes = [name for name in scheduler.lanes if name.startswith("slack:chat.postMessage:")]
+    assert sorted(channel_lanes) == ["slack:chat.postMessage:busy", "slack:chat.postMessage:new"]
+
+
+async def test_acquire_uses_the_request_priority():
+    scheduler = RateLimitScheduler(openai_rpm=60, openai_tpm=100000)
+    lane = scheduler.lane("openai")
+    lane.buckets["requests"].consume(lane.buckets["requests"].capacity)
+    lane.buckets["requests"].updated_at = time.monotonic()
+    served = []
+
+    async def request(priority):
+        request_priority.set(priority)
+        await scheduler.acquire_openai(10)
+        served.append(priority)
+
+    tasks = [asyncio.create_task(request(priority)) for priority in [(1, 0), (0, 0)]]
+    await asyncio.sleep(0.01)
+    lane.buckets["requests"].tokens = 2
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=2)
+    assert served == [(0, 0), (1, 0)]
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"Retry-After": "3"}) == 3
+    assert parse_retry_after({"x-ratelimit-reset-requests": "1m30s"}) == 90
+    assert parse_retry_after({"x-ratelimit-reset-tokens": "250ms"}) == 0.25
+    assert parse_retry_after(None, default=2.0) == 2.0
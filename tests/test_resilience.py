@@ -0,0 +1,165 @@
+import asyncio
+from typing import List
+import httpx
+import pytest
+from infrastructure.gpt import resilience
+from infrastructure.gpt.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyTracker,
+    backoff_delay,
+    call_hedged,
+    call_with_retries,
+)
+
+
+class Flaky:
+    def __init__(self, failures: int, error: Exception = None):
+        self.failures = failures
+        self.error = error or httpx.ConnectError("connection refused")
+        self.calls = 0
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return "ok"
+
+
+@pytest.fixture
+def delays(monkeypatch) -> List[float]:
+    """バックオフの上限をそのまま待ち時間にして記録する"""
+    recorded: List[float] = []
+
+    def uniform(low: float, high: float) -> float:
+        recorded.append(high)
+        return 0.0
+
+    monkeypatch.setattr(resilience.random, "uniform", uniform)
+    return recorded
+
+
+def test_circuit_breaker_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+async def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    await asyncio.sleep(0.06)
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # 試行が失敗すれば再びopen、成功すればclosed
+    breaker.record_failure()
+    assert breaker.state == "open"
+    await asyncio.sleep(0.06)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_backoff_delay_is_capped(delays):
+    for attempt in range(6):
+        backoff_delay(attempt, base=0.5, max_delay=4.0)
+    assert delays == [0.5, 1.0, 2.0, 4.0, 4.0, 4.0]
+
+
+async def test_retries_with_exponential_backoff(delays):
+    func = Flaky(failures=3)
+    breaker = CircuitBreaker(failure_threshold=10)
+    assert await call_with_retries(func, breaker, max_retries=3, backoff_base=0.1, backoff_max=1.0) == "ok"
+    assert func.calls == 4
+    assert delays == [0.1, 0.2, 0.4]
+    assert breaker.failures == 0
+
+
+async def test_gives_up_after_max_retries(delays):
+    func = Flaky(failures=10)
+    breaker = CircuitBreaker(failure_threshold=10)
+    with pytest.raises(httpx.ConnectError):
+        await call_with_retries(func, breaker, max_retries=2, backoff_base=0.01, backoff_max=0.01)
+    assert func.calls == 3
+
+
+async def test_open_breaker_stops_the_retries(delays):
+    func = Flaky(failures=10)
+    breaker = CircuitBreaker(failure_threshold=3)
+    with pytest.raises(CircuitOpenError):
+        await call_with_retries(func, breaker, max_retries=5, backoff_base=0.01, backoff_max=0.01)
+    # 3回目の失敗で開き、4回目は呼び出さずに失敗する
+    assert func.calls == 3
+    assert breaker.state == "open"
+
+
+async def test_non_retryable_errors_are_raised_immediately(delays):
+    func = Flaky(failures=1, error=ValueError("bad request"))
+    breaker = CircuitBreaker(failure_threshold=1)
+    with pytest.raises(ValueError):
+        await call_with_retries(func, breaker, max_retries=3, backoff_base=0.01, backoff_max=0.01)
+    assert func.calls == 1
+    assert breaker.state == "closed"
+
+
+async def test_hedged_call_cancels_the_slower_request():
+    latency = LatencyTracker()
+    for _ in range(10):
+        latency.record(0.02)
+    started: List[int] = []
+    cancelled: List[int] = []
+
+    async def func() -> int:
+        index = len(started)
+        started.append(index)
+        try:
+            # 1本目だけが遅い
+            await asyncio.sleep(1.0 if index == 0 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(index)
+            raise
+        return index
+
+    assert await call_hedged(func, latency, min_samples=5) == 1
+    await asyncio.sleep(0)
+    assert started == [0, 1]
+    assert cancelled == [0]
+
+
+async def test_hedging_waits_for_enough_samples():
+    latency = LatencyTracker()
+    calls: List[int] = []
+
+    async def func() -> str:
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    assert await call_hedged(func, latency, min_samples=5) == "ok"
+    assert calls == [1]
+    assert len(latency.samples) == 1
+
+
+async def test_hedged_call_falls_back_to_the_other_request_on_error():
+    latency = LatencyTracker()
+    for _ in range(10):
+        latency.record(0.01)
+    started: List[int] = []
+
+    async def func() -> int:
+        index = len(started)
+        started.append(index)
+        await asyncio.sleep(0.05)
+        if index == 0:
+            raise httpx.ReadTimeout("timed out")
+        return index
+
+    assert await call_hedged(func, latency, min_samples=5) == 1
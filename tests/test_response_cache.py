@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, List
+from domain.repository.gpt import GptRepository
+from infrastructure.cache.response_cache import ResponseCache
+from infrastructure.shared_state.memory import InMemorySharedState
+from usecase.gpt import GptUsecase
+
+
+class CountingGpt(GptRepository):
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.prompts: List[str] = []
+
+    async def create_completion(self, prompt: str) -> Any:
+        self.prompts.append(prompt)
+        await asyncio.sleep(self.delay)
+        content = f" answer {len(self.prompts)} "
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    def create_completion_stream(self, prompt: str) -> AsyncIterator[Any]:
+        raise NotImplementedError
+
+
+async def test_prompts_are_normalized_before_keying():
+    cache = ResponseCache(InMemorySharedState())
+    await cache.set("ＡＢＣ  について\n教えて", "cached")
+    assert await cache.get("ABC について 教えて ") == "cached"
+    assert await cache.get("ABC について教えて") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+async def test_entries_expire_after_ttl():
+    cache = ResponseCache(InMemorySharedState(), ttl_seconds=0.05)
+    await cache.set("prompt", "cached")
+    await asyncio.sleep(0.1)
+    assert await cache.get("prompt") is None
+
+
+async def test_byte_limit_evicts_least_recently_used():
+    state = InMemorySharedState(max_bytes=20, sizeof=lambda value: len(value.encode("utf-8")))
+    cache = ResponseCache(state)
+    await cache.set("a", "x" * 8)
+    await cache.set("b", "y" * 8)
+    assert await cache.get("a") is not None  # aを最近使ったものにする
+    await cache.set("c", "z" * 8)
+    assert await cache.get("b") is None
+    assert await cache.get("a") is not None
+    assert state.stats()["bytes"] <= 20
+
+
+async def test_usecase_honours_cache_control():
+    gpt = CountingGpt()
+    usecase = GptUsecase(gpt, ResponseCache(InMemorySharedState()))
+    assert await usecase.generate_text("hello") == "answer 1"
+    assert await usecase.generate_text(" hello ") == "answer 1"
+    # no-cacheは再取得して保存し直す
+    assert await usecase.generate_text("hello", cache_control="no-cache") == "answer 2"
+    assert await usecase.generate_text("hello") == "answer 2"
+    # no-storeは読みも書きもしない
+    assert await usecase.generate_text("hello", cache_control="no-store") == "answer 3"
+    assert await usecase.generate_text("hello") == "answer 2"
+    assert len(gpt.prompts) == 3
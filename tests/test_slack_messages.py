@@ -0,0 +1,55 @@
+import pytest
+from domain.model.gpt import CHARACTER_SETTINGS, MESSAGE_OVERHEAD_TOKENS, build_chat_messages, estimate_tokens
+from domain.model.slack import THREAD_INSTRUCTION, convert_to_slack_messages
+
+BOT = "UBOT"
+
+
+def thread(*messages):
+    return convert_to_slack_messages([{"user": user, "text": text} for user, text in messages])
+
+
+def cost(content: str) -> int:
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def test_bot_replies_are_assistant_turns_and_others_are_user_turns():
+    messages = thread(
+        ("U1", f"<@{BOT}> こんにちは\nよろしく"),
+        (BOT, "了解しました"),
+        ("U2", "続きを教えて"),
+    ).create_messages(BOT)
+    assert messages == [
+        {"role": "system", "content": THREAD_INSTRUCTION},
+        {"role": "user", "content": "U1: <@[GptBot]> こんにちは よろしく"},
+        {"role": "assistant", "content": "了解しました"},
+        {"role": "user", "content": "U2: 続きを教えて"},
+    ]
+
+
+def test_oldest_messages_are_dropped_to_fit_the_budget():
+    slack_messages = thread(("U1", "a" * 50), ("U1", "b" * 50), ("U1", "c" * 50))
+    full = slack_messages.create_messages(BOT)
+    budget = cost(THREAD_INSTRUCTION) + sum(cost(message["content"]) for message in full[2:])
+    trimmed = slack_messages.create_messages(BOT, max_tokens=budget)
+    assert trimmed == [full[0], *full[2:]]
+    assert len(slack_messages.create_messages(BOT, max_tokens=budget - 1)) == 2
+
+
+def test_prefix_is_stable_when_the_thread_grows():
+    before = thread(("U1", "質問"), (BOT, "回答")).create_messages(BOT)
+    after = thread(("U1", "質問"), (BOT, "回答"), ("U1", "追加の質問")).create_messages(BOT)
+    assert after[:len(before)] == before
+
+
+def test_latest_message_over_budget_raises():
+    slack_messages = thread(("U1", "x" * 100))
+    with pytest.raises(ValueError):
+        slack_messages.create_messages(BOT, max_tokens=cost(THREAD_INSTRUCTION) + 10)
+
+
+def test_character_settings_come_first():
+    messages = build_chat_messages(thread(("U1", "hi")).create_messages(BOT))
+    assert messages[0] == {"role": "system", "content": CHARACTER_SETTINGS}
+    assert messages[1]["content"] == THREAD_INSTRUCTION
+    assert build_chat_messages("hi")[1:] == [{"role": "user", "content": "hi"}]
@@ -0,0 +1,88 @@
+from typing import List
+import pytest
+from slack_sdk.socket_mode.request import SocketModeRequest
+from slack_sdk.socket_mode.response import SocketModeResponse
+from infrastructure.cache.dedup import EventDeduplicator
+from infrastructure.shared_state.memory import InMemorySharedState
+from infrastructure.slack.socket_mode import SocketModeReceiver
+from interfaces.slack import SlackHandler
+
+
+class StubQueue:
+    def __init__(self, accept: bool = True):
+        self.accept = accept
+        self.enqueued: List[dict] = []
+
+    def enqueue(self, **job) -> bool:
+        if self.accept:
+            self.enqueued.append(job)
+        return self.accept
+
+
+class RecordingClient:
+    def __init__(self):
+        self.acks: List[str] = []
+
+    async def send_socket_mode_response(self, response: SocketModeResponse) -> None:
+        self.acks.append(response.envelope_id)
+
+
+def envelope(envelope_id: str, retry_attempt: int = 0) -> SocketModeRequest:
+    return SocketModeRequest(
+        type="events_api",
+        envelope_id=envelope_id,
+        payload={
+            "event_id": "Ev1",
+            "team_id": "T1",
+            "authorizations": [{"user_id": "UBOT"}],
+            "event": {"type": "app_mention", "user": "U1", "channel": "C1", "ts": "1.0", "text": "<@UBOT> hi"},
+        },
+        retry_attempt=retry_attempt,
+    )
+
+
+@pytest.fixture
+async def receiver_and_queue():
+    queue = StubQueue()
+    handler = SlackHandler(None, queue, EventDeduplicator(InMemorySharedState()))
+    receiver = SocketModeReceiver("xapp-test", handler.handle_socket_mode_event, connections=1)
+    yield receiver, queue
+    await receiver.close()
+
+
+async def test_envelope_is_acknowledged_after_the_event_is_queued(receiver_and_queue):
+    receiver, queue = receiver_and_queue
+    client = RecordingClient()
+    await receiver._on_request(client, envelope("E1"))
+    assert client.acks == ["E1"]
+    assert len(queue.enqueued) == 1
+
+
+async def test_rejected_event_is_left_unacknowledged_and_processed_on_redelivery(receiver_and_queue):
+    receiver, queue = receiver_and_queue
+    client = RecordingClient()
+    queue.accept = False
+    await receiver._on_request(client, envelope("E1"))
+    assert client.acks == []
+
+    queue.accept = True
+    await receiver._on_request(client, envelope("E2", retry_attempt=1))
+    assert client.acks == ["E2"]
+    assert len(queue.enqueued) == 1
+
+
+async def test_duplicate_delivery_is_acknowledged_without_requeueing(receiver_and_queue):
+    receiver, queue = receiver_and_queue
+    client = RecordingClient()
+    await receiver._on_request(client, envelope("E1"))
+    await receiver._on_request(client, envelope("E2", retry_attempt=1))
+    assert client.acks == ["E1", "E2"]
+    assert len(queue.enqueued) == 1
+
+
+async def test_non_event_envelopes_are_acknowledged(receiver_and_queue):
+    receiver, queue = receiver_and_queue
+    client = RecordingClient()
+    await receiver._on_request(client, SocketModeRequest(type="interactive", envelope_id="E3", payload={}))
+    assert client.acks == ["E3"]
+    assert queue.enqueued == []
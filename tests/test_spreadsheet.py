@@ -0,0 +1,143 @@
+import json
+import re
+import threading
+from typing import Any, Dict, List
+from urllib.parse import unquote, urlparse
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.http import HttpMockSequence
+from domain.model.spreadsheet import SpreadsheetData
+from infrastructure.spreadsheet.spreadsheet import SpreadsheetClient
+
+
+class FakeSheet:
+    """Activityシートを模したSheets API（SpreadsheetClient._execute の差し替え先）"""
+
+    def __init__(self, service):
+        self.service = service
+        self.rows: List[List[str]] = []
+        self.calls: List[str] = []
+
+    async def execute(self, method_id: str, build_request) -> Dict[str, Any]:
+        request = build_request(self.service.spreadsheets().values())
+        method = request.methodId.rsplit(".", 1)[-1]
+        self.calls.append(method)
+        body = json.loads(request.body) if request.body else {}
+        if method == "get":
+            start, end = self._rows(self._range(request))
+            return {"values": [row for row in self.rows[start - 1:end]]}
+        if method == "batchUpdate":
+            for data in body["data"]:
+                self._write(self._rows(data["range"])[0], data["values"])
+            return {}
+        if method == "append":
+            start = len(self.rows) + 1
+            self._write(start, body["values"])
+            return {"updates": {"updatedRange": f"Activity!A{start}:E{start + len(body['values']) - 1}"}}
+        raise AssertionError(f"Unexpected method: {method}")
+
+    @staticmethod
+    def _range(request) -> str:
+        return unquote(urlparse(request.uri).path.rsplit("/values/", 1)[1])
+
+    def _rows(self, a1_range: str):
+        match = re.search(r"![A-Z]+(\d*)(?::[A-Z]+(\d*))?", a1_range)
+        start = int(match.group(1) or 1)
+        end = int(match.group(2)) if match.group(2) else len(self.rows)
+        return start, end
+
+    def _write(self, start: int, values: List[List[Any]]) -> None:
+        for offset, row in enumerate(values):
+            while len(self.rows) < start + offset:
+                self.rows.append([])
+            self.rows[start + offset - 1] = [str(value) for value in row]
+
+
+def usage(user_id: str, total_usage: int = 1) -> SpreadsheetData:
+    data = SpreadsheetData.create_new(user_id)
+    data.total_usage = total_usage
+    return data
+
+
+def create_client(sheet: FakeSheet) -> SpreadsheetClient:
+    client = SpreadsheetClient("spreadsheet", AnonymousCredentials())
+    client._execute = sheet.execute
+    return client
+
+
+@pytest.fixture
+def sheet():
+    return FakeSheet(SpreadsheetClient("spreadsheet", AnonymousCredentials()).service)
+
+
+async def test_new_users_are_appended_and_indexed_from_the_response(sheet):
+    client = create_client(sheet)
+    await client.update_spreadsheet_batch([usage("U1"), usage("U2")])
+    assert [row[0] for row in sheet.rows] == ["U1", "U2"]
+    assert client.row_index == {"U1": 1, "U2": 2}
+
+    await client.update_spreadsheet_batch([usage("U1", 2), usage("U3")])
+    assert [row[:2] for row in sheet.rows] == [["U1", "2"], ["U2", "1"], ["U3", "1"]]
+    assert sheet.calls.count("append") == 2
+
+
+async def test_workers_appending_at_the_same_time_do_not_share_a_row(sheet):
+    first, second = create_client(sheet), create_client(sheet)
+    await first.update_spreadsheet_batch([usage("U1")])
+    await second.update_spreadsheet_batch([usage("U2")])
+    await first.update_spreadsheet_batch([usage("U3")])
+    assert [row[0] for row in sheet.rows] == ["U1", "U2", "U3"]
+
+    # 他のワーカーが追加した行も読み取れる
+    data = await second.get_spreadsheet_data_by_slack_id("U3")
+    assert data.user_id == "U3"
+    data = await first.get_spreadsheet_data_by_slack_id("U2")
+    assert data.user_id == "U2"
+
+
+async def test_failed_append_does_not_leave_the_user_in_the_index(sheet):
+    client = create_client(sheet)
+    await client.update_spreadsheet_batch([usage("U1")])
+    client._execute = _fail_on("append", sheet)
+    with pytest.raises(RuntimeError):
+        await client.update_spreadsheet_batch([usage("U2")])
+    assert "U2" not in client.row_index
+
+    client._execute = sheet.execute
+    await client.update_spreadsheet_batch([usage("U2")])
+    assert [row[0] for row in sheet.rows] == ["U1", "U2"]
+
+
+async def test_service_is_built_on_the_executor_not_the_event_loop(monkeypatch):
+    client = SpreadsheetClient("spreadsheet", AnonymousCredentials())
+    built_on = []
+    build_service = SpreadsheetClient.service.fget
+
+    def service(self):
+        built_on.append(threading.current_thread().name)
+        return build_service(self)
+
+    monkeypatch.setattr(SpreadsheetClient, "service", property(service))
+    client._get_http = lambda: HttpMockSequence([({"status": "200"}, '{"values": [["U1"]]}')])
+    try:
+        assert await client._read_spreadsheet("Activity!A1:A") == [["U1"]]
+    finally:
+        await client.close()
+    assert built_on and all(name.startswith("sheets") for name in built_on)
+
+
+async def test_batch_refreshes_the_index_once(sheet):
+    client = create_client(sheet)
+    await client.update_spreadsheet_batch([usage("U1")])
+    sheet.calls.clear()
+    await client.update_spreadsheet_batch([usage("U2"), usage("U3"), usage("U1", 2)])
+    assert sheet.calls == ["get", "batchUpdate", "append"]
+
+
+def _fail_on(method: str, sheet: FakeSheet):
+    async def execute(method_id, build_request):
+        if method_id.endswith(f".{method}"):
+            raise RuntimeError("Sheets API error")
+        return await sheet.execute(method_id, build_request)
+
+    return execute
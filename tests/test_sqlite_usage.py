@@ -0,0 +1,109 @@
+import asyncio
+import sqlite3
+import time
+from typing import List, Optional
+import pytest
+from domain.model.spreadsheet import SpreadsheetData
+from domain.repository.spreadsheet import SpreadsheetRepository
+from infrastructure.sqlite.sqlite import SqliteUsageClient
+
+
+class FakeSheet(SpreadsheetRepository):
+    def __init__(self, rows: Optional[List[SpreadsheetData]] = None):
+        self.rows = {row.user_id: row for row in rows or []}
+        self.reads = 0
+
+    async def get_spreadsheet_data_by_slack_id(self, user_id: str) -> Optional[SpreadsheetData]:
+        self.reads += 1
+        return self.rows.get(user_id)
+
+    async def update_spreadsheet(self, update: SpreadsheetData) -> None:
+        self.rows[update.user_id] = update
+
+    async def update_spreadsheet_batch(self, updates: List[SpreadsheetData]) -> None:
+        for update in updates:
+            await self.update_spreadsheet(update)
+
+
+@pytest.fixture
+async def client(tmp_path):
+    usage_client = SqliteUsageClient(str(tmp_path / "usage.db"))
+    yield usage_client
+    await usage_client.close()
+
+
+async def test_add_token_usage_creates_and_accumulates(client):
+    await client.add_token_usage("U1", 10)
+    data = await client.add_token_usage("U1", 5)
+    assert (data.total_usage, data.daily_tokens_usage, data.total_tokens_usage) == (2, 15, 15)
+    stored = await client.get_spreadsheet_data_by_slack_id("U1")
+    assert (stored.total_usage, stored.daily_tokens_usage) == (2, 15)
+
+
+async def test_add_token_usage_resets_daily_usage_on_a_new_day(client):
+    yesterday = SpreadsheetData.create_new("U1")
+    yesterday.last_used_at = "2000-01-01T12:00:00+09:00"
+    yesterday.daily_tokens_usage = 19000
+    yesterday.total_tokens_usage = 19000
+    await client.update_spreadsheet(yesterday)
+
+    data = await client.add_token_usage("U1", 100)
+    assert data.daily_tokens_usage == 100
+    assert data.total_tokens_usage == 19100
+
+
+async def test_add_token_usage_imports_from_fallback_first(tmp_path):
+    existing = SpreadsheetData.create_new("U1")
+    existing.total_usage = 3
+    existing.total_tokens_usage = 300
+    fallback = FakeSheet([existing])
+    usage_client = SqliteUsageClient(str(tmp_path / "usage.db"), fallback=fallback)
+    try:
+        data = await usage_client.add_token_usage("U1", 10)
+        assert (data.total_usage, data.total_tokens_usage) == (4, 310)
+        await usage_client.add_token_usage("U1", 10)
+        assert fallback.reads == 1
+    finally:
+        await usage_client.close()
+
+
+async def test_clients_sharing_a_file_do_not_lose_increments(tmp_path):
+    path = str(tmp_path / "usage.db")
+    clients = [SqliteUsageClient(path), SqliteUsageClient(path)]
+    try:
+        await asyncio.gather(*(clients[i % 2].add_token_usage("U1", 10) for i in range(20)))
+        data = await clients[0].get_spreadsheet_data_by_slack_id("U1")
+        assert (data.total_usage, data.total_tokens_usage) == (20, 200)
+    finally:
+        for usage_client in clients:
+            await usage_client.close()
+
+
+async def test_locked_database_does_not_block_the_event_loop(tmp_path):
+    path = str(tmp_path / "usage.db")
+    usage_client = SqliteUsageClient(path, busy_timeout=2.0)
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        task = asyncio.create_task(usage_client.add_token_usage("U1", 10))
+        started = time.monotonic()
+        await asyncio.sleep(0.2)
+        # ロック待ちの間もイベントループは動き続ける
+        assert time.monotonic() - started < 0.5
+        assert not task.done()
+        other.execute("COMMIT")
+        data = await task
+        assert data.total_tokens_usage == 10
+    finally:
+        other.close()
+        await usage_client.close()
+
+
+async def test_export_revisions(client):
+    await client.add_token_usage("U1", 10)
+    rows = await client.fetch_unexported()
+    assert [(data.user_id, revision) for data, revision in rows] == [("U1", 1)]
+    await client.mark_exported({"U1": 1})
+    assert await client.fetch_unexported() == []
+    await client.add_token_usage("U1", 10)
+    assert [revision for _, revision in await client.fetch_unexported()] == [2]
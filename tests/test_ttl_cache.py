@@ -0,0 +1,70 @@
+import pytest
+from infrastructure.cache import ttl_cache
+from infrastructure.cache.ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ttl_cache, "time", clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache(max_size=10, ttl_seconds=5)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl_seconds=20)
+    clock.now += 5
+    assert cache.get("a") is None
+    assert "a" not in cache
+    assert cache.get("b") == 2
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(max_size=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # aを最近使ったものにする
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_total_bytes_limit_evicts_oldest(clock):
+    cache = TTLCache(max_size=100, ttl_seconds=60, max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "yyyy")
+    cache.set("c", "zzzz")
+    assert "a" not in cache
+    assert cache.total_bytes == 8
+    cache.set("b", "y")  # 上書きでサイズが入れ替わる
+    assert cache.total_bytes == 5
+    assert cache.pop("c") == "zzzz"
+    assert cache.total_bytes == 1
+
+
+def test_add_only_succeeds_when_missing_or_expired(clock):
+    cache = TTLCache(max_size=10, ttl_seconds=5)
+    assert cache.add("event")
+    assert not cache.add("event")
+    clock.now += 5
+    assert cache.add("event")
+
+
+def test_expired_entries_are_evicted_on_write(clock):
+    cache = TTLCache(max_size=10, ttl_seconds=5)
+    for key in range(5):
+        cache.set(key, key)
+    clock.now += 10
+    cache.set("new", 1)
+    assert len(cache) == 1
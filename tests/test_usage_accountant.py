@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import pytest
+from domain.model.spreadsheet import DAILY_TOKEN_LIMIT, JST, SpreadsheetData
+from domain.repository.spreadsheet import SpreadsheetRepository
+from infrastructure.shared_state.memory import InMemorySharedState
+from usecase.usage import UsageAccountant
+
+
+class DictSheet(SpreadsheetRepository):
+    def __init__(self, records: Optional[Dict[str, SpreadsheetData]] = None):
+        self.records = records or {}
+        self.writes: List[SpreadsheetData] = []
+
+    async def get_spreadsheet_data_by_slack_id(self, user_id: str) -> Optional[SpreadsheetData]:
+        record = self.records.get(user_id)
+        return record.copy() if record else None
+
+    async def update_spreadsheet(self, update: SpreadsheetData) -> None:
+        self.records[update.user_id] = update.copy()
+        self.writes.append(update.copy())
+
+    async def update_spreadsheet_batch(self, updates: List[SpreadsheetData]) -> None:
+        for update in updates:
+            await self.update_spreadsheet(update)
+
+
+def record(user_id: str, daily_tokens_usage: int, last_used_at: datetime) -> SpreadsheetData:
+    data = SpreadsheetData.create_new(user_id)
+    data.daily_tokens_usage = daily_tokens_usage
+    data.total_tokens_usage = daily_tokens_usage
+    data.last_used_at = last_used_at.isoformat()
+    return data
+
+
+async def test_reservations_count_against_the_daily_limit():
+    state = InMemorySharedState()
+    accountant = UsageAccountant(DictSheet(), state)
+    await accountant.reserve("U1", DAILY_TOKEN_LIMIT - 100)
+    with pytest.raises(ValueError):
+        await accountant.reserve("U1", 200)
+    await accountant.release("U1", DAILY_TOKEN_LIMIT - 100)
+    assert await state.get("usage:reserved:U1") is None
+    await accountant.reserve("U1", 200)
+
+
+async def test_concurrent_reservations_do_not_overcommit():
+    accountant = UsageAccountant(DictSheet(), InMemorySharedState())
+    results = await asyncio.gather(
+        *(accountant.reserve("U1", DAILY_TOKEN_LIMIT // 4) for _ in range(6)),
+        return_exceptions=True,
+    )
+    assert sum(1 for result in results if isinstance(result, ValueError)) == 2
+
+
+async def test_reconcile_releases_the_reservation_and_adds_actual_usage():
+    sheet = DictSheet()
+    state = InMemorySharedState()
+    accountant = UsageAccountant(sheet, state)
+    reserved = await accountant.reserve("U1", 5000)
+    await accountant.reconcile("U1", reserved, 1200)
+    assert await state.get("usage:reserved:U1") is None
+    assert sheet.records["U1"].daily_tokens_usage == 1200
+    assert sheet.records["U1"].total_usage == 1
+
+    # 別のプロセス（同じ共有状態を使う別のインスタンス）も精算後の値で判定する
+    other = UsageAccountant(DictSheet(), state)
+    with pytest.raises(ValueError):
+        await other.reserve("U1", DAILY_TOKEN_LIMIT - 1000)
+
+
+async def test_usage_from_a_previous_day_is_reset():
+    yesterday = datetime.now(JST) - timedelta(days=1)
+    sheet = DictSheet({"U1": record("U1", DAILY_TOKEN_LIMIT, yesterday)})
+    accountant = UsageAccountant(sheet, InMemorySharedState())
+    reserved = await accountant.reserve("U1", 1000)
+    await accountant.reconcile("U1", reserved, 300)
+    assert sheet.records["U1"].daily_tokens_usage == 300
+    assert sheet.records["U1"].total_tokens_usage == DAILY_TOKEN_LIMIT + 300
+
+
+async def test_usage_from_today_is_kept():
+    sheet = DictSheet({"U1": record("U1", DAILY_TOKEN_LIMIT - 10, datetime.now(JST))})
+    accountant = UsageAccountant(sheet, InMemorySharedState())
+    with pytest.raises(ValueError):
+        await accountant.reserve("U1", 100)
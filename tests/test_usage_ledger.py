@@ -0,0 +1,61 @@
+import asyncio
+from typing import List, Optional
+from domain.model.spreadsheet import SpreadsheetData
+from domain.repository.spreadsheet import SpreadsheetRepository
+from infrastructure.spreadsheet.ledger import UsageLedger
+
+
+class RecordingSheet(SpreadsheetRepository):
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.batches: List[List[str]] = []
+
+    async def get_spreadsheet_data_by_slack_id(self, user_id: str) -> Optional[SpreadsheetData]:
+        return None
+
+    async def update_spreadsheet(self, update: SpreadsheetData) -> None:
+        await self.update_spreadsheet_batch([update])
+
+    async def update_spreadsheet_batch(self, updates: List[SpreadsheetData]) -> None:
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("Sheets API error")
+        self.batches.append([update.user_id for update in updates])
+
+
+async def test_threshold_wakes_the_single_flusher_without_spawning_tasks():
+    sheet = RecordingSheet(delay=0.05)
+    ledger = UsageLedger(sheet, flush_interval=60.0, max_pending=2)
+    await ledger.start()
+    tasks_before = len(asyncio.all_tasks())
+    for i in range(10):
+        await ledger.update_spreadsheet(SpreadsheetData.create_new(f"U{i}"))
+    assert len(asyncio.all_tasks()) == tasks_before
+    await asyncio.sleep(0.2)
+    await ledger.close()
+    assert sorted(user_id for batch in sheet.batches for user_id in batch) == [f"U{i}" for i in range(10)]
+
+
+async def test_failed_flush_keeps_records_and_the_flusher_alive(caplog):
+    sheet = RecordingSheet(fail=True)
+    ledger = UsageLedger(sheet, flush_interval=0.01, max_pending=100)
+    await ledger.start()
+    await ledger.update_spreadsheet(SpreadsheetData.create_new("U1"))
+    await asyncio.sleep(0.05)
+    assert "U1" in ledger.pending
+    assert "Failed to flush usage records" in caplog.text
+
+    sheet.fail = False
+    await asyncio.sleep(0.05)
+    assert not ledger.pending
+    assert sheet.batches[-1] == ["U1"]
+    await ledger.close()
+
+
+async def test_pending_records_are_visible_before_flush():
+    ledger = UsageLedger(RecordingSheet(), flush_interval=60.0)
+    data = SpreadsheetData.create_new("U1")
+    data.total_usage = 3
+    await ledger.update_spreadsheet(data)
+    assert (await ledger.get_spreadsheet_data_by_slack_id("U1")).total_usage == 3
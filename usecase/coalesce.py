@@ -0,0 +1,56 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    def __init__(self):
+        """
+        同じキーの処理が実行中であれば、その結果を共有する
+        """
+        self.in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self.in_flight.get(key)
+        if future is not None:
+            logger.info("Joined in-flight request.")
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(func())
+        self.in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                self.in_flight.pop(key, None)
+            else:
+                # 呼び出し元がキャンセルされても、待っている他の呼び出し元のために完了まで保持する
+                future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+
+
+class Debouncer:
+    def __init__(self, window: float):
+        """
+        同じキーの要求を一定時間まとめ、最初の呼び出し元にのみ全要求を渡す
+        """
+        self.window = window
+        self.pending: Dict[Hashable, List[Any]] = {}
+
+    async def debounce(self, key: Hashable, item: Any) -> Optional[List[Any]]:
+        """
+        最初の呼び出し元はwindow秒待ってからまとめた要求のリストを受け取り、
+        それ以降の呼び出し元はNoneを受け取る
+        """
+        items = self.pending.get(key)
+        if items is not None:
+            items.append(item)
+            return None
+
+        items = [item]
+        self.pending[key] = items
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self.pending.pop(key, None)
+        return items
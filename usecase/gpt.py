@@ -1,16 +1,51 @@
+from contextlib import aclosing
+from typing import AsyncIterator, Optional
 from domain.repository.gpt import GptRepository
+from domain.repository.cache import ResponseCacheRepository
+from domain.model.gpt import estimate_tokens, normalize_prompt
+from domain.model.priority import priority_for, request_priority
+from usecase.coalesce import SingleFlight
 import logging
 
 logger = logging.getLogger(__name__)
 
 class GptUsecase:
-    def __init__(self, gpt_repository: GptRepository):
+    def __init__(self, gpt_repository: GptRepository, response_cache: Optional[ResponseCacheRepository] = None):
         self.gpt_repository = gpt_repository
+        self.response_cache = response_cache
+        self.single_flight = SingleFlight()
 
-    async def generate_text(self, prompt: str) -> str:
+    async def generate_text(self, prompt: str, cache_control: Optional[str] = None) -> str:
+        """
+        テキストを生成（cache_controlに"no-cache"で再取得、"no-store"でキャッシュを使わない）
+        """
+        request_priority.set(priority_for(None, estimate_tokens(prompt)))
+        directives = {d.strip().lower() for d in (cache_control or "").split(",")}
+        use_cache = self.response_cache is not None and "no-store" not in directives
         try:
-            res = await self.gpt_repository.create_completion(prompt)
-            return res.choices[0].message.content.strip()
+            if use_cache and "no-cache" not in directives:
+                cached = await self.response_cache.get(prompt)
+                if cached is not None:
+                    return cached
+
+            # 同じプロンプトが実行中であれば結果を共有
+            res = await self.single_flight.do(
+                normalize_prompt(prompt),
+                lambda: self.gpt_repository.create_completion(prompt),
+            )
+            text = res.choices[0].message.content.strip()
+            if use_cache:
+                await self.response_cache.set(prompt, text)
+            return text
         except Exception as e:
             logger.error(f"Failed self.gpt_repository.create_completion: {e}")
             return None
+
+    async def generate_text_stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        生成されたテキストを差分ごとに返す
+        """
+        async with aclosing(self.gpt_repository.create_completion_stream(prompt)) as stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
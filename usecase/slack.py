@@ -2,73 +2,252 @@ from domain.repository.gpt import GptRepository
 from domain.repository.slack import SlackRepository
 from domain.model.slack import SlackMessages
 from domain.repository.spreadsheet import SpreadsheetRepository
-from domain.model.spreadsheet import SpreadsheetData
+from domain.repository.shared_state import SharedStateRepository
+from domain.model.gpt import CHARACTER_SETTINGS, ESTIMATED_COMPLETION_TOKENS, Prompt, estimate_prompt_tokens, estimate_tokens
+from domain.model.priority import priority_for, request_priority
+from usecase.usage import UsageAccountant
+from usecase.coalesce import Debouncer
+from infrastructure.metrics.metrics import SLACK_STAGE_SECONDS
+from infrastructure.tracing.tracing import set_attributes, span
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from contextlib import aclosing, contextmanager
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """応答処理の段階ごとに所要時間のメトリクスとスパンを記録"""
+    with SLACK_STAGE_SECONDS.labels(stage=name).time(), span(f"SlackUsecase.{name}"):
+        yield
+
+
 class SlackUsecase:
     def __init__(
             self,
             slack_repository: SlackRepository,
             gpt_repository: GptRepository,
-            spreadsheet_repository: SpreadsheetRepository
+            spreadsheet_repository: SpreadsheetRepository,
+            shared_state: SharedStateRepository,
+            usage_lock_timeout: float = 30.0,
+            stream_replies: bool = False,
+            stream_update_interval: float = 1.0,
+            debounce_window: float = 0.0,
     ):
         self.gpt_repository = gpt_repository
         self.slack_repository = slack_repository
         self.spreadsheet_repository = spreadsheet_repository
+        self.usage_accountant = UsageAccountant(spreadsheet_repository, shared_state, lock_timeout=usage_lock_timeout)
+        self.stream_replies = stream_replies
+        self.stream_update_interval = stream_update_interval
+        self.debouncer = Debouncer(debounce_window) if debounce_window > 0 else None
+
+    async def process_messages(
+            self,
+            channel_id: str,
+            timestamp: str,
+            user_id: str,
+            team_id: Optional[str] = None,
+            bot_user_id: Optional[str] = None,
+            message_ts: Optional[str] = None,
+            text: Optional[str] = None,
+            channel_type: Optional[str] = None,
+    ) -> None:
+        """
+        スレッドへのメンションを処理
+        同じスレッドへのメンションが一定時間内に続いた場合は1回の応答にまとめる
+        """
+        # DMと短いメッセージの外部API呼び出しを優先
+        request_priority.set(priority_for(channel_type, estimate_tokens(text or "")))
+        event = {
+            "user_id": user_id,
+            "team_id": team_id,
+            "bot_user_id": bot_user_id,
+            "latest_message": {"ts": message_ts, "text": text, "user": user_id} if message_ts else None,
+        }
+        if not self.debouncer:
+            return await self._process_thread(channel_id, timestamp, [event])
 
-    async def process_messages(self, channel_id: str, timestamp: str, user_id: str) -> None:
+        events = await self.debouncer.debounce((channel_id, timestamp), event)
+        if events is None:
+            logger.info(f"Merged mention into pending reply for thread {channel_id}/{timestamp}.")
+            return
+        await self._process_thread(channel_id, timestamp, events)
+
+    async def _process_thread(self, channel_id: str, timestamp: str, events: List[Dict[str, Any]]) -> None:
+        """
+        スレッドの最新の状態に対して応答
+        まとめたメンションの使用量は、利用制限内のユーザーのうち最後にメンションしたユーザーに計上する
+        """
+        team_id = events[-1]["team_id"]
+        bot_user_id = next((event["bot_user_id"] for event in reversed(events) if event["bot_user_id"]), None)
+        latest_messages = [event["latest_message"] for event in events if event["latest_message"]]
+        set_attributes(channel=channel_id, thread_ts=timestamp, merged_events=len(events))
         try:
-            # BotのユーザーIDを取得
-            bot_user_id = await self.slack_repository.get_bot_user_id()
+            # BotのユーザーIDを取得（イベントに含まれていればキャッシュに登録）
+            with stage("bot_id_lookup"):
+                if bot_user_id:
+                    self.slack_repository.remember_bot_user_id(team_id, bot_user_id)
+                else:
+                    bot_user_id = await self.slack_repository.get_bot_user_id(team_id)
             if not bot_user_id:
                 logger.error("Bot user ID not found.")
                 return
 
-            # スプレッドシートからデータを取得
-            spreadsheet_data = await self.spreadsheet_repository.get_spreadsheet_data_by_slack_id(user_id)
-            if not spreadsheet_data:
-                # データがない場合は新しいデータを作成
-                spreadsheet_data = SpreadsheetData.create_new(user_id)
-
-            # 日付が変わったらトークン使用量をリセット
-            spreadsheet_data.reset_daily_usage_if_needed()
+            # Slackスレッド内の過去のメッセージを取得
+            with stage("history_fetch"):
+                messages = await self.slack_repository.load_conversation_replies(channel_id, timestamp, latest_messages)
+            if not messages:
+                logger.error(f"No messages found for channel {channel_id} at timestamp {timestamp}.")
+                return
 
+            # Slackメッセージをモデルに変換
+            slack_messages = SlackMessages(messages=messages)
             try:
-                spreadsheet_data.can_use_daily_tokens()
+                with stage("prompt_build"):
+                    gpt_prompt = slack_messages.create_messages(bot_user_id)
             except ValueError:
+                too_long_message = "メッセージが長すぎます。短くして再度お試しください。"
+                await self.slack_repository.create_new_message(channel_id, timestamp, too_long_message)
+                return
+
+            prompt_tokens = estimate_prompt_tokens(gpt_prompt)
+            set_attributes(messages=len(gpt_prompt), prompt_tokens=prompt_tokens)
+            logger.info(f"Processing {len(gpt_prompt)} messages ({prompt_tokens} tokens).")
+
+            # 見積もりトークン数を予約（日付が変わっていれば使用量をリセット）
+            with stage("sheets_read"):
+                reservation = await self._reserve_for_any(
+                    [event["user_id"] for event in events],
+                    estimate_prompt_tokens(CHARACTER_SETTINGS) + prompt_tokens + ESTIMATED_COMPLETION_TOKENS,
+                )
+            if reservation is None:
                 limit_message = "本日の利用制限を超えました。明日以降に再度お試しください。"
                 await self.slack_repository.create_new_message(channel_id, timestamp, limit_message)
                 return
+            user_id, reserved_tokens = reservation
 
-            # Slackスレッド内の過去のメッセージを取得
-            messages = await self.slack_repository.load_conversation_replies(channel_id, timestamp)
-            if not messages:
-                logger.error(f"No messages found for channel {channel_id} at timestamp {timestamp}.")
-                return
+            usage = None
+            try:
+                # GPTの応答をSlackに送信
+                if self.stream_replies:
+                    usage = await self._reply_streaming(channel_id, timestamp, gpt_prompt)
+                else:
+                    usage = await self._reply(channel_id, timestamp, gpt_prompt)
+            finally:
+                # 予約を実際の使用量で精算
+                with stage("sheets_write"):
+                    if usage:
+                        self._log_usage(usage)
+                        await self.usage_accountant.reconcile(user_id, reserved_tokens, usage.total_tokens)
+                    else:
+                        await self.usage_accountant.release(user_id, reserved_tokens)
 
-            # Slackメッセージをモデルに変換
-            slack_messages = SlackMessages(messages=messages)
-            gpt_prompt = slack_messages.create_prompt(bot_user_id)
+        except Exception as e:
+            logger.error(f"Failed to process messages: {e}")
+            raise
 
-            logger.info(f"Processing messages: {gpt_prompt}")
+    async def _reserve_for_any(self, user_ids: List[str], estimated_tokens: int) -> Optional[Tuple[str, int]]:
+        """
+        最後にメンションしたユーザーから順に予約を試み、予約できたユーザーと予約量を返す
+        （まとめたメンションの1人が制限を超えていても、他のユーザーの分として応答する）
+        """
+        for user_id in dict.fromkeys(reversed(user_ids)):
+            try:
+                return user_id, await self.usage_accountant.reserve(user_id, estimated_tokens)
+            except ValueError:
+                logger.info(f"User {user_id} exceeded the daily limit.")
+        return None
 
-            # GPTにプロンプトを送信して応答を取得
+    async def _reply(self, channel_id: str, timestamp: str, gpt_prompt: Prompt) -> Optional[Any]:
+        """
+        GPTの応答全体を受け取ってから投稿し、usageを返す
+        """
+        with stage("gpt_call"):
             gpt_response = await self.gpt_repository.create_completion(gpt_prompt)
-            if not gpt_response or not gpt_response.choices:
-                logger.error("GPT response is empty.")
-                gpt_message = "GPTレスポンスが空です。"
-            else:
-                gpt_message = gpt_response.choices[0].message.content.strip()
+        if not gpt_response or not gpt_response.choices:
+            logger.error("GPT response is empty.")
+            gpt_message = "GPTレスポンスが空です。"
+        else:
+            gpt_message = gpt_response.choices[0].message.content.strip()
 
-            # SlackBot（GPT）の応答を送信
+        # SlackBot（GPT）の応答を送信
+        with stage("slack_post"):
             await self.slack_repository.create_new_message(channel_id, timestamp, gpt_message)
+        return getattr(gpt_response, "usage", None)
+
+    async def _reply_streaming(self, channel_id: str, timestamp: str, gpt_prompt: Prompt) -> Optional[Any]:
+        """
+        プレースホルダーを投稿し、GPTの応答をストリームで受け取りながら一定間隔で更新する
+        """
+        with stage("slack_post"):
+            message_ts = await self.slack_repository.create_new_message(channel_id, timestamp, "…")
+        if not message_ts:
+            return await self._reply(channel_id, timestamp, gpt_prompt)
+
+        parts = []
+        usage = None
+        last_text = ""
+        last_update = time.monotonic()
+        # 途中経過の更新は1件ずつバックグラウンドで送り、ストリームの受信を止めない
+        progress: Optional[asyncio.Task] = None
+        # 途中経過の更新を含むストリーム全体の時間
+        with stage("gpt_call"):
+            try:
+                async with aclosing(self.gpt_repository.create_completion_stream(gpt_prompt)) as stream:
+                    async for chunk in stream:
+                        if chunk.usage:
+                            usage = chunk.usage
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            parts.append(chunk.choices[0].delta.content)
+
+                        # Slackのレート制限を超えないよう更新をまとめる
+                        now = time.monotonic()
+                        text = "".join(parts).strip()
+                        if (
+                                text and text != last_text
+                                and now - last_update >= self.stream_update_interval
+                                and (progress is None or progress.done())
+                        ):
+                            progress = asyncio.create_task(self._update_progress(channel_id, message_ts, text + " …"))
+                            last_text = text
+                            last_update = now
+            except Exception as e:
+                logger.error(f"Failed to stream GPT response: {e}")
+            finally:
+                # 最終的な更新より後に途中経過が反映されないよう、送信中の更新を待つ
+                if progress:
+                    await progress
 
-            # 使用量を加算
-            spreadsheet_data.add_token_usage(gpt_response.usage.total_tokens)
-            await self.spreadsheet_repository.update_spreadsheet(spreadsheet_data)
+        gpt_message = "".join(parts).strip()
+        if not gpt_message:
+            logger.error("GPT response is empty.")
+            gpt_message = "GPTレスポンスが空です。"
+        with stage("slack_post"):
+            await self.slack_repository.update_message(channel_id, message_ts, gpt_message, thread_ts=timestamp)
+        return usage
 
+    async def _update_progress(self, channel_id: str, message_ts: str, text: str) -> None:
+        """
+        途中経過を表示（レート制限の枠が空いていなければ省略し、失敗しても応答は続ける）
+        """
+        try:
+            if not await self.slack_repository.update_message(channel_id, message_ts, text, best_effort=True):
+                logger.debug(f"Skipped progress update for {channel_id}/{message_ts}: chat.update is rate limited.")
         except Exception as e:
-            logger.error(f"Failed to process messages: {e}")
-            raise
+            logger.warning(f"Failed to update progress message: {e}")
+
+    @staticmethod
+    def _log_usage(usage: Any) -> None:
+        """
+        トークン使用量とプロンプトキャッシュのヒット数を記録
+        """
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        logger.info(
+            f"Token usage: prompt={usage.prompt_tokens}, cached={cached_tokens}, "
+            f"completion={usage.completion_tokens}, total={usage.total_tokens}"
+        )
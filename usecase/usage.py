@@ -0,0 +1,90 @@
+import json
+from typing import Optional
+from domain.repository.shared_state import SharedStateRepository
+from domain.repository.spreadsheet import SpreadsheetRepository
+from domain.model.spreadsheet import SpreadsheetData
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 予約を保持したままプロセスが落ちた場合に、予約が残り続けないための有効期限（秒）
+RESERVATION_TTL = 600.0
+
+class UsageAccountant:
+    def __init__(
+            self,
+            spreadsheet_repository: SpreadsheetRepository,
+            shared_state: SharedStateRepository,
+            lock_timeout: float = 30.0,
+            record_ttl: float = 300.0,
+    ):
+        """
+        ユーザーごとのトークン使用量を排他制御しながら予約・精算する
+        ロック・予約中のトークン数・最新の使用量は共有状態に置き、複数のプロセスから同じ値を参照する
+        """
+        self.spreadsheet_repository = spreadsheet_repository
+        self.shared_state = shared_state
+        self.lock_timeout = lock_timeout
+        self.record_ttl = record_ttl
+
+    async def reserve(self, user_id: str, estimated_tokens: int) -> int:
+        """
+        見積もりトークン数を予約。制限を超える場合はValueErrorを送出
+        """
+        async with self.shared_state.lock(f"usage:{user_id}", self.lock_timeout):
+            spreadsheet_data = await self._load(user_id)
+            reserved = int(await self.shared_state.get(f"usage:reserved:{user_id}") or 0)
+            spreadsheet_data.can_use_daily_tokens(reserved + estimated_tokens)
+            await self.shared_state.incr(f"usage:reserved:{user_id}", estimated_tokens, RESERVATION_TTL)
+            return estimated_tokens
+
+    async def reconcile(self, user_id: str, reserved_tokens: int, actual_tokens: int) -> None:
+        """
+        予約を解放し、実際のトークン使用量を加算して保存
+        """
+        async with self.shared_state.lock(f"usage:{user_id}", self.lock_timeout):
+            await self._release(user_id, reserved_tokens)
+            # 保存先が加算に対応していれば、保存先の値に直接加算する（他のプロセスの書き込みを上書きしない）
+            spreadsheet_data = await self.spreadsheet_repository.add_token_usage(user_id, actual_tokens)
+            if spreadsheet_data is None:
+                spreadsheet_data = await self._load(user_id)
+                spreadsheet_data.add_token_usage(actual_tokens)
+                await self.spreadsheet_repository.update_spreadsheet(spreadsheet_data)
+            await self._store(spreadsheet_data)
+
+    async def release(self, user_id: str, reserved_tokens: int) -> None:
+        """
+        使用量を加算せずに予約を解放
+        """
+        async with self.shared_state.lock(f"usage:{user_id}", self.lock_timeout):
+            await self._release(user_id, reserved_tokens)
+
+    async def _release(self, user_id: str, reserved_tokens: int) -> None:
+        remaining = await self.shared_state.incr(f"usage:reserved:{user_id}", -reserved_tokens, RESERVATION_TTL)
+        if remaining <= 0:
+            await self.shared_state.delete(f"usage:reserved:{user_id}")
+
+    async def _load(self, user_id: str) -> SpreadsheetData:
+        """
+        使用量を取得し、日付が変わっていればリセット
+        他のプロセスが精算した直後でも正しい値を使うため、共有状態にある最新の値を優先する
+        """
+        spreadsheet_data = await self._load_shared(user_id)
+        if not spreadsheet_data:
+            spreadsheet_data = await self.spreadsheet_repository.get_spreadsheet_data_by_slack_id(user_id)
+        if not spreadsheet_data:
+            # データがない場合は新しいデータを作成
+            spreadsheet_data = SpreadsheetData.create_new(user_id)
+        spreadsheet_data.reset_daily_usage_if_needed()
+        return spreadsheet_data
+
+    async def _load_shared(self, user_id: str) -> Optional[SpreadsheetData]:
+        cached = await self.shared_state.get(f"usage:record:{user_id}")
+        return SpreadsheetData.construct(**json.loads(cached)) if cached else None
+
+    async def _store(self, spreadsheet_data: SpreadsheetData) -> None:
+        await self.shared_state.set(
+            f"usage:record:{spreadsheet_data.user_id}",
+            json.dumps(spreadsheet_data.dict()),
+            self.record_ttl,
+        )